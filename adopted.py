@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from itertools import compress
+
+from sqlalchemy import func, select
+
+from log_config import log_event
+from utils import CustomerAdoptions, db
+
+"""The pet ids in customer_adoptions, kept in memory so search results can leave out pets that are already
+adopted without asking the database about each one.
+
+The ids are bits in a bytearray, one bit per possible pet id: Petfinder ids run to about 75 million, so that
+is about 10 MiB per worker whatever the number of adoptions (a set of a million ints is around 60 MiB), and a
+lookup is an index and a shift. The bitmap stops at ADOPTED_MAX_BITMAP_ID (16 MiB) and the odd id above it
+goes in a set, so an adoption of a huge pet id cannot grow every worker's bitmap. A background thread, started
+by the first request a process serves, loads every id and then every ADOPTED_REFRESH_INTERVAL seconds reads only the adoptions with a
+recent CreatedAt, which picks up the ones saved by other workers and by bulk imports. This worker's own adoptions are added as soon as they are saved.
+Until the first load has worked nothing is filtered - customer_adopt still refuses a second adoption.
+"""
+
+ADOPTED_REFRESH_INTERVAL = int(os.getenv('ADOPTED_REFRESH_INTERVAL', '30'))
+# everything is read again now and then, for adoptions saved without a CreatedAt
+ADOPTED_FULL_INTERVAL = int(os.getenv('ADOPTED_FULL_INTERVAL', '3600'))
+# an adoption is stamped when it is inserted but only seen once committed, so each refresh goes back this far
+ADOPTED_REFRESH_OVERLAP = timedelta(seconds=int(os.getenv('ADOPTED_REFRESH_OVERLAP', '60')))
+# rows read from the database at a time while loading
+LOAD_BATCH_SIZE = 10000
+# the highest id kept in the bitmap, higher ones go in AdoptedPets.overflow
+ADOPTED_MAX_BITMAP_ID = int(os.getenv('ADOPTED_MAX_BITMAP_ID', str(2 ** 27 - 1)))
+
+logger = logging.getLogger(__name__)
+
+
+class AdoptedPets:
+    def __init__(self, interval=ADOPTED_REFRESH_INTERVAL, full_interval=ADOPTED_FULL_INTERVAL,
+                 max_bitmap_id=ADOPTED_MAX_BITMAP_ID):
+        self.interval = interval
+        self.full_interval = full_interval
+        self.max_bitmap_id = max_bitmap_id
+        self.bits = bytearray()
+        self.overflow = set()
+        self.count = 0
+        self.loaded = False
+        # newest CreatedAt read so far, the next refresh starts from there
+        self.since = None
+        self.last_full_load = None
+        # readers go without it: a bytearray is only replaced by a larger one, never shrunk, and the
+        # overflow set is only added to
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __contains__(self, pet_id):
+        bits = self.bits
+        return (pet_id >> 3 < len(bits) and bool(bits[pet_id >> 3] >> (pet_id & 7) & 1)) or pet_id in self.overflow
+
+    def __len__(self):
+        return self.count
+
+    """Marking pets as adopted - ids that are not numbers are ignored"""
+
+    def update(self, pet_ids):
+        pet_ids = [pet_id if isinstance(pet_id, int) else int(pet_id) for pet_id in pet_ids
+                   if isinstance(pet_id, int) or (str(pet_id).isascii() and str(pet_id).isdigit())]
+        if not pet_ids:
+            return
+        with self._lock:
+            added = 0
+            if max(pet_ids) > self.max_bitmap_id:
+                for pet_id in pet_ids:
+                    if pet_id > self.max_bitmap_id and pet_id not in self.overflow:
+                        self.overflow.add(pet_id)
+                        added += 1
+                pet_ids = [pet_id for pet_id in pet_ids if pet_id <= self.max_bitmap_id] or [0]
+            bits = self.bits
+            needed = (max(pet_ids) >> 3) + 1
+            if needed > len(bits):
+                # a quarter more than needed, as newer pets have higher ids - up to the largest bitmap
+                size = min(needed + needed // 4, (self.max_bitmap_id >> 3) + 1)
+                bits = self.bits = bits + bytes(size - len(bits))
+            for pet_id in pet_ids:
+                mask = 1 << (pet_id & 7)
+                if not bits[pet_id >> 3] & mask:
+                    bits[pet_id >> 3] |= mask
+                    added += 1
+            self.count += added
+
+    def add(self, pet_id):
+        self.update((pet_id,))
+
+    """Search results without the pets already adopted - all of them until the ids have been loaded"""
+
+    def exclude(self, animals):
+        if not self.loaded:
+            return animals
+        bits = self.bits
+        size = len(bits)
+        overflow = self.overflow
+        # the lookup of __contains__ written out, it runs for every animal of the search
+        return list(compress(animals, [not ((pet_id >> 3 < size and bits[pet_id >> 3] >> (pet_id & 7) & 1)
+                                            or pet_id in overflow)
+                                       for pet_id in [animal['id'] for animal in animals]]))
+
+    """Reading the adoptions saved since the last refresh (all of them when a full load is due), within an
+    app context - returns the number of rows read"""
+
+    def refresh(self):
+        full = self.last_full_load is None or time.time() - self.last_full_load >= self.full_interval
+        query = select(CustomerAdoptions.pet_id)
+        if not full and self.since is not None:
+            query = query.where(CustomerAdoptions.created_at >= self.since - ADOPTED_REFRESH_OVERLAP)
+        # taken first (from the index), so an adoption saved while the rows are read is read again next time
+        since = db.session.execute(select(func.max(CustomerAdoptions.created_at))).scalar()
+        rows = 0
+        # through the connection rather than the ORM, which takes several times as long over a million rows
+        result = db.session.connection().execute(query.execution_options(yield_per=LOAD_BATCH_SIZE))
+        for batch in result.scalars().partitions():
+            self.update(batch)
+            rows += len(batch)
+        self.since = since or self.since
+        if full:
+            self.last_full_load = time.time()
+            log_event(logger, logging.INFO, 'adopted_pets_loaded', adopted=self.count)
+        self.loaded = True
+        return rows
+
+    """Starting the background thread that loads and refreshes the ids for the app - nothing to do when this
+    process's thread is already running"""
+
+    def start(self, app):
+        with self._lock:
+            # a thread started before a fork is not running in the child
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, args=(app,), name='adopted-pets', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.refresh()
+            except Exception as error:
+                # the ids read so far are kept, the next refresh tries again
+                log_event(logger, logging.WARNING, 'adopted_pets_refresh_failed', error=error)
+            self._stop.wait(self.interval)
@@ -2,7 +2,7 @@ CREATE DATABASE adoption;
 USE adoption;
 
 CREATE TABLE customers (
-    id   VARCHAR(255) NOT NULL PRIMARY KEY,
+    id   BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
     firstname   VARCHAR(255),
     lastname    VARCHAR(255),
     phone 	VARCHAR(25),
@@ -16,8 +16,14 @@ CREATE TABLE customers (
 
 CREATE TABLE customer_adoptions(
     pet_id INT NOT NULL PRIMARY KEY,
-    customer_id VARCHAR(255),
+    customer_id BIGINT,
     CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
-
+-- newest first listing on /admin, name/email prefix search, and one customer per email
+CREATE INDEX customers_created_at ON customers (CreatedAt, id);
+CREATE UNIQUE INDEX customers_email ON customers (email);
+CREATE INDEX customers_lastname ON customers (lastname);
+CREATE INDEX customers_firstname ON customers (firstname);
+-- adoptions saved since the last look, for the adopted pets filter on /adopt
+CREATE INDEX customer_adoptions_created_at ON customer_adoptions (CreatedAt);
@@ -0,0 +1,207 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+
+from log_config import log_event
+
+try:
+    import brotli
+except ImportError:
+    # optional, without it only gzip copies are made
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    # optional (Pillow), without it images are copied as they are
+    Image = None
+
+"""Build step for static/: fingerprinted copies, pre-compressed copies and smaller image versions.
+
+Every file under static/ is copied to ASSETS_DIR with a hash of its content in the name, so its url changes
+whenever the file does and browsers can keep it for a year. Text files get .gz (and, with the brotli
+package, .br) copies next to them, picked by the /assets view from the request's Accept-Encoding. With
+Pillow, images also get narrower versions (IMAGE_WIDTHS, only those smaller than the image) and WebP
+versions of each. manifest.json maps each static/ path to its copies; asset_url() in the templates reads
+it, and falls back to the plain /static url for a file the build has not seen.
+
+Run from the project folder after changing static/ (and as part of a deployment):
+    python assets.py build
+"""
+
+ASSETS_DIR = os.getenv('ASSETS_DIR', 'build/assets')
+IMAGE_WIDTHS = (480, 960)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.json', '.txt', '.map')
+IMAGES = ('.png', '.jpg', '.jpeg')
+# a compressed copy that saves less than this is not worth a second file
+MIN_SAVING = 0.1
+MANIFEST = 'manifest.json'
+# Content-Encoding -> file extension of the copy
+ENCODINGS = {'br': 'br', 'gzip': 'gz'}
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprinted(path, content):
+    root, extension = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+
+def write(folder, path, content):
+    target = os.path.join(folder, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as file:
+        file.write(content)
+
+
+"""The .gz and .br copies worth keeping - encoding -> compressed content"""
+
+
+def compressed(content):
+    copies = {}
+    # mtime=0 keeps the output, and so each build, the same for the same file
+    copies['gzip'] = gzip.compress(content, compresslevel=9, mtime=0)
+    if brotli is not None:
+        copies['br'] = brotli.compress(content, quality=11)
+    return {encoding: data for encoding, data in copies.items() if len(data) <= len(content) * (1 - MIN_SAVING)}
+
+
+"""Narrower and WebP versions of one image - returns the image's width and the variants, a dict of variant
+name ('480w', 'webp', '480w.webp') -> (end of the file name, content)"""
+
+
+def image_variants(content, extension):
+    if Image is None:
+        return None, {}
+    variants = {}
+    with Image.open(io.BytesIO(content)) as image:
+        image.load()
+        variants['webp'] = ('.webp', encode_image(image, 'WEBP'))
+        for width in IMAGE_WIDTHS:
+            if width >= image.width:
+                continue
+            resized = image.resize((width, round(image.height * width / image.width)))
+            variants[f'{width}w'] = (f'-{width}w{extension}', encode_image(resized, image.format))
+            variants[f'{width}w.webp'] = (f'-{width}w.webp', encode_image(resized, 'WEBP'))
+        return image.width, variants
+
+
+def encode_image(image, image_format):
+    output = io.BytesIO()
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(output, image_format, **({'quality': 80} if image_format in ('JPEG', 'WEBP') else {'optimize': True}))
+    return output.getvalue()
+
+
+"""Building ASSETS_DIR from the static folder - returns the manifest, which is also written to the folder"""
+
+
+def build(static_folder='static', folder=ASSETS_DIR):
+    # files of earlier builds are left in place: pages rendered before a deployment still link to them
+    files = {}
+    for directory, _, names in os.walk(static_folder):
+        for name in sorted(names):
+            # .DS_Store and the like
+            if name.startswith('.'):
+                continue
+            source = os.path.join(directory, name)
+            path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as file:
+                content = file.read()
+            files[path] = build_file(folder, path, content)
+    manifest = {'files': files}
+    write(folder, MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    log_event(logger, logging.INFO, 'assets_built', folder=folder, files=len(files))
+    return manifest
+
+
+def build_file(folder, path, content):
+    entry = {'file': fingerprinted(path, content), 'encodings': {}, 'variants': {}}
+    write(folder, entry['file'], content)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in COMPRESSIBLE:
+        for encoding, data in compressed(content).items():
+            entry['encodings'][encoding] = f'{entry["file"]}.{ENCODINGS[encoding]}'
+            write(folder, entry['encodings'][encoding], data)
+    if extension in IMAGES:
+        root = os.path.splitext(path)[0]
+        width, variants = image_variants(content, extension)
+        if width:
+            # for the srcset of the full size image
+            entry['width'] = width
+        for name, (ending, data) in variants.items():
+            entry['variants'][name] = fingerprinted(root + ending, data)
+            write(folder, entry['variants'][name], data)
+    return entry
+
+
+class Assets:
+    def __init__(self, folder, manifest):
+        self.folder = folder
+        self.files = manifest['files']
+        # fingerprinted file -> the encodings it has copies for
+        self.encodings = {entry['file']: entry['encodings'] for entry in self.files.values()}
+
+    """The built assets in folder, or None when the build has not been run"""
+
+    @classmethod
+    def load(cls, folder=ASSETS_DIR):
+        try:
+            with open(os.path.join(folder, MANIFEST)) as file:
+                return cls(folder, json.load(file))
+        except FileNotFoundError:
+            return None
+
+    """The fingerprinted file for a static/ path, or one of its variants ('480w', 'webp', '480w.webp') -
+    None when there is no such file or variant"""
+
+    def file(self, path, variant=None):
+        entry = self.files.get(path)
+        if entry is None:
+            return None
+        return entry['variants'].get(variant) if variant else entry['file']
+
+    """srcset candidates of an image, narrowest first - (width, file) for the smaller versions and the full size
+one, WebP versions with webp. Empty when the build made no smaller versions"""
+
+    def srcset(self, path, webp=False):
+        entry = self.files.get(path)
+        if entry is None or 'width' not in entry:
+            return []
+        # variant names are '480w' and '480w.webp'
+        ending = 'w.webp' if webp else 'w'
+        candidates = sorted((int(name[:-len(ending)]), file) for name, file in entry['variants'].items()
+                            if name.endswith(ending) and name[:-len(ending)].isdigit())
+        full = entry['variants'].get('webp') if webp else entry['file']
+        return candidates + [(entry['width'], full)] if candidates and full else []
+
+    """The copy to send for the request's Accept-Encoding - (file, encoding), encoding None for the file itself"""
+
+    def negotiate(self, file, accept_encodings):
+        available = self.encodings.get(file, {})
+        for encoding in ('br', 'gzip'):
+            if encoding in available and accept_encodings[encoding]:
+                return available[encoding], encoding
+        return file, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fingerprint, compress and resize the files in static/')
+    parser.add_argument('command', choices=('build',))
+    parser.add_argument('--static-folder', default='static')
+    parser.add_argument('--output', default=ASSETS_DIR, help=f'folder for the built files (default {ASSETS_DIR})')
+    args = parser.parse_args(argv)
+    manifest = build(args.static_folder, args.output)
+    print(f'{len(manifest["files"])} files built into {args.output}'
+          f'{"" if brotli else ", no brotli copies (pip install brotli)"}'
+          f'{"" if Image else ", no image variants (pip install Pillow)"}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
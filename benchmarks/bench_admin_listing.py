@@ -0,0 +1,63 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from utils import CustomerRepository, Customers, db
+
+"""/admin listing on a large customers table (SQLite stand-in): Customers.query.all() vs keyset pages.
+
+Run from the project folder:  python -m benchmarks.bench_admin_listing [rows]   (default 1,000,000)
+"""
+
+BATCH = 50_000
+
+
+def seed(rows):
+    start = datetime(2020, 1, 1)
+    table = Customers.__table__
+    for first in range(0, rows, BATCH):
+        db.session.execute(table.insert(), [
+            {'id': number + 1, 'firstname': f'First{number % 5000}', 'lastname': f'Last{number % 7919}',
+             'phone': '0123456789', 'email': f'customer{number:09d}@example.com', 'address': 'Some street',
+             'city_name': 'Some city', 'state': 'NJ', 'zipcode': '07001',
+             'CreatedAt': start + timedelta(seconds=number)}
+            for number in range(first, min(first + BATCH, rows))])
+    db.session.commit()
+
+
+def timed(label, run):
+    start = time.perf_counter()
+    result = run()
+    print(f'{label:<45} {(time.perf_counter() - start) * 1000:9.1f} ms')
+    return result
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    path = os.path.join(tempfile.mkdtemp(), 'adoption.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        timed(f'seeding {rows} customers', lambda: seed(rows))
+
+        timed('Customers.query.all() (old /admin)', lambda: len(CustomerRepository.get_customers()[0]))
+        page = timed('first page (keyset)', CustomerRepository.get_customers_page)
+        for _ in range(99):
+            page = CustomerRepository.get_customers_page(page.next_cursor)
+        timed('page 101 (keyset, cursor from page 100)', lambda: CustomerRepository.get_customers_page(page.next_cursor))
+        timed('page 101 with OFFSET, for comparison', lambda: db.session.query(Customers.id).order_by(
+            Customers.created_at.desc(), Customers.id.desc()).offset(100 * 50).limit(50).all())
+        timed('email prefix search', lambda: CustomerRepository.get_customers_page(search='customer00012'))
+        timed('name prefix search', lambda: CustomerRepository.get_customers_page(search='Last791'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import logging
+import os
+import random
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import insert, select
+
+from adopted import AdoptedPets
+from records import PetRecord
+from utils import CustomerAdoptions, db
+
+"""Leaving adopted pets out of 100k search results with 1M adopted pet ids, on a SQLite file standing in
+for MySQL: a query per animal (what checking each result against customer_adoptions would cost), a set of
+the ids, and the AdoptedPets bitmap - its load, memory and an incremental refresh with nothing new.
+
+Run from the project folder:  python -m benchmarks.bench_adopted
+"""
+
+ADOPTED = 1_000_000
+RESULTS = 100_000
+# Petfinder ids are up to about this
+HIGHEST_ID = 75_000_000
+# the query per animal is timed on this many and scaled up
+QUERIED = 2_000
+START = datetime(2023, 1, 1)
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(0)
+    adopted_ids = rng.sample(range(1, HIGHEST_ID), ADOPTED)
+    # a tenth of the results are adopted pets
+    result_ids = rng.sample(range(1, HIGHEST_ID), RESULTS - RESULTS // 10) + adopted_ids[:RESULTS // 10]
+    animals = [PetRecord(id=pet_id, name=f'Pet{pet_id}') for pet_id in result_ids]
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "adoption.db")}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for first in range(0, ADOPTED, 10_000):
+            # adopted over the last few years, so a refresh only finds the newest
+            db.session.execute(insert(CustomerAdoptions), [
+                {'pet_id': pet_id, 'customer_id': 1, 'created_at': START + timedelta(minutes=first + number)}
+                for number, pet_id in enumerate(adopted_ids[first:first + 10_000])])
+        db.session.commit()
+        print(f'{ADOPTED} adopted pets, {RESULTS} search results of which {RESULTS // 10} adopted')
+
+        start = time.perf_counter()
+        for animal in animals[:QUERIED]:
+            db.session.execute(select(CustomerAdoptions.pet_id).where(CustomerAdoptions.pet_id == animal['id'])).first()
+        per_animal = (time.perf_counter() - start) / QUERIED
+        print(f'  a query per animal           {per_animal * RESULTS * 1000:10.1f} ms   '
+              f'(timed on {QUERIED}, scaled up)')
+
+        start = time.perf_counter()
+        ids = set(db.session.execute(select(CustomerAdoptions.pet_id)).scalars())
+        load = time.perf_counter() - start
+        del ids
+        # measured again, tracemalloc slows the load down
+        tracemalloc.start()
+        ids = set(db.session.execute(select(CustomerAdoptions.pet_id)).scalars())
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        set_filtered = [animal for animal in animals if animal['id'] not in ids]
+        filtered = min(timeit.repeat(lambda: [animal for animal in animals if animal['id'] not in ids],
+                                     number=1, repeat=5))
+        print(f'  set of ids: filter           {filtered * 1000:10.1f} ms   '
+              f'load {load:.2f} s, {memory / 2 ** 20:.1f} MiB')
+        del ids
+
+        adopted = AdoptedPets()
+        start = time.perf_counter()
+        adopted.refresh()
+        load = time.perf_counter() - start
+        filtered = min(timeit.repeat(lambda: adopted.exclude(animals), number=1, repeat=5))
+        print(f'  AdoptedPets bitmap: filter   {filtered * 1000:10.1f} ms   '
+              f'load {load:.2f} s, {len(adopted.bits) / 2 ** 20:.1f} MiB')
+        assert adopted.exclude(animals) == set_filtered
+
+        # the CreatedAt index keeps the periodic refresh to the recent rows
+        refresh = min(timeit.repeat(adopted.refresh, number=1, repeat=5))
+        print(f'  refresh, nothing new         {refresh * 1000:10.1f} ms')
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from petfinder_stub import PetfinderStub
+
+"""/adopt searches against a slow Petfinder (the stub with 300 ms per call), one gunicorn process, more and
+more users at once: the blocking views from before vs the Petfinder calls on the event loop.
+
+The blocking views are run from a git worktree of SYNC_COMMIT. Each search misses the search cache (it only
+keeps one entry here and the searches rotate), so every request waits on the stub.
+Run from the project folder:  python -m benchmarks.bench_async_load
+"""
+
+SYNC_COMMIT = 'e09b074'
+PORT = 5078
+THREADS = 64
+SEARCHES = ['search:dog:large:00000', 'search:cat:small:00000', 'search:dog:small:00000',
+            'search:cat:large:00000', 'search:dog:medium:00000', 'search:cat:medium:00000']
+
+# loaded by gunicorn from a temporary folder, with whichever tree is being measured on the path
+FACTORY = '''
+from app import create_app
+from search_cache import SearchCache
+from shared_store import LRUStore
+
+
+def uncached_app():
+    app = create_app()
+    app.extensions['animal_repository'].search_cache = SearchCache(LRUStore(1))
+    return app
+'''
+
+
+def serve_stub(queue, stop):
+    with PetfinderStub(animal_count=600, latency=0.3) as stub:
+        queue.put(stub.url)
+        stop.wait()
+
+
+def wait_until_up(base):
+    for _ in range(200):
+        try:
+            if requests.get(base + '/', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f'server at {base} did not start')
+
+
+def load(base, clients, rounds=3):
+    def one(number):
+        start = time.perf_counter()
+        response = requests.get(f'{base}/adopt?search={SEARCHES[number % len(SEARCHES)]}', timeout=120)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    total = clients * rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        latencies = sorted(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+    return total / wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def measure(label, tree, env, factory_folder):
+    env = dict(env, PYTHONPATH=os.pathsep.join([factory_folder, tree]))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(tree, 'gunicorn.conf.py'),
+                               'uncached_app:uncached_app()'], cwd=tree, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{PORT}'
+        wait_until_up(base)
+        for clients in (1, 8, 32, 64):
+            rate, p50, p99 = load(base, clients)
+            print(f'{label:<16} {clients:>3} users {rate:7.1f} searches/s   p50 {p50 * 1000:7.0f} ms   '
+                  f'p99 {p99 * 1000:7.0f} ms')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    queue, stop = multiprocessing.Queue(), multiprocessing.Event()
+    stub = multiprocessing.Process(target=serve_stub, args=(queue, stop), daemon=True)
+    stub.start()
+    factory_folder = tempfile.mkdtemp()
+    with open(os.path.join(factory_folder, 'uncached_app.py'), 'w') as file:
+        file.write(FACTORY)
+    sync_tree = os.path.join(tempfile.mkdtemp(), 'sync')
+    subprocess.run(['git', 'worktree', 'add', '--detach', sync_tree, SYNC_COMMIT], check=True,
+                   capture_output=True)
+    try:
+        # no rate limit against the stub, the benchmark makes more calls than a day's budget
+        env = dict(os.environ, PETFINDER_API_URL=queue.get(timeout=60), DATABASE_URL='sqlite://',
+                   BIND=f'127.0.0.1:{PORT}', WEB_CONCURRENCY='1', WEB_THREADS=str(THREADS),
+                   PETFINDER_RATE_LIMIT='1000000', PETFINDER_DAILY_LIMIT='0')
+        print(f'one gunicorn process with {THREADS} threads, Petfinder calls take 300 ms')
+        measure('blocking views', sync_tree, env, factory_folder)
+        measure('event loop', os.getcwd(), env, factory_folder)
+    finally:
+        subprocess.run(['git', 'worktree', 'remove', '--force', sync_tree], capture_output=True)
+        stop.set()
+        stub.join()
+
+
+if __name__ == '__main__':
+    main()
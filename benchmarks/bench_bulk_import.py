@@ -0,0 +1,68 @@
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+import bulk
+from utils import CustomerRepository, Customer, db
+
+"""Rows per second loading partner shelter adoptions (SQLite stand-in): one customer_adopt per row, as the
+/customer form does, vs bulk.import_rows at a few batch sizes, plus the streaming export.
+
+Run from the project folder:  python -m benchmarks.bench_bulk_import [rows]   (default 100,000)
+"""
+
+
+def make_rows(rows):
+    # about three adoptions per customer
+    return ({'email': f'customer{number // 3}@example.com', 'firstname': f'First{number}', 'lastname': 'Last',
+             'phone': '0123456789', 'address': 'Some street', 'city_name': 'Some city', 'state': 'NJ',
+             'zipcode': '07001', 'pet_id': str(number)} for number in range(rows))
+
+
+def fresh_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def report(label, rows, seconds):
+    print(f'{label:<40} {rows:>8} rows {seconds:8.2f} s {rows / seconds:>10.0f} rows/s')
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    path = os.path.join(tempfile.mkdtemp(), 'adoption.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        # the row at a time path is slow, a small sample is enough to get its rate
+        fresh_database()
+        sample = min(rows, 5_000)
+        start = time.perf_counter()
+        for number, row in enumerate(make_rows(sample)):
+            customer = Customer(None, row['firstname'], row['lastname'], row['phone'], row['email'],
+                                row['address'], row['city_name'], row['state'], row['zipcode'])
+            CustomerRepository.customer_adopt(customer, int(row['pet_id']))
+        report('customer_adopt per row', sample, time.perf_counter() - start)
+
+        for batch_size in (100, 1_000, 10_000):
+            fresh_database()
+            start = time.perf_counter()
+            bulk.import_rows(make_rows(rows), batch_size=batch_size)
+            report(f'import_rows, batch size {batch_size}', rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        output = io.StringIO()
+        bulk.write_rows(bulk.export_rows(), output, 'csv')
+        report('export_rows to csv', rows, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
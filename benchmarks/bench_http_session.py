@@ -0,0 +1,36 @@
+import logging
+import time
+
+import requests
+
+from http_client import make_session
+from petfinder_stub import PetfinderStub
+
+"""New connection per call (module-level requests.get) vs the pooled keep-alive session.
+
+Run from the project folder:  python -m benchmarks.bench_http_session
+"""
+
+CALLS = 200
+
+
+def run(stub, get):
+    token = requests.post(f'{stub.url}/oauth2/token').json()['access_token']
+    stub.connections = 0
+    start = time.perf_counter()
+    for pet_id in range(CALLS):
+        get(f'{stub.url}/animals/{pet_id % 50 + 1}', headers={"Authorization": f"Bearer {token}"})
+    return time.perf_counter() - start, stub.connections
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    with PetfinderStub(animal_count=50) as stub:
+        seconds, connections = run(stub, requests.get)
+        print(f'requests.get : {CALLS} calls in {seconds:.2f}s, {connections} connections opened')
+        seconds, connections = run(stub, make_session().get)
+        print(f'shared session: {CALLS} calls in {seconds:.2f}s, {connections} connections opened')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import text
+
+import migrate_keys
+from utils import db
+
+"""Customers keyed by time + email VARCHAR ids (before) vs numbered ids (now), on SQLite files standing in for
+MySQL: inserting customers and adoptions, joining adoptions to customers, the size of the file, and the
+online migration of the old tables.
+
+On SQLite a VARCHAR primary key is a separate unique index next to the table's rowid, so the old key costs
+an extra index here; on InnoDB it is the clustered index itself, and is copied into every secondary index.
+Run from the project folder:  python -m benchmarks.bench_keys [rows]   (default 1,000,000)
+"""
+
+BATCH = 10_000
+LOOKUPS = 10_000
+START = datetime(2020, 1, 1)
+# the tables as adoption_db.sql made them before the ids were numbered
+OLD_SCHEMA = ['''CREATE TABLE customers (
+    id VARCHAR(255) NOT NULL PRIMARY KEY, firstname VARCHAR(255), lastname VARCHAR(255), phone VARCHAR(25),
+    email VARCHAR(255), address VARCHAR(255), city_name VARCHAR(255), state VARCHAR(255), zipCode VARCHAR(255),
+    CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP)''',
+              '''CREATE TABLE customer_adoptions (
+    pet_id INT NOT NULL PRIMARY KEY, customer_id VARCHAR(255), CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP)''',
+              'CREATE INDEX customers_created_at ON customers (CreatedAt, id)',
+              'CREATE UNIQUE INDEX customers_email ON customers (email)',
+              'CREATE INDEX customers_lastname ON customers (lastname)',
+              'CREATE INDEX customers_firstname ON customers (firstname)']
+
+
+def timed(label, run):
+    start = time.perf_counter()
+    result = run()
+    print(f'{label:<52} {time.perf_counter() - start:8.2f} s')
+    return result
+
+
+def customer_rows(first, last, old_ids):
+    for number in range(first, last):
+        created_at = START + timedelta(seconds=number)
+        email = f'customer{number}@example.com'
+        row = {'firstname': f'First{number % 5000}', 'lastname': f'Last{number % 7919}', 'phone': '0123456789',
+               'email': email, 'address': 'Some street', 'city_name': 'Some city', 'state': 'NJ',
+               'zipcode': '07001', 'created_at': created_at}
+        # str(time.time()) + email, as the /customer form made them
+        row['id'] = f'{created_at.timestamp() + number % 1000 / 1000}{email}' if old_ids else number + 1
+        yield row
+
+
+def insert_customers(connection, rows, old_ids):
+    statement = text('INSERT INTO customers (id, firstname, lastname, phone, email, address, city_name, state, '
+                     'zipcode, CreatedAt) VALUES (:id, :firstname, :lastname, :phone, :email, :address, '
+                     ':city_name, :state, :zipcode, :created_at)')
+    for first in range(0, rows, BATCH):
+        connection.execute(statement, list(customer_rows(first, min(first + BATCH, rows), old_ids)))
+        connection.commit()
+
+
+def insert_adoptions(connection, rows, old_ids):
+    # every customer adopted one pet, pet ids in a different order from the customers
+    ids = connection.execute(text('SELECT id FROM customers')).scalars().all() if old_ids else None
+    statement = text('INSERT INTO customer_adoptions (pet_id, customer_id) VALUES (:pet_id, :customer_id)')
+    for first in range(0, rows, BATCH):
+        connection.execute(statement, [{'pet_id': (number * 7919) % rows + 1,
+                                        'customer_id': ids[number] if old_ids else number + 1}
+                                       for number in range(first, min(first + BATCH, rows))])
+        connection.commit()
+
+
+def joins(connection, rows):
+    pet_ids = random.Random(0).sample(range(1, rows + 1), LOOKUPS)
+
+    def lookups():
+        for pet_id in pet_ids:
+            connection.execute(text('SELECT c.email FROM customer_adoptions a JOIN customers c '
+                                    'ON c.id = a.customer_id WHERE a.pet_id = :pet_id'), {'pet_id': pet_id}).scalar()
+
+    def full():
+        return connection.execute(text('SELECT count(*), max(c.email) FROM customer_adoptions a JOIN customers c '
+                                       'ON c.id = a.customer_id')).first()
+    return lookups, full
+
+
+def measure(label, path, schema, rows, old_ids):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context(), db.engine.connect() as connection:
+        for statement in schema:
+            connection.execute(text(statement))
+        connection.commit()
+        print(f'{label}:')
+        timed(f'  insert {rows} customers, {BATCH} a batch', lambda: insert_customers(connection, rows, old_ids))
+        timed(f'  insert {rows} adoptions', lambda: insert_adoptions(connection, rows, old_ids))
+        lookups, full = joins(connection, rows)
+        timed(f'  {LOOKUPS} adoption -> customer lookups (join)', lookups)
+        timed('  join every adoption to its customer', full)
+        print(f'  database file {os.path.getsize(path) / 2 ** 20:8.1f} MiB')
+        db.engine.dispose()
+    return app
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    folder = tempfile.mkdtemp()
+    old_path = os.path.join(folder, 'old.db')
+    app = measure('VARCHAR(255) time + email ids', old_path, OLD_SCHEMA, rows, old_ids=True)
+    new_schema = [statement.replace('id VARCHAR(255) NOT NULL PRIMARY KEY', 'id INTEGER PRIMARY KEY')
+                  .replace('customer_id VARCHAR(255)', 'customer_id INTEGER') for statement in OLD_SCHEMA]
+    measure('numbered ids', os.path.join(folder, 'new.db'), new_schema, rows, old_ids=False)
+
+    print('migrating the VARCHAR database:')
+    with app.app_context(), db.engine.connect() as connection:
+        timed('  copy (site still up)', lambda: migrate_keys.copy(connection))
+        timed('  cutover (site stopped)', lambda: migrate_keys.cutover(connection))
+        timed('  drop old tables', lambda: migrate_keys.drop_old(connection))
+        connection.execute(text('VACUUM'))
+    print(f'  database file {os.path.getsize(old_path) / 2 ** 20:8.1f} MiB after VACUUM')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log_config import configure_logging, stop_logging, log_event
+
+"""Time a request thread spends logging one search, 16 threads at once.
+
+old: logging.basicConfig with a FileHandler and a StreamHandler, written by the request thread, and the
+log lines of a search before (the whole token response, f-strings built whatever the level).
+new: configure_logging() - the request thread only queues the record - and the log_event() lines of a
+search now. stderr goes to /dev/null for both, the file to a temporary folder.
+Run from the project folder:  python -m benchmarks.bench_logging
+"""
+
+THREADS = 16
+REQUESTS = 2000
+TOKEN = {'token_type': 'Bearer', 'expires_in': 3600, 'access_token': 'eyJ0eXAiOiJKV1QiLCJhbGciOiJSUzI1NiJ9.' * 20}
+CHOICES = ('Dog', 'Large', False, True, False, True, False)
+logger = logging.getLogger('utils')
+
+
+def old_search_logs():
+    logging.info(f'Response code <Response [200]>')
+    logging.info(f'resp.json returns dictionary {TOKEN} inc. access token')
+    logging.info(f'access token successfully generated')
+    logging.info(f"User specified choices were {CHOICES[0]}, size = {CHOICES[1]}, good with children = {CHOICES[2]}, "
+                 f"good with dogs = {CHOICES[3]}, good with cats = {CHOICES[4]}, house trained = {CHOICES[5]}, "
+                 f"special needs = {CHOICES[6]}")
+    logging.info(f'Response code <Response [200]>')
+
+
+def new_search_logs():
+    log_event(logger, logging.INFO, 'token_issued', expires_in=TOKEN['expires_in'])
+    log_event(logger, logging.INFO, 'search', query='type=Dog&size=Large&good_with_dogs=true&house_trained=true'
+                                                    '&status=adoptable&limit=100')
+    log_event(logger, logging.INFO, 'search_first_page', status=200)
+
+
+def old_setup(path, level):
+    root = logging.getLogger()
+    handlers = [logging.FileHandler(path), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter('%(name)s - %(levelname)s - %(message)s'))
+        root.addHandler(handler)
+    root.setLevel(level)
+
+    def teardown():
+        for handler in handlers:
+            root.removeHandler(handler)
+            handler.close()
+    return teardown
+
+
+def new_setup(path, level):
+    configure_logging(level, path)
+    return stop_logging
+
+
+def measure(setup, search_logs, level):
+    folder = tempfile.mkdtemp()
+    teardown = setup(os.path.join(folder, 'app.log'), level)
+
+    def one(_):
+        start = time.perf_counter()
+        search_logs()
+        return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(THREADS) as executor:
+            latencies = sorted(executor.map(one, range(REQUESTS)))
+        wall = time.perf_counter() - start
+    finally:
+        # the new setup still writes out its queue here, after the timing stopped
+        teardown()
+    return wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')
+    try:
+        results = [(f'{label} {logging.getLevelName(level)}', measure(setup, search_logs, level))
+                   for level in (logging.INFO, logging.WARNING)
+                   for label, setup, search_logs in (('old', old_setup, old_search_logs),
+                                                     ('new', new_setup, new_search_logs))]
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    print(f'{REQUESTS} searches from {THREADS} threads, time spent logging in the request thread')
+    for label, (wall, p50, p99) in results:
+        print(f'{label:<12} total {wall * 1000:7.1f} ms   p50 {p50 * 1e6:7.1f} us   p99 {p99 * 1e6:7.1f} us')
+
+
+if __name__ == '__main__':
+    main()
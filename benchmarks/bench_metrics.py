@@ -0,0 +1,87 @@
+import logging
+import statistics
+import time
+import timeit
+
+from jinja2 import Environment
+
+from app import create_app
+from config import engine_options
+from metrics import Histogram, Metrics, timed_template
+from utils import db
+
+"""Cost of the /metrics instrumentation: the same /admin page with METRICS_ENABLED on and off.
+
+/admin makes no Petfinder call, so the whole request runs on the calling thread (the search views hand their
+calls over to the event loop thread, and on a small machine that hand-over is noisier than what is measured). It goes
+through every kind of instrumentation: the request hooks, a repository method, database queries and a
+template render. The database is an empty in-memory SQLite one, so the page is as cheap as it gets and
+the instrumentation as large a share of it as it can be. Measured through Flask's test client, on and off
+in turns - on a busy machine the difference is within the noise, so the pieces are also timed on their own.
+Run from the project folder:  python -m benchmarks.bench_metrics
+"""
+
+REQUESTS = 2000
+ROUNDS = 7
+
+
+def timed_pages(enabled):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_ENGINE_OPTIONS': engine_options('sqlite://'),
+                      'METRICS_ENABLED': enabled, 'LOG_FILE': ''})
+    with app.app_context():
+        db.create_all()
+    tester = app.test_client()
+    try:
+        for _ in range(200):
+            tester.get('/admin')
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            tester.get('/admin')
+        return (time.perf_counter() - start) / REQUESTS
+    finally:
+        app.extensions['event_loop'].stop()
+
+
+def piece_costs(number=100000):
+    metrics = Metrics()
+    histogram = Histogram('pawsome_request_seconds', '', ('endpoint',))
+
+    class Repository:
+        def search(self):
+            return None
+
+    repository = Repository()
+    plain = repository.search
+    metrics.instrument(repository, ('search',))
+    source = '{% for pet in pets %}<p>{{ pet }}</p>{% endfor %}'
+    timed_environment = Environment()
+    timed_environment.template_class = timed_template(metrics)
+    plain_template, timed = Environment().from_string(source), timed_environment.from_string(source)
+
+    def cost(function):
+        return min(timeit.repeat(function, number=number, repeat=5)) / number
+    return {
+        'histogram observe': cost(lambda: histogram.observe(0.003, 'views.show_customers')),
+        'repository method wrapper': cost(repository.search) - cost(plain),
+        'template render timing': cost(lambda: timed.render(pets=range(3))) - cost(lambda: plain_template.render(
+            pets=range(3))),
+    }
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    times = {False: [], True: []}
+    for _ in range(ROUNDS):
+        for enabled in (False, True):
+            times[enabled].append(timed_pages(enabled))
+    print(f'{REQUESTS} /admin pages, median of {ROUNDS}')
+    for enabled, values in times.items():
+        print(f'metrics {"on " if enabled else "off"}  {statistics.median(values) * 1e6:7.1f} us per request')
+    print(f'difference {(statistics.median(times[True]) - statistics.median(times[False])) * 1e6:.1f} us per request')
+    print('each piece on its own:')
+    for name, seconds in piece_costs().items():
+        print(f'  {name:<28} {seconds * 1e6:5.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import logging
+import time
+
+from petfinder_stub import PetfinderStub
+from rate_limit import RateLimiter
+from shared_store import LocalStore
+from utils import AnimalRepository, Animal
+
+"""Wall-clock time of one broad search, pages fetched one after another vs in parallel.
+
+Run from the project folder:  python -m benchmarks.bench_page_fetch
+"""
+
+LATENCY = 0.1
+ANIMALS = 12000
+
+
+def timed_search(stub, concurrency):
+    # no rate limit against the stub, the benchmark makes more calls than a day's budget
+    animal = AnimalRepository(api_url=stub.url, store=LocalStore(), page_concurrency=concurrency,
+                              rate_limiter=RateLimiter(rate=10 ** 6, daily_limit=0))
+    # fetch the token first so only the search itself is timed
+    animal.get_token()
+    stub.counts.clear()
+    start = time.perf_counter()
+    pets = animal.get_animal_data(Animal('Dog', 'Large', False, False, False, False, False))
+    return time.perf_counter() - start, len(pets), stub.counts['animals']
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    with PetfinderStub(animal_count=ANIMALS, latency=LATENCY) as stub:
+        print(f'stub latency {LATENCY * 1000:.0f} ms per call')
+        for concurrency in (1, 4, 8, 16):
+            seconds, pets, pages = timed_search(stub, concurrency)
+            print(f'concurrency {concurrency:>2}: {pets} pets from {pages} pages in {seconds:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import logging
+import subprocess
+import time
+
+from app import create_app, pet_cards
+from pagination import paginate
+from petfinder_stub import make_animal
+from records import PetRecord
+
+"""Rendering a 1,000 animal result: every card rendered in the page template (before), and the cards from
+the fragment cache, cold (all misses) and warm (all hits).
+
+The "before" template is the pet_list.html from before the fragment cache, read from git history.
+Run from the project folder:  python -m benchmarks.bench_pet_cards
+"""
+
+OLD_TEMPLATE_COMMIT = '312c807'
+ANIMALS = 1000
+
+
+def old_template():
+    return subprocess.run(['git', 'show', f'{OLD_TEMPLATE_COMMIT}:templates/pet_list.html'],
+                          capture_output=True, text=True, check=True).stdout
+
+
+def timed(render, repeat=10, before=None):
+    best, html = None, ''
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        html = render()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, html
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    app = create_app({'LOG_FILE': '', 'METRICS_ENABLED': False, 'ADOPTED_FILTER': False})
+    animal_repository = app.extensions['animal_repository']
+    cache = app.extensions['pet_cards']
+    old = app.jinja_env.from_string(old_template())
+    new = app.jinja_env.get_template('pet_list.html')
+    pets = animal_repository.rank_animals([PetRecord.from_api(make_animal(animal_id))
+                                           for animal_id in range(1, ANIMALS + 1)])
+    page = paginate(pets, 1, per_page=ANIMALS)
+
+    with app.test_request_context('/adopt'):
+        def render_old():
+            cards = [(pet, animal_repository.photo_url(pet)) for pet in page.items]
+            return old.render(cards=cards, page=page, search_key='search:dog:large:00000')
+
+        def render_new():
+            return new.render(cards=pet_cards(page.items, animal_repository.photo_url), page=page,
+                              search_key='search:dog:large:00000')
+
+        before, before_html = timed(render_old)
+        cold, cold_html = timed(render_new, before=cache.clear)
+        warm, warm_html = timed(render_new)
+
+    # the same page apart from the whitespace around each card
+    assert before_html.split() == warm_html.split() == cold_html.split()
+    print(f'{ANIMALS} animals on one page: cards in the page template {before * 1000:.1f} ms | '
+          f'fragment cache cold {cold * 1000:.1f} ms, warm {warm * 1000:.1f} ms '
+          f'({cache.bytes / 1024:.0f} KiB of cards kept)')
+
+
+if __name__ == '__main__':
+    main()
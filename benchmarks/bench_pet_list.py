@@ -0,0 +1,55 @@
+import logging
+import subprocess
+import time
+
+from app import create_app
+from pagination import paginate
+from petfinder_stub import make_animal
+
+"""Render time and response size of the /adopt results, whole search in one page vs one server-side page.
+
+The "before" template is the pet_list.html from before pagination, read from git history.
+Run from the project folder:  python -m benchmarks.bench_pet_list
+"""
+
+OLD_TEMPLATE_COMMIT = '2e70c57'
+
+
+def old_template():
+    return subprocess.run(['git', 'show', f'{OLD_TEMPLATE_COMMIT}:templates/pet_list.html'],
+                          capture_output=True, text=True, check=True).stdout
+
+
+def timed(render, repeat=5):
+    best, html = None, ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html = render()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, len(html.encode())
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    app = create_app()
+    animal_repository = app.extensions['animal_repository']
+    template = app.jinja_env.from_string(old_template())
+    new_template = app.jinja_env.get_template('pet_list.html')
+    for size in (500, 5000):
+        pets = animal_repository.rank_animals([make_animal(animal_id) for animal_id in range(1, size + 1)])
+        with app.test_request_context('/adopt'):
+            before = timed(lambda: template.render(pets=pets))
+
+            def render_page():
+                page = paginate(pets, 1)
+                cards = [(pet, animal_repository.photo_url(pet)) for pet in page.items]
+                return new_template.render(cards=cards, page=page, search_key='search:dog:large:00000')
+
+            after = timed(render_page)
+        print(f'{size:>5} animals: whole list {before[0] * 1000:.1f} ms, {before[1] / 1024:.0f} KiB | '
+              f'one page {after[0] * 1000:.1f} ms, {after[1] / 1024:.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import logging
+import timeit
+
+from petfinder_stub import make_animal
+from utils import AnimalRepository
+
+"""The old age_check route logic vs the single-pass rank_by_age, on 10k and 100k synthetic animals.
+
+Run from the project folder:  python -m benchmarks.bench_ranking
+"""
+
+
+def age_check_path(animal, animals):
+    # what pet_search_form used to do: seniors only, or everybody when there are none
+    senior_animals = animal.age_check(animals)
+    return animals if senior_animals == [] else senior_animals
+
+
+def age_check_keep_all_path(animal, animals):
+    # the same age_check, plus the second pass needed to keep the non-senior animals after the seniors
+    senior_animals = animal.age_check(animals)
+    return senior_animals + [pet for pet in animals if pet['age'] != 'Senior']
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    animal = AnimalRepository()
+    for size in (10_000, 100_000):
+        animals = [make_animal(animal_id % 1000 + 1) for animal_id in range(size)]
+        repeat = 20 if size == 10_000 else 5
+        old = min(timeit.repeat(lambda: age_check_path(animal, animals), number=1, repeat=repeat))
+        keep_all = min(timeit.repeat(lambda: age_check_keep_all_path(animal, animals), number=1, repeat=repeat))
+        new = min(timeit.repeat(lambda: animal.rank_animals(animals), number=1, repeat=repeat))
+        lazy = min(timeit.repeat(lambda: next(animal.rank_animals(animals, lazy=True)), number=1, repeat=repeat))
+        print(f'{size:>7} animals: age_check (seniors only) {old * 1000:.2f} ms, '
+              f'age_check + rest {keep_all * 1000:.2f} ms, rank_by_age {new * 1000:.2f} ms, '
+              f'rank_by_age lazy first item {lazy * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import json
+import logging
+import pickle
+import tracemalloc
+
+from petfinder_stub import make_animal
+from records import PetRecord
+
+"""Memory held by one cached search, full Petfinder dicts vs PetRecords, measured with tracemalloc.
+
+Run from the project folder:  python -m benchmarks.bench_records_memory
+"""
+
+ANIMALS = 20_000
+
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    # the same bytes a search would get back from Petfinder, 100 animals per page
+    pages = [json.dumps({'animals': [make_animal(animal_id) for animal_id in range(start, start + 100)]})
+             for start in range(1, ANIMALS + 1, 100)]
+
+    full, full_current, full_peak = measure(lambda: [pet for page in pages for pet in json.loads(page)['animals']])
+    slim, slim_current, slim_peak = measure(
+        lambda: [PetRecord.from_api(pet) for page in pages for pet in json.loads(page)['animals']])
+
+    print(f'{ANIMALS} animals')
+    print(f'full dicts : {full_current / 2 ** 20:.1f} MiB held, {full_peak / 2 ** 20:.1f} MiB peak, '
+          f'{len(pickle.dumps(full)) / 2 ** 20:.1f} MiB pickled')
+    print(f'PetRecords : {slim_current / 2 ** 20:.1f} MiB held, {slim_peak / 2 ** 20:.1f} MiB peak, '
+          f'{len(pickle.dumps(slim)) / 2 ** 20:.1f} MiB pickled')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import logging
+import tempfile
+import time
+
+from app import create_app
+from assets import build
+
+"""The home page and its stylesheet before and after the asset build: every request rendering home.html vs
+rendered once (and a 304 for a browser that has it), and styles2.css from /static vs its gzip copy.
+
+Run from the project folder:  python -m benchmarks.bench_static
+"""
+
+REQUESTS = 2000
+
+
+def per_request(tester, url, headers=None, before=lambda: None):
+    for _ in range(100):
+        before()
+        tester.get(url, headers=headers)
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        before()
+        response = tester.get(url, headers=headers)
+    return (time.perf_counter() - start) / REQUESTS, response
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    folder = tempfile.mkdtemp()
+    manifest = build('static', folder)
+    app = create_app({'ASSETS_DIR': folder, 'LOG_FILE': '', 'METRICS_ENABLED': False})
+    tester = app.test_client()
+    try:
+        # forgetting the page before each request renders it every time, as before
+        rendered, _ = per_request(tester, '/', before=app.extensions['static_pages'].clear)
+        cached, page = per_request(tester, '/')
+        not_modified, _ = per_request(tester, '/', {'If-None-Match': page.headers['ETag']})
+        print(f'home page rendered each time   {rendered * 1e6:7.1f} us')
+        print(f'home page rendered once        {cached * 1e6:7.1f} us')
+        print(f'home page 304                  {not_modified * 1e6:7.1f} us')
+
+        plain = tester.get('/static/styles2.css')
+        compressed = tester.get('/assets/' + manifest['files']['styles2.css']['file'],
+                                headers={'Accept-Encoding': 'gzip'})
+        print(f'styles2.css  /static {len(plain.data)} bytes, {plain.headers.get("Cache-Control")}')
+        print(f'styles2.css  /assets {len(compressed.data)} bytes gzip, {compressed.headers["Cache-Control"]}')
+        plain.close()
+        compressed.close()
+    finally:
+        app.extensions['event_loop'].stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import logging
+import multiprocessing
+import tracemalloc
+
+from petfinder_stub import PetfinderStub
+from rate_limit import RateLimiter
+from records import PetRecord
+from shared_store import LocalStore
+from utils import AnimalRepository, Animal
+
+"""Peak memory of one large search: response.json() per page vs the streaming generator.
+
+The stub runs in its own process so tracemalloc only sees the app's side.
+Run from the project folder:  python -m benchmarks.bench_streaming_memory
+"""
+
+ANIMALS = 30_000
+
+
+def serve(queue, stop):
+    with PetfinderStub(animal_count=ANIMALS) as stub:
+        queue.put(stub.url)
+        stop.wait()
+
+
+def peak(run):
+    tracemalloc.start()
+    count = run()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, peak_bytes / 2 ** 20
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    queue, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(queue, stop), daemon=True)
+    server.start()
+    try:
+        # no rate limit against the stub, the benchmark makes more calls than a day's budget
+        animal = AnimalRepository(api_url=queue.get(timeout=60), store=LocalStore(), page_concurrency=4,
+                                  rate_limiter=RateLimiter(rate=10 ** 6, daily_limit=0))
+        animal.get_token()
+        animal_data = Animal('Dog', 'Large', False, False, False, False, False)
+
+        count, full = peak(lambda: len(animal.get_animal_data(animal_data)))
+        print(f'{count} animals, whole pages with response.json(): peak {full:.1f} MiB')
+        count, records = peak(lambda: len(animal.get_animal_data(animal_data, project=PetRecord.from_api)))
+        print(f'{count} animals, response.json() then PetRecords:  peak {records:.1f} MiB')
+        count, streamed = peak(lambda: len(list(animal.iter_animal_data(animal_data, project=PetRecord.from_api))))
+        print(f'{count} animals, streamed into a list of PetRecords: peak {streamed:.1f} MiB')
+        count, consumed = peak(lambda: sum(1 for _ in animal.iter_animal_data(animal_data,
+                                                                             project=PetRecord.from_api)))
+        print(f'{count} animals, streamed and consumed one by one: peak {consumed:.1f} MiB')
+    finally:
+        stop.set()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
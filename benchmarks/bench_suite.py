@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+from bulk import import_rows
+from config import engine_options
+from log_config import stop_logging
+from petfinder_stub import PetfinderStub
+from rate_limit import RateLimiter
+from search_cache import SearchCache
+from shared_store import LocalStore, LRUStore
+from utils import db
+
+"""End-to-end benchmark suite: /adopt, /customer and /admin driven through the Flask app, against the local
+Petfinder stub and a SQLite file standing in for the adoption database.
+
+Each scenario is run by --clients threads, each with its own test client, so a request goes through the
+whole app - views, templates, repositories, the search cache, the event loop and real HTTP calls to the
+stub - but not through a WSGI server. For every scenario it reports p50/p95/p99 latency, requests a second,
+Petfinder calls (counted by the stub) and the peak of Python allocations. The peak comes from a second,
+shorter run with tracemalloc on, as tracing slows everything down.
+
+--save-baseline writes the results to benchmarks/baseline.json (or --baseline). Later runs are compared
+with it and the run fails (exit code 1) when a scenario got worse than --threshold: slower p50 or p95,
+fewer requests a second, more Petfinder calls per request or a higher memory peak. Latency only compares
+on the machine the baseline was saved on; a baseline made with other settings is refused (exit code 2).
+Run from the project folder:  python -m benchmarks.bench_suite [--save-baseline] [--threshold 0.25] ...
+"""
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# requests of the memory run, per scenario
+MEMORY_REQUESTS = 50
+SEARCHES = [f'search:{animal_type}:{size}:00000' for animal_type in ('dog', 'cat')
+            for size in ('small', 'medium', 'large')]
+# settings that change what is measured - a baseline is only compared with a run made with the same ones
+SETTINGS = ('requests', 'clients', 'latency', 'animals', 'max_pages', 'error_rate', 'customers')
+# result -> whether a larger number is better; these are compared with the baseline
+COMPARED = {'p50_ms': False, 'p95_ms': False, 'throughput': True, 'upstream_per_request': False,
+            'peak_memory_kib': False}
+# the stub's counts of calls that reached it, failed ones included
+UPSTREAM_COUNTS = ('token', 'animals', 'animal', 'failed')
+# seeded adoptions use pet ids the stub does not have, so they never clash with the /customer scenario
+SEEDED_PET_IDS = 10 ** 6
+
+
+class Scenario:
+    def __init__(self, name, description, request, prepare=None):
+        self.name = name
+        self.description = description
+        # request(client, number, settings) -> response
+        self.request = request
+        # prepare(app) runs before each run of the scenario, outside the timing
+        self.prepare = prepare
+
+
+"""The scenarios - searches that miss the search cache, pages of cached searches, adoptions and the
+customer list"""
+
+
+def uncached_searches(app):
+    # one entry, and the searches rotate: every search fetches all its pages from Petfinder
+    app.extensions['animal_repository'].search_cache = SearchCache(LRUStore(1))
+
+
+def cached_searches(app):
+    app.extensions['animal_repository'].search_cache = SearchCache(LocalStore())
+    client = app.test_client()
+    for search in SEARCHES:
+        client.get(f'/adopt?search={search}&page=1')
+
+
+def uncached_animals(app):
+    # the thank you page fetches the adopted animal, rather than finding it left over from other scenarios
+    app.extensions['animal_repository'].animal_cache = LocalStore()
+
+
+def adopt_search(client, number, settings):
+    return client.get(f'/adopt?search={SEARCHES[number % len(SEARCHES)]}&page=1')
+
+
+def adopt_page(client, number, settings):
+    page = number // len(SEARCHES) % 3 + 1
+    return client.get(f'/adopt?search={SEARCHES[number % len(SEARCHES)]}&page={page}')
+
+
+def customer(client, number, settings):
+    # a new customer and a pet nobody adopted yet, as long as there are fewer requests than animals
+    return client.post(f'/customer?pet_id={number % settings["animals"] + 1}', data={
+        'firstname': f'Bench{number}', 'lastname': 'Mark', 'phone': '0123456789',
+        'email': f'bench{number}@example.com', 'address': 'Some street', 'city_name': 'Some city', 'state': 'NJ',
+        'zipcode': '07001'})
+
+
+def admin(client, number, settings):
+    return client.get(('/admin', '/admin?search=customer1', '/admin?search=First7')[number % 3])
+
+
+SCENARIOS = [
+    Scenario('adopt_search', 'GET /adopt, every search a search cache miss', adopt_search, uncached_searches),
+    Scenario('adopt_page', 'GET /adopt, pages 1-3 of cached searches', adopt_page, cached_searches),
+    Scenario('customer', 'POST /customer, a new customer adopting a pet', customer, uncached_animals),
+    Scenario('admin', 'GET /admin, first page and prefix searches', admin),
+]
+
+
+"""The app under test: the stub in place of Petfinder with no rate limit (the suite makes more calls than a
+day's budget), and a SQLite file with the seeded customers"""
+
+
+def build_app(stub, settings, folder):
+    url = f'sqlite:///{os.path.join(folder, "adoption.db")}'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url),
+                      'WTF_CSRF_ENABLED': False, 'CATALOGUE_WARM': False, 'LOG_LEVEL': 'WARNING',
+                      'LOG_FILE': ''})
+    animal_repository = app.extensions['animal_repository']
+    animal_repository.api_url = stub.url
+    animal_repository.max_pages = settings['max_pages']
+    animal_repository.rate_limiter = RateLimiter(LocalStore(), rate=10 ** 6, daily_limit=0)
+    # the token is fetched here, so its call is not counted against whichever scenario runs first
+    animal_repository.get_token()
+    with app.app_context():
+        db.create_all()
+        import_rows({'email': f'customer{number}@example.com', 'firstname': f'First{number}',
+                     'pet_id': SEEDED_PET_IDS + number} for number in range(settings['customers']))
+        # loaded now rather than on the refresh thread's next round, which comes after the tables were made
+        app.extensions['adopted_pets'].refresh()
+    return app
+
+
+def run_requests(app, scenario, numbers, clients, settings):
+    local = threading.local()
+
+    def one(number):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        response = scenario.request(local.client, number, settings)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(executor.map(one, numbers))
+    return results, time.perf_counter() - start
+
+
+def percentile(ordered, share):
+    # nearest rank
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def run_scenario(app, stub, scenario, settings):
+    requests = settings['requests']
+    if scenario.prepare:
+        scenario.prepare(app)
+    calls_before = sum(stub.counts[name] for name in UPSTREAM_COUNTS)
+    results, wall = run_requests(app, scenario, range(requests), settings['clients'], settings)
+    upstream_calls = sum(stub.counts[name] for name in UPSTREAM_COUNTS) - calls_before
+
+    # new request numbers, so the memory run adopts other pets
+    if scenario.prepare:
+        scenario.prepare(app)
+    tracemalloc.start()
+    try:
+        run_requests(app, scenario, range(requests, requests + min(requests, MEMORY_REQUESTS)),
+                     settings['clients'], settings)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status in results if status >= 400),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'throughput': round(requests / wall, 1),
+        'upstream_calls': upstream_calls,
+        'upstream_per_request': round(upstream_calls / requests, 3),
+        'peak_memory_kib': round(peak / 1024),
+    }
+
+
+def run_suite(settings, names=None):
+    folder = tempfile.mkdtemp()
+    with PetfinderStub(animal_count=settings['animals'], latency=settings['latency'],
+                       error_rate=settings['error_rate']) as stub:
+        app = build_app(stub, settings, folder)
+        try:
+            return {scenario.name: run_scenario(app, stub, scenario, settings) for scenario in SCENARIOS
+                    if names is None or scenario.name in names}
+        finally:
+            app.extensions['event_loop'].stop()
+            stop_logging()
+
+
+"""Checking a run against the baseline - returns a line for every result that got worse than threshold"""
+
+
+def regressions(results, baseline, threshold):
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for key, higher_is_better in COMPARED.items():
+            if key not in before:
+                continue
+            old, new = before[key], result[key]
+            worse = new < old * (1 - threshold) if higher_is_better else new > old * (1 + threshold)
+            if worse:
+                change = (new - old) / old * 100 if old else float('inf')
+                found.append(f'{name} {key}: {old} -> {new} ({change:+.0f}%)')
+    return found
+
+
+def report(results, baseline=None):
+    columns = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput', 'upstream_per_request', 'peak_memory_kib', 'errors')
+    print(f'{"scenario":<14}' + ''.join(f'{column:>22}' for column in columns))
+    for name, result in results.items():
+        cells = []
+        for column in columns:
+            cell = str(result[column])
+            if baseline and name in baseline and column in baseline[name]:
+                cell += f' ({baseline[name][column]})'
+            cells.append(f'{cell:>22}')
+        print(f'{name:<14}' + ''.join(cells))
+    if baseline:
+        print('baseline figures in brackets')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_suite',
+                                     description='End-to-end benchmarks of /adopt, /customer and /admin.')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario (default 200)')
+    parser.add_argument('--clients', type=int, default=8, help='threads sending requests (default 8)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per Petfinder call (default 0.02)')
+    parser.add_argument('--animals', type=int, default=2000,
+                        help='animals the stub has, which sets the pages per search (default 2000)')
+    parser.add_argument('--max-pages', type=int, default=50, help='most pages read per search (default 50)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of Petfinder calls answered 503 (default 0)')
+    parser.add_argument('--customers', type=int, default=20000, help='customers in the database (default 20000)')
+    parser.add_argument('--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS],
+                        help='only run this scenario (can be given more than once)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default benchmarks/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='save this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed change before a result counts as a regression (default 0.25, 25%%)')
+    parser.add_argument('--json', help='also write the results to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    settings = {name: getattr(args, name) for name in SETTINGS}
+
+    saved = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            saved = json.load(file)
+        if saved['settings'] != settings:
+            print(f'{args.baseline} was saved with other settings: {saved["settings"]}', file=sys.stderr)
+            return 2
+
+    for scenario in SCENARIOS:
+        if args.scenario is None or scenario.name in args.scenario:
+            print(f'{scenario.name:<14}{scenario.description}')
+    results = run_suite(settings, args.scenario)
+    report(results, saved and saved['results'])
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'settings': settings, 'results': results}, file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'settings': settings, 'results': results}, file, indent=2)
+            file.write('\n')
+        print(f'baseline saved to {args.baseline}')
+        return 0
+    if saved:
+        found = regressions(results, saved['results'], args.threshold)
+        if found:
+            print(f'{len(found)} regressions over {args.threshold:.0%}:')
+            for line in found:
+                print(f'  {line}')
+            return 1
+        print(f'no regressions over {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from petfinder_stub import PetfinderStub
+
+"""Requests per second and latency of the app under concurrent load: Werkzeug's dev server (what run() starts)
+vs gunicorn with gunicorn.conf.py. Petfinder is the local stub with a little latency, the database is a
+SQLite file standing in for MySQL.
+
+Run from the project folder:  python -m benchmarks.bench_wsgi_load [requests] [clients]   (default 2000, 16)
+"""
+
+PORT = 5077
+URLS = ['/', '/admin', '/adopt?search=search:dog:large:00000&page=1', '/adopt?search=search:cat:small:00000&page=2',
+        '/admin?search=customer1']
+
+
+def serve_stub(queue, stop):
+    with PetfinderStub(animal_count=2000, latency=0.02) as stub:
+        queue.put(stub.url)
+        stop.wait()
+
+
+def seed_database(url):
+    from bulk import import_rows
+    from app import create_app
+    from config import engine_options
+    from utils import db
+    app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url)})
+    with app.app_context():
+        db.create_all()
+        import_rows({'email': f'customer{number}@example.com', 'firstname': f'First{number}', 'pet_id': number}
+                    for number in range(20_000))
+
+
+def wait_until_up(base):
+    for _ in range(200):
+        try:
+            if requests.get(base + '/', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f'server at {base} did not start')
+
+
+def load(base, total, clients):
+    def one(number):
+        url = base + URLS[number % len(URLS)]
+        start = time.perf_counter()
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    # one request per URL first, so both servers start with the searches cached
+    for url in URLS:
+        requests.get(base + url, timeout=60)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        latencies = sorted(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+    return total / wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def measure(label, command, env, total, clients):
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{PORT}'
+        wait_until_up(base)
+        rate, p50, p99 = load(base, total, clients)
+        print(f'{label:<45} {rate:8.0f} req/s   p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    queue, stop = multiprocessing.Queue(), multiprocessing.Event()
+    stub = multiprocessing.Process(target=serve_stub, args=(queue, stop), daemon=True)
+    stub.start()
+    try:
+        database = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "adoption.db")}'
+        seed_database(database)
+        # no rate limit against the stub, the benchmark makes more calls than a day's budget
+        env = dict(os.environ, PETFINDER_API_URL=queue.get(timeout=60), DATABASE_URL=database,
+                   BIND=f'127.0.0.1:{PORT}', PETFINDER_RATE_LIMIT='1000000', PETFINDER_DAILY_LIMIT='0')
+        print(f'{total} requests from {clients} clients, {os.cpu_count()} CPUs')
+        measure('dev server (debug=True)', [sys.executable, '-c', 'from app import create_app; '
+                                            f'create_app().run(debug=True, port={PORT}, use_reloader=False)'],
+                env, total, clients)
+        measure('gunicorn with gunicorn.conf.py',
+                [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'], env, total, clients)
+    finally:
+        stop.set()
+        stub.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from itertools import islice
+
+from sqlalchemy import select
+
+from app import create_app
+from config import engine_options
+from log_config import log_event
+from utils import Customers, CustomerAdoptions, db
+
+"""Bulk loading of adoptions recorded by partner shelters, and the matching export.
+
+Each row is one customer plus, optionally, the pet_id they adopted - the same thing the /customer form
+sends, so a customer who adopted three pets is three rows with the same email. Rows are read one at a time
+from CSV or JSONL and written in batches: one lookup of the batch's emails, then one multi-row insert for
+the new customers and one for the adoptions. Customers are matched by email like customer_adopt does, in
+any case as the unique email index does, and pets that are already adopted are skipped.
+
+After each batch is committed the number of input rows done is written to <file>.progress, and --resume
+starts after them. Inserts ignore rows that are already there, so redoing part of a batch is harmless.
+
+Run from the project folder:
+    python bulk.py import adoptions.csv [--batch-size 1000] [--resume]
+    python bulk.py export adoptions.jsonl
+"""
+
+FIELDS = ('id', 'firstname', 'lastname', 'phone', 'email', 'address', 'city_name', 'state', 'zipcode')
+COLUMNS = FIELDS + ('pet_id',)
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+
+logger = logging.getLogger(__name__)
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.customers = 0
+        self.adoptions = 0
+        # rows without an email or with a pet_id that is not a number
+        self.invalid = 0
+        # pets that were already adopted, by anyone
+        self.already_adopted = 0
+
+
+"""Reading import rows from a .csv or .jsonl file, one at a time"""
+
+
+def read_rows(file, file_format):
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+"""Writing export rows to a .csv or .jsonl file as they come"""
+
+
+def write_rows(rows, file, file_format):
+    if file_format == 'csv':
+        writer = csv.DictWriter(file, COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            file.write(json.dumps(row) + '\n')
+
+
+def file_format_of(path, file_format=None):
+    if file_format:
+        return file_format
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def insert_ignore(table):
+    # rows already in the table (same email, or pet already adopted) are left alone instead of failing the batch
+    return table.insert().prefix_with('OR IGNORE', dialect='sqlite').prefix_with('IGNORE', dialect='mysql')
+
+
+"""Ids of the customers already in the database, by lowercased email"""
+
+
+def existing_customers(emails):
+    # the email index compares without regard to case, so this matches however the email was typed
+    rows = db.session.execute(select(Customers.email, Customers.id).where(Customers.email.in_(list(emails))))
+    return {email.lower(): customer_id for email, customer_id in rows}
+
+
+"""Writing one batch of rows in a single transaction"""
+
+
+def import_batch(rows, result):
+    customers = {}
+    adoptions = []
+    for row in rows:
+        email = (row.get('email') or '').strip()
+        # Bob@example.com and bob@example.com are one customer to the email index
+        key = email.lower()
+        pet_id = row.get('pet_id')
+        if not email or (pet_id not in (None, '') and not str(pet_id).isdigit()):
+            result.invalid += 1
+            continue
+        pet_id = int(pet_id) if pet_id not in (None, '') else None
+        if key not in customers:
+            # the database numbers new customers, an id column in the file (from another database) is not used
+            customer = {field: row.get(field) or None for field in FIELDS if field != 'id'}
+            customer['email'] = email
+            customers[key] = customer
+        if pet_id is not None:
+            adoptions.append((pet_id, key))
+
+    if customers:
+        existing = existing_customers(customers)
+        new_customers = [customer for key, customer in customers.items() if key not in existing]
+        if new_customers:
+            inserted = db.session.execute(insert_ignore(Customers.__table__), new_customers).rowcount
+            result.customers += max(inserted, 0)
+            # a customer added by someone else in the meantime keeps their own id
+            existing = existing_customers(customers)
+    if adoptions:
+        # the first row for a pet wins, like the unique pet_id in customer_adoptions
+        by_pet = {}
+        for pet_id, key in adoptions:
+            by_pet.setdefault(pet_id, {'pet_id': pet_id, 'customer_id': existing[key]})
+        inserted = db.session.execute(insert_ignore(CustomerAdoptions.__table__), list(by_pet.values())).rowcount
+        inserted = max(inserted, 0)
+        result.adoptions += inserted
+        result.already_adopted += len(adoptions) - inserted
+    db.session.commit()
+
+
+"""Importing rows in batches. done rows are skipped first (when resuming), and progress(rows_done) is called
+after every committed batch"""
+
+
+def import_rows(rows, batch_size=BULK_BATCH_SIZE, done=0, progress=None):
+    result = ImportResult()
+    rows = iter(rows)
+    if done:
+        for _ in islice(rows, done):
+            pass
+    result.rows = done
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return result
+        try:
+            import_batch(batch, result)
+        except Exception:
+            db.session.rollback()
+            raise
+        result.rows += len(batch)
+        if progress is not None:
+            progress(result.rows)
+
+
+"""Every customer with their adoptions, one row per adoption (or one row with no pet_id), read from the
+database a batch at a time"""
+
+
+def export_rows(batch_size=BULK_BATCH_SIZE):
+    columns = [getattr(Customers, field) for field in FIELDS] + [CustomerAdoptions.pet_id]
+    query = (select(*columns).outerjoin(CustomerAdoptions, CustomerAdoptions.customer_id == Customers.id)
+             .order_by(Customers.id, CustomerAdoptions.pet_id).execution_options(yield_per=batch_size))
+    # yield_per streams the result (a server side cursor on MySQL) instead of fetching the whole table
+    for row in db.session.execute(query):
+        yield dict(row._mapping)
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as file:
+            return int(file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, rows_done):
+    # written next to the file and then swapped in, so a crash never leaves a half written number
+    with open(path + '.tmp', 'w') as file:
+        file.write(str(rows_done))
+    os.replace(path + '.tmp', path)
+
+
+def run_import(path, batch_size, resume, file_format=None):
+    checkpoint = path + '.progress'
+    done = read_checkpoint(checkpoint) if resume else 0
+    if done:
+        logger.info('Resuming %s after %d rows', path, done)
+    start = time.perf_counter()
+
+    def progress(rows_done):
+        write_checkpoint(checkpoint, rows_done)
+        elapsed = time.perf_counter() - start
+        log_event(logger, logging.INFO, 'bulk_import_progress', rows=rows_done,
+                  rows_per_second=round((rows_done - done) / elapsed))
+
+    with open(path, newline='', encoding='utf-8') as file:
+        result = import_rows(read_rows(file, file_format_of(path, file_format)), batch_size, done, progress)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    log_event(logger, logging.INFO, 'bulk_import_finished', path=path, rows=result.rows, customers=result.customers,
+              adoptions=result.adoptions, already_adopted=result.already_adopted, invalid=result.invalid)
+    return result
+
+
+def run_export(path, batch_size, file_format=None):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        write_rows(export_rows(batch_size), file, file_format_of(path, file_format))
+    logger.info('Export to %s finished', path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import and export of customers and adoptions')
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path', help='.csv or .jsonl file')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='file format, by default from the extension')
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument('--resume', action='store_true', help='continue an import that stopped part way')
+    parser.add_argument('--database-url', help='database to use instead of the one configured for the app')
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.database_url:
+        config = {'SQLALCHEMY_DATABASE_URI': args.database_url,
+                  'SQLALCHEMY_ENGINE_OPTIONS': engine_options(args.database_url)}
+    app = create_app(config)
+    with app.app_context():
+        if args.command == 'import':
+            run_import(args.path, args.batch_size, args.resume, args.format)
+        else:
+            run_export(args.path, args.batch_size, args.format)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import logging
+import os
+import threading
+import time
+from math import ceil
+
+from log_config import log_event
+from rate_limit import LOW_BUDGET_MAX_PAGES
+
+"""A local copy of the adoptable catalogue, so searches are answered from memory.
+
+CatalogueIndex keeps every animal (as a PetRecord) once, with sets of ids per (type, size) and per yes/no attribute,
+so a search is a couple of set intersections. CatalogueWarmer is the background thread that fills it:
+a full crawl every full_interval seconds, and in between only the animals published since the last crawl.
+Petfinder has no query for animals whose status changed, so only a full crawl drops the ones adopted
+since - the index answers searches for max_age seconds after its last full crawl, however many updates
+came after it. A crawl with pages missing (refused by the rate limiter or failed) is thrown away, the index
+keeps its last copy. A full crawl cut short by max_pages is kept for degraded_search and get_animal, but is
+not complete and searches go to Petfinder.
+"""
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_REFRESH_INTERVAL = int(os.getenv('CATALOGUE_REFRESH_INTERVAL', '300'))
+CATALOGUE_FULL_INTERVAL = int(os.getenv('CATALOGUE_FULL_INTERVAL', '900'))
+# an index whose last full crawl is older than this is not trusted and searches go to Petfinder again -
+# a little over CATALOGUE_FULL_INTERVAL, so one slow crawl does not send everyone to Petfinder
+CATALOGUE_MAX_AGE = int(os.getenv('CATALOGUE_MAX_AGE', '1200'))
+CATALOGUE_MAX_PAGES = int(os.getenv('CATALOGUE_MAX_PAGES', '200'))
+
+# search form choice -> the PetRecord field holding that yes/no value
+ATTRIBUTES = {
+    'select_good_with_children': 'good_with_children',
+    'select_good_with_dogs': 'good_with_dogs',
+    'select_good_with_cats': 'good_with_cats',
+    'select_house_trained': 'house_trained',
+    'select_special_needs': 'special_needs',
+}
+
+
+class CatalogueIndex:
+    def __init__(self, max_age=CATALOGUE_MAX_AGE):
+        self.max_age = max_age
+        self.animals = {}
+        # (published_at, id) of each animal, results are sorted newest first like Petfinder's sort=recent
+        self.sort_keys = {}
+        self.by_type_size = {}
+        self.by_attribute = {name: set() for name in ATTRIBUTES}
+        # time of the last full crawl, and whether it read the whole catalogue
+        self.updated_at = None
+        self.complete = False
+        self._lock = threading.Lock()
+
+    """True when the whole catalogue has been crawled recently enough to answer searches"""
+
+    def is_fresh(self):
+        return self.complete and self.updated_at is not None and time.time() - self.updated_at < self.max_age
+
+    """Animals matching the search form choices - ticked boxes must match, unticked ones are not filtered on"""
+
+    def query(self, animal_data):
+        with self._lock:
+            key = (str(animal_data.cat_or_dog).lower(), str(animal_data.select_size).lower())
+            ids = set(self.by_type_size.get(key, ()))
+            for name in ATTRIBUTES:
+                if getattr(animal_data, name):
+                    ids &= self.by_attribute[name]
+            ordered = sorted(ids, key=self.sort_keys.__getitem__, reverse=True)
+            return [self.animals[animal_id] for animal_id in ordered]
+
+    """Replacing everything with the result of a full crawl - complete=False when it stopped at max_pages"""
+
+    def replace(self, animals, complete=True):
+        fresh = CatalogueIndex(self.max_age)
+        fresh.update(animals)
+        with self._lock:
+            self.animals, self.sort_keys = fresh.animals, fresh.sort_keys
+            self.by_type_size, self.by_attribute = fresh.by_type_size, fresh.by_attribute
+            self.updated_at = time.time()
+            self.complete = complete
+
+    """Adding new or changed animals and dropping ones no longer adoptable, returns how many changed"""
+
+    def update(self, animals):
+        changed = 0
+        with self._lock:
+            for animal in animals:
+                current = self.animals.get(animal['id'])
+                if current is not None and self._version(current) == self._version(animal):
+                    continue
+                changed += 1
+                if current is not None:
+                    self._remove(current)
+                if animal.get('status', 'adoptable') == 'adoptable':
+                    self._add(animal)
+        return changed
+
+    """Newest published_at seen, used as the starting point of the next incremental crawl"""
+
+    def latest_published(self):
+        with self._lock:
+            return max((animal.get('published_at') or '' for animal in self.animals.values()), default=None)
+
+    @staticmethod
+    def _version(animal):
+        return animal.get('status_changed_at'), animal.get('published_at'), animal.get('status')
+
+    def _add(self, animal):
+        animal_id = animal['id']
+        self.animals[animal_id] = animal
+        self.sort_keys[animal_id] = (animal.get('published_at') or '', animal_id)
+        key = (str(animal.get('type')).lower(), str(animal.get('size')).lower())
+        self.by_type_size.setdefault(key, set()).add(animal_id)
+        for name, field in ATTRIBUTES.items():
+            if animal.get(field):
+                self.by_attribute[name].add(animal_id)
+
+    def _remove(self, animal):
+        animal_id = animal['id']
+        self.animals.pop(animal_id, None)
+        self.sort_keys.pop(animal_id, None)
+        key = (str(animal.get('type')).lower(), str(animal.get('size')).lower())
+        self.by_type_size.get(key, set()).discard(animal_id)
+        for ids in self.by_attribute.values():
+            ids.discard(animal_id)
+
+
+class CatalogueWarmer:
+    def __init__(self, animal_repository, index=None, interval=CATALOGUE_REFRESH_INTERVAL,
+                 full_interval=CATALOGUE_FULL_INTERVAL, max_pages=CATALOGUE_MAX_PAGES, types=('Cat', 'Dog')):
+        self.animal_repository = animal_repository
+        self.index = index if index is not None else CatalogueIndex()
+        self.interval = interval
+        self.full_interval = full_interval
+        self.max_pages = max_pages
+        self.types = types
+        self.last_full_crawl = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    """Starting the background thread and pointing the repository's searches at the index - nothing to do
+    when this process's thread is already running"""
+
+    def start(self):
+        with self._lock:
+            # a thread started before a fork is not running in the child
+            if self._thread is None or not self._thread.is_alive():
+                self.animal_repository.catalogue = self.index
+                self._thread = threading.Thread(target=self._run, name='catalogue-warmer', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    """One crawl - a full one when due, otherwise only animals published since the newest one we have"""
+
+    def crawl(self):
+        # with little of today's Petfinder budget left, searches need it more than the index does
+        if self.animal_repository.rate_limiter.budget_low():
+            log_event(logger, logging.WARNING, 'catalogue_crawl_skipped', reason='budget_low')
+            return 0
+        skipped = []
+        if self.last_full_crawl is None or time.time() - self.last_full_crawl >= self.full_interval:
+            animals = []
+            complete = True
+            for animal_type in self.types:
+                rest = {}
+                animals.extend(self.animal_repository.get_catalogue(animal_type, max_pages=self.max_pages,
+                                                                    skipped=skipped, rest=rest))
+                complete = complete and not self.capped(rest['pagination'])
+            if skipped:
+                log_event(logger, logging.WARNING, 'catalogue_crawl_incomplete', pages_skipped=len(skipped))
+                return 0
+            self.index.replace(animals, complete=complete)
+            self.last_full_crawl = time.time()
+            log_event(logger, logging.INFO, 'catalogue_crawled', animals=len(animals), complete=complete)
+            return len(animals)
+
+        after = self.index.latest_published()
+        # read in full before the index is touched - the next update starts after the newest animal it has
+        animals = [animal for animal_type in self.types
+                   for animal in self.animal_repository.get_catalogue(animal_type, after=after,
+                                                                      max_pages=self.max_pages, skipped=skipped)]
+        if skipped:
+            log_event(logger, logging.WARNING, 'catalogue_crawl_incomplete', pages_skipped=len(skipped))
+            return 0
+        changed = self.index.update(animals)
+        log_event(logger, logging.INFO, 'catalogue_updated', changed=changed)
+        return changed
+
+    """True when a crawl read fewer pages than there are - it stopped at max_pages, or at the pages a search
+    gets when the day's budget is low (see AnimalRepository.count_pages)"""
+
+    def capped(self, pagination):
+        pages = ceil(pagination['total_count'] / pagination['count_per_page'])
+        if self.animal_repository.rate_limiter.budget_low():
+            return pages > min(self.max_pages, LOW_BUDGET_MAX_PAGES)
+        return pages > self.max_pages
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.crawl()
+            except Exception:
+                # the index keeps its last good copy, once it gets too old searches go to Petfinder again
+                logger.exception('Catalogue crawl failed')
+            self._stop.wait(self.interval)
@@ -0,0 +1,60 @@
+import os
+
+from dotenv import load_dotenv
+
+"""App settings, read from the environment (or .env) when create_app() is called.
+
+DATABASE_URL overrides the MySQL database built from DATABASE_USER/DATABASE_PASSWORD/DATABASE_HOST, which is
+handy for trying the app against SQLite. The DB_POOL_* settings size SQLAlchemy's connection pool per worker
+process: a gunicorn worker with N threads wants DB_POOL_SIZE of about N.
+"""
+
+
+def database_url():
+    if os.getenv('DATABASE_URL'):
+        return os.getenv('DATABASE_URL')
+    user = os.getenv('DATABASE_USER')
+    password = os.getenv('DATABASE_PASSWORD')
+    host = os.getenv('DATABASE_HOST', 'localhost')
+    return f'mysql+pymysql://{user}:{password}@{host}/adoption'
+
+
+"""SQLAlchemy engine settings for the database url"""
+
+
+def engine_options(url):
+    options = {
+        # a connection MySQL has dropped is noticed and replaced when it is checked out, not on first query
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        # below MySQL's wait_timeout (8 hours by default, often much less on hosted MySQL)
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    }
+    # SQLite's pools have no overflow, the sizes only mean something for a database server
+    if not url.startswith('sqlite'):
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', '5'))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+        options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    return options
+
+
+def load_config():
+    load_dotenv()
+    url = database_url()
+    return {
+        'SQLALCHEMY_DATABASE_URI': url,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url),
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'secret key'),
+        # background crawler keeping a local copy of the catalogue for /adopt searches
+        'CATALOGUE_WARM': os.getenv('CATALOGUE_WARM') == '1',
+        # leaving pets that are already adopted out of /adopt results, see adopted.py
+        'ADOPTED_FILTER': os.getenv('ADOPTED_FILTER', '1') == '1',
+        # latency histograms and counters on /metrics
+        'METRICS_ENABLED': os.getenv('METRICS_ENABLED', '1') == '1',
+        # an empty LOG_FILE logs to stderr only. The file is rotated to app.log.1 ... once it reaches LOG_MAX_BYTES
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
+        'LOG_FILE': os.getenv('LOG_FILE', 'app.log'),
+        'LOG_MAX_BYTES': int(os.getenv('LOG_MAX_BYTES', str(10 * 2 ** 20))),
+        'LOG_BACKUPS': int(os.getenv('LOG_BACKUPS', '5')),
+        # where `python assets.py build` puts the fingerprinted static files, relative to the project folder
+        'ASSETS_DIR': os.getenv('ASSETS_DIR', 'build/assets'),
+    }
@@ -0,0 +1,63 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+
+"""One asyncio event loop per process, running in its own thread, for fetching the pages of searches.
+
+A new event loop per call (what asyncio.run() or an async Flask view gets) means nothing that belongs to a
+loop - like the async HTTP client and its open connections - outlives a request. Here the searches of every
+request fetch their pages on the same long-lived loop instead: the request's thread hands the coroutine over
+and waits, and while it waits on Petfinder the loop is free to fetch the pages of every other search. Only
+the fetching goes to the loop - the cache lookups, the caching and the rendering stay on the request's own
+thread, so a search answered from the cache never waits on the loop.
+"""
+
+
+class EventLoopThread:
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    """Starting the loop on first use - after the fork when running under gunicorn"""
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self.loop.run_forever, name='event-loop', daemon=True)
+                self._thread.start()
+        return self
+
+    """Running a coroutine on the loop and waiting for its result. The coroutine sees the calling thread's
+    context variables, which is where Flask keeps the current request and app"""
+
+    def run(self, coroutine):
+        self.start()
+        context = contextvars.copy_context()
+        result = concurrent.futures.Future()
+
+        def finished(task):
+            if task.cancelled():
+                result.cancel()
+            elif task.exception() is not None:
+                result.set_exception(task.exception())
+            else:
+                result.set_result(task.result())
+
+        def start_task():
+            # a task takes a copy of the context it is created in, here the caller's
+            self.loop.create_task(coroutine).add_done_callback(finished)
+
+        self.loop.call_soon_threadsafe(start_task, context=context)
+        return result.result()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._thread = None
@@ -2,6 +2,8 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, RadioField, BooleanField
 from wtforms.validators import DataRequired, InputRequired
 
+from utils import ANIMAL_TYPES, ANIMAL_SIZES
+
 
 class CustomerForm(FlaskForm):
     firstname = StringField("First name", validators=[DataRequired()])
@@ -26,8 +28,8 @@ class CustomerForm(FlaskForm):
 
 
 class PetSearchForm(FlaskForm):
-    cat_or_dog = RadioField('Are you looking for a cat or a dog?', choices=['Cat', 'Dog'], validators=[InputRequired()])
-    select_size = RadioField('Size of pet', choices=['Small', 'Medium', 'Large'], validators=[InputRequired()])
+    cat_or_dog = RadioField('Are you looking for a cat or a dog?', choices=ANIMAL_TYPES, validators=[InputRequired()])
+    select_size = RadioField('Size of pet', choices=ANIMAL_SIZES, validators=[InputRequired()])
     select_good_with_children = BooleanField('Good with children', default=False)
     select_good_with_cats = BooleanField('Good with other cats', default=False)
     select_good_with_dogs = BooleanField('Good with dogs', default=False)
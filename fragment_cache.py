@@ -0,0 +1,66 @@
+import os
+import threading
+from collections import OrderedDict
+
+"""Rendered bits of HTML kept by key, so a fragment that shows up on many pages is rendered once.
+
+Used for the pet cards of the /adopt results (see app.py): the same animals come up across many of the
+search form combinations, and a card only changes when the animal does. The cache belongs to one worker
+process and is bounded by the size of the fragments it holds (FRAGMENT_CACHE_BYTES), dropping the least
+recently used ones first.
+"""
+
+FRAGMENT_CACHE_BYTES = int(os.getenv('FRAGMENT_CACHE_BYTES', str(8 * 2 ** 20)))
+
+
+class FragmentCache:
+    def __init__(self, max_bytes=FRAGMENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._fragments)
+
+    """The fragment for key, rendered by render() when it is not cached. Two requests missing the same key at
+    once both render it - cheaper than making one wait for the other"""
+
+    def get(self, key, render):
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = render()
+        self.set(key, fragment)
+        return fragment
+
+    def set(self, key, fragment):
+        # characters rather than bytes, close enough for HTML that is mostly ASCII
+        size = len(fragment)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._fragments.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._fragments[key] = fragment
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, dropped = self._fragments.popitem(last=False)
+                self.bytes -= len(dropped)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': self.bytes}
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+"""gunicorn settings:  gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process imports wsgi.py itself (preload_app is off), so the app, its database pool and its
+Petfinder session are built after the fork. WEB_CONCURRENCY and WEB_THREADS set the processes and threads;
+DB_POOL_SIZE should be about WEB_THREADS.
+"""
+
+bind = os.getenv('BIND', '127.0.0.1:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('WEB_THREADS', '4'))
+worker_class = 'gthread'
+# slow Petfinder searches can take a while on a cold cache
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+preload_app = os.getenv('WEB_PRELOAD') == '1'
+
+
+def post_fork(server, worker):
+    # with --preload the app was built in the master, so its connections must not be shared by the workers
+    if preload_app:
+        from app import after_fork
+        from wsgi import app
+        after_fork(app)
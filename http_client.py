@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    # in requirements.txt but optional - without it searches fetch their pages on threads instead
+    httpx = None
+
+"""One pooled, keep-alive HTTP session for every Petfinder call.
+
+requests.get/requests.post open a new connection (TCP + TLS) on every call. A Session keeps connections
+open and reuses them, the adapter below also gives every call a timeout and retries 5xx answers.
+make_async_client() is the same for the async calls made on the event loop, on httpx.
+"""
+
+POOL_SIZE = int(os.getenv('PETFINDER_POOL_SIZE', '10'))
+# connections the async client may hold open - it serves every request of the process, not one at a time
+ASYNC_POOL_SIZE = int(os.getenv('PETFINDER_ASYNC_POOL_SIZE', '100'))
+CONNECT_TIMEOUT = float(os.getenv('PETFINDER_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('PETFINDER_READ_TIMEOUT', '10'))
+RETRIES = int(os.getenv('PETFINDER_RETRIES', '2'))
+BACKOFF_FACTOR = float(os.getenv('PETFINDER_BACKOFF_FACTOR', '0.2'))
+
+# 429 is not retried here - the rate limiter (rate_limit.py) backs off every worker instead of this one call
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    # requests has no session-wide timeout, so the adapter fills one in when the caller did not
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+"""Building the shared session - pool_size should be at least the number of pages fetched at once"""
+
+
+def make_session(pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    # the token POST is safe to repeat, so it is retried like the GETs
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False,
+                  # otherwise urllib3 waits out a 429's Retry-After itself, holding the worker thread
+                  respect_retry_after_header=False)
+    adapter = TimeoutHTTPAdapter((connect_timeout, read_timeout), pool_connections=pool_size,
+                                 pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+"""The async client - one per event loop, shared by every request the loop is serving"""
+
+
+def make_async_client(pool_size=ASYNC_POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+    return httpx.AsyncClient(timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                             limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+
+"""Async request with the same 5xx retries and backoff as the session. With stream=True the body is left
+unread, for reading with response.aiter_bytes() - the caller closes it with response.aclose()"""
+
+
+async def request_with_retries(client, method, url, retries=RETRIES, backoff_factor=BACKOFF_FACTOR, stream=False,
+                               **kwargs):
+    for attempt in range(retries + 1):
+        # what client.stream() does, without tying the response to a with block
+        response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        await response.aclose()
+        await asyncio.sleep(backoff_factor * 2 ** attempt)
@@ -0,0 +1,186 @@
+import codecs
+import json
+
+"""Reading one array out of a JSON object while it is still downloading.
+
+A Petfinder page is {"animals": [...], "pagination": {...}}. Instead of response.json(), which needs the
+whole body and builds the whole tree, iter_array_items() hands out the array items one at a time as the
+chunks arrive. The other top-level values (pagination) are small and are put in the `rest` dict.
+aiter_array_items() is the same over the chunks of an async response. Both feed an ArrayItemParser, which
+parses as far as the chunks given so far go and carries on from there with the next one.
+"""
+
+WHITESPACE = ' \t\n\r'
+
+
+class NeedMoreData(Exception):
+    # the buffer ends before the next value does - nothing has been consumed, feed() another chunk and retry
+    pass
+
+
+class JSONStreamReader:
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def feed(self, chunk):
+        # what has been parsed already is dropped, so the buffer never holds more than about one item
+        self._buffer = self._buffer[self._pos:] + (self._text.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        self._pos = 0
+
+    """The body has been read to the end"""
+
+    def close(self):
+        self._buffer = self._buffer[self._pos:] + self._text.decode(b'', final=True)
+        self._pos = 0
+        self._eof = True
+
+    def _more(self):
+        if not self._eof:
+            raise NeedMoreData()
+
+    def peek(self):
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+            self._pos += 1
+        if self._pos < len(self._buffer):
+            return self._buffer[self._pos]
+        self._more()
+        return ''
+
+    def next_char(self):
+        char = self.peek()
+        if not char:
+            raise ValueError('Unexpected end of JSON stream')
+        self._pos += 1
+        return char
+
+    def expect(self, char):
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f'Expected {char!r} in JSON stream, found {found!r}')
+
+    """Reading the separator after a value - returns True at the closing bracket, False after a comma"""
+
+    def at_end(self, closing):
+        found = self.next_char()
+        if found not in (',', closing):
+            raise ValueError(f'Expected \',\' or {closing!r} in JSON stream, found {found!r}')
+        return found == closing
+
+    """Decoding the next complete value"""
+
+    def value(self):
+        self.peek()
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            # a number at the very end of the buffer may still have digits to come
+            if end < len(self._buffer) or self._eof:
+                self._pos = end
+                return value
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+        raise NeedMoreData()
+
+
+"""The items of the top-level array `key`, as far as the chunks fed so far go - other top-level values go
+into `rest`. Each step below reads one thing and says which step comes next, so when a chunk runs out
+part way through a value the parse carries on from that step once the next chunk has been fed"""
+
+
+class ArrayItemParser:
+    def __init__(self, key, rest=None):
+        self.key = key
+        self.rest = rest if rest is not None else {}
+        self._reader = JSONStreamReader()
+        self._step = self._start
+        self._member = None
+
+    @property
+    def done(self):
+        return self._step is None
+
+    """Parsing one more chunk - returns the items it completed"""
+
+    def feed(self, chunk):
+        self._reader.feed(chunk)
+        return self._parse()
+
+    """The end of the body - returns the last items, a ValueError when the JSON stops part way through"""
+
+    def close(self):
+        self._reader.close()
+        return self._parse()
+
+    def _parse(self):
+        items = []
+        try:
+            while self._step is not None:
+                self._step = self._step(items)
+        except NeedMoreData:
+            pass
+        return items
+
+    def _start(self, items):
+        self._reader.expect('{')
+        return self._first_member
+
+    def _first_member(self, items):
+        return None if self._reader.peek() == '}' else self._member_name
+
+    def _member_name(self, items):
+        self._member = self._reader.value()
+        return self._colon
+
+    def _colon(self, items):
+        self._reader.expect(':')
+        return self._member_value
+
+    def _member_value(self, items):
+        if self._member == self.key and self._reader.peek() == '[':
+            self._reader.next_char()
+            return self._first_item
+        self.rest[self._member] = self._reader.value()
+        return self._after_member
+
+    def _first_item(self, items):
+        if self._reader.peek() == ']':
+            self._reader.next_char()
+            return self._after_member
+        return self._item
+
+    def _item(self, items):
+        items.append(self._reader.value())
+        return self._after_item
+
+    def _after_item(self, items):
+        return self._after_member if self._reader.at_end(']') else self._item
+
+    def _after_member(self, items):
+        return None if self._reader.at_end('}') else self._member_name
+
+
+"""Yielding the items of the top-level array `key` one by one, other top-level values go into `rest`"""
+
+
+def iter_array_items(chunks, key, rest=None):
+    parser = ArrayItemParser(key, rest)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    yield from parser.close()
+
+
+async def aiter_array_items(chunks, key, rest=None):
+    parser = ArrayItemParser(key, rest)
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+        if parser.done:
+            return
+    for item in parser.close():
+        yield item
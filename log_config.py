@@ -0,0 +1,120 @@
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+
+"""Logging for the app: request threads only put records on a queue, one background thread writes them.
+
+configure_logging() is called by create_app(), not when a module is imported, and again after a fork (the
+writer thread does not survive it). Records are formatted as "time level logger event key=value ...":
+log_event() adds the key/value fields, and skips the call entirely when the level is off. The file is
+rotated by size (LOG_MAX_BYTES in config.py), and anything that looks like a secret - access tokens, the
+API secret, passwords in database urls - is masked before it is written.
+"""
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+REDACTED = '[redacted]'
+
+SECRET_PATTERNS = [
+    # "access_token": "...", access_token=..., client_secret=..., password=...
+    re.compile(r'''(?i)(['"]?(?:access_token|refresh_token|client_secret|api_secret|password|secret_key)['"]?'''
+               r'''\s*[:=]\s*['"]?)[^'"&\s,}]+'''),
+    re.compile(r'(?i)(bearer\s+)[\w\-.~+/]+=*'),
+    # user:password@host in database urls
+    re.compile(r'(://[^:/@\s]+:)[^@/\s]+(@)'),
+]
+
+
+"""Masking the secrets in one formatted line"""
+
+
+def redact(text):
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(lambda match: match.group(1) + REDACTED + (match.group(2) if pattern.groups > 1 else ''),
+                           text)
+    return text
+
+
+class StderrHandler(logging.StreamHandler):
+    # looks sys.stderr up on every write, so a stderr replaced later on (test runners, daemons) is followed
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class KeyValueFormatter(logging.Formatter):
+    # fields given to log_event() go after the message, strings with spaces quoted
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={self._value(value)}' for key, value in fields.items())
+        return redact(line)
+
+    @staticmethod
+    def _value(value):
+        text = str(value)
+        return f'"{text}"' if not text or ' ' in text or '"' in text else text
+
+
+"""Logging one event with key/value fields - nothing is formatted, or even built, when the level is off"""
+
+
+def log_event(logger, level, event, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields}, stacklevel=2)
+
+
+_listener = None
+
+
+"""Sending every record to a queue, written to the rotating file (and stderr) by a background thread.
+Calling it again - after a fork, or from another create_app() - replaces the previous setup"""
+
+
+def configure_logging(level='INFO', path='app.log', max_bytes=10 * 2 ** 20, backups=5, stream=True):
+    global _listener
+    stop_logging()
+    formatter = KeyValueFormatter(FORMAT)
+    handlers = []
+    if path:
+        handlers.append(logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                             encoding='utf-8', delay=True))
+    if stream:
+        handlers.append(StderrHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+"""Writing out what is still queued and stopping the writer thread"""
+
+
+def stop_logging():
+    global _listener
+    root = logging.getLogger()
+    # nothing would read the queue any more
+    for handler in [handler for handler in root.handlers if isinstance(handler, logging.handlers.QueueHandler)]:
+        root.removeHandler(handler)
+    if _listener is None:
+        return
+    try:
+        _listener.stop()
+    except RuntimeError:
+        # after a fork the thread is gone, only its handlers are left to close
+        pass
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -0,0 +1,299 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+from flask import request
+from jinja2 import Template
+from sqlalchemy import event
+
+"""Latency histograms and counters for the app, shown on /metrics in Prometheus' text format.
+
+instrument_app() - called by create_app() unless METRICS_ENABLED is off - times every view, template
+render, database query and the repository methods in REPOSITORY_METHODS, and counts the Petfinder calls
+and database queries each request makes. With metrics off none of it is hooked in, so nothing is left on
+the request path. The numbers belong to one worker process: Prometheus scrapes each worker (or sums them).
+Figures the app keeps anyway - search cache and pet card hits, single-flight and rate limiter counts - are
+read when /metrics is scraped rather than counted twice.
+"""
+
+# seconds, from a cached search (well under a millisecond) to a slow crawl of Petfinder
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Petfinder calls or database queries made by one request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+REPOSITORY_METHODS = {
+    'AnimalRepository': ('get_token', 'search', 'load_search', 'get_animal', 'authorised_get', 'authorised_get_async',
+                         'request_token', 'get_page', 'get_page_async', 'get_all_pages_async', 'rank_animals',
+                         'age_check'),
+    'CustomerRepository': ('customer_adopt', 'get_customers_page'),
+}
+# the methods that each make one call to Petfinder
+UPSTREAM_METHODS = ('authorised_get', 'authorised_get_async', 'request_token')
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket (not cumulative), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(label_values, list(counts), total, count)
+                      for label_values, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in series:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', dict(labels, le=bound), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+    def render(self):
+        return render_family(self.name, 'histogram', self.help_text, self.samples())
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return render_family(self.name, 'counter', self.help_text,
+                             ((self.name, dict(zip(self.labels, label_values)), value)
+                              for label_values, value in values))
+
+
+"""One metric family in the text format: HELP and TYPE lines, then a line per sample"""
+
+
+def render_family(name, metric_type, help_text, samples):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    for sample_name, labels, value in samples:
+        label_text = ','.join(f'{key}="{escape(value)}"' for key, value in labels.items())
+        lines.append(f'{sample_name}{{{label_text}}} {value}' if label_text else f'{sample_name} {value}')
+    return '\n'.join(lines)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    # what one request has done so far - shared with the event loop and page fetching threads through _request
+    __slots__ = ('start', 'token', 'upstream_calls', 'db_queries')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.token = None
+        self.upstream_calls = 0
+        self.db_queries = 0
+
+
+_request = contextvars.ContextVar('request_stats', default=None)
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = Histogram('pawsome_request_seconds', 'Time to answer a request, by view',
+                                  ('endpoint', 'method', 'status'))
+        self.renders = Histogram('pawsome_render_seconds', 'Time to render a template', ('template',))
+        self.calls = Histogram('pawsome_repository_seconds', 'Time spent in a repository method',
+                               ('repository', 'method'))
+        self.queries = Histogram('pawsome_db_query_seconds', 'Time of one database query')
+        self.upstream_per_request = Histogram('pawsome_petfinder_calls_per_request',
+                                              'Petfinder calls made by one request', ('endpoint',), COUNT_BUCKETS)
+        self.queries_per_request = Histogram('pawsome_db_queries_per_request',
+                                             'Database queries made by one request', ('endpoint',), COUNT_BUCKETS)
+        self.errors = Counter('pawsome_repository_errors_total', 'Repository calls that raised',
+                              ('repository', 'method'))
+        # functions returning the text of metric families read at scrape time
+        self.collectors = []
+
+    def render(self):
+        families = [self.requests, self.renders, self.calls, self.queries, self.upstream_per_request,
+                    self.queries_per_request, self.errors]
+        texts = [family.render() for family in families] + [collect() for collect in self.collectors]
+        return '\n'.join(texts) + '\n'
+
+    """Wrapping the named methods of one repository object (not its class) - other instances, and the
+    app with metrics off, are left alone"""
+
+    def instrument(self, repository, methods):
+        repository_name = type(repository).__name__
+        for method_name in methods:
+            method = getattr(repository, method_name, None)
+            if method is not None:
+                setattr(repository, method_name, self._timed(method, repository_name, method_name))
+
+    def _timed(self, method, repository_name, method_name):
+        upstream = method_name in UPSTREAM_METHODS
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                except BaseException:
+                    self.errors.inc(repository_name, method_name)
+                    raise
+                finally:
+                    self._observe_call(start, repository_name, method_name, upstream)
+            return timed_async
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except BaseException:
+                self.errors.inc(repository_name, method_name)
+                raise
+            finally:
+                self._observe_call(start, repository_name, method_name, upstream)
+        return timed
+
+    def _observe_call(self, start, repository_name, method_name, upstream):
+        self.calls.observe(time.perf_counter() - start, repository_name, method_name)
+        if upstream:
+            stats = _request.get()
+            if stats is not None:
+                stats.upstream_calls += 1
+
+
+"""Hooking the metrics into the app - views, templates, database queries and the repositories"""
+
+
+def instrument_app(app, engines):
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+    animal_repository = app.extensions['animal_repository']
+
+    @app.before_request
+    def start_request():
+        stats = RequestStats()
+        stats.token = _request.set(stats)
+
+    # also called for the 500 page of a view that raised
+    @app.after_request
+    def finish_request(response):
+        stats = _request.get()
+        if stats is not None:
+            endpoint = request.endpoint or 'unknown'
+            metrics.requests.observe(time.perf_counter() - stats.start, endpoint, request.method,
+                                     str(response.status_code))
+            metrics.upstream_per_request.observe(stats.upstream_calls, endpoint)
+            metrics.queries_per_request.observe(stats.db_queries, endpoint)
+            _request.reset(stats.token)
+        return response
+
+    metrics.collectors += [
+        stats_collector('pawsome_search_cache', 'Search cache lookups by result, and evictions',
+                        lambda: with_hit_ratio(animal_repository.search_cache.stats()),
+                        gauges={'hit_ratio': 'Share of search cache lookups answered from the cache'}),
+        stats_collector('pawsome_single_flight', 'Searches fetched, and searches that waited on another fetch',
+                        lambda: animal_repository.search_cache.single_flight.stats()),
+        stats_collector('pawsome_rate_limit', 'Petfinder calls throttled or refused by the rate limiter',
+                        lambda: animal_repository.rate_limiter.stats(),
+                        gauges={'remaining_today': 'Petfinder calls left today'}),
+        stats_collector('pawsome_pet_cards', 'Rendered pet card lookups by result, and evictions',
+                        lambda: app.extensions['pet_cards'].stats(),
+                        gauges={'bytes': 'Size of the rendered pet cards kept'}),
+    ]
+
+    app.jinja_env.template_class = timed_template(metrics)
+    for engine in engines:
+        watch_queries(engine, metrics)
+    for repository in app.extensions['customer_repository'], animal_repository:
+        metrics.instrument(repository, REPOSITORY_METHODS[type(repository).__name__])
+    return metrics
+
+
+def timed_template(metrics):
+    class TimedTemplate(Template):
+        def render(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                metrics.renders.observe(time.perf_counter() - start, self.name or 'string')
+    return TimedTemplate
+
+
+def watch_queries(engine, metrics):
+    # the start time goes on the execution context, which belongs to this one query
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        finished(context)
+
+    @event.listens_for(engine, 'handle_error')
+    def failed(error_context):
+        # a failed query never gets to after_cursor_execute, it is counted with the time it took to fail
+        finished(error_context.execution_context)
+
+    def finished(context):
+        start = getattr(context, 'metrics_start', None)
+        if start is None:
+            return
+        metrics.queries.observe(time.perf_counter() - start)
+        context.metrics_start = None
+        stats = _request.get()
+        if stats is not None:
+            stats.db_queries += 1
+
+
+"""Reporting a stats() dict the app already keeps as counters - and as gauges for the names in gauges,
+a dict of name -> help text"""
+
+
+def stats_collector(name, help_text, stats, gauges=None):
+    gauges = gauges or {}
+
+    def collect():
+        values = stats()
+        counters = [(f'{name}_total', {'result': key}, value) for key, value in values.items()
+                    if key not in gauges and value is not None]
+        texts = [render_family(f'{name}_total', 'counter', help_text, counters)]
+        for key, gauge_help in gauges.items():
+            if values.get(key) is not None:
+                texts.append(render_family(f'{name}_{key}', 'gauge', gauge_help, [(f'{name}_{key}', {}, values[key])]))
+        return '\n'.join(texts)
+    return collect
+
+
+def with_hit_ratio(stats):
+    lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+    return dict(stats, hit_ratio=round((stats['hits'] + stats['stale_hits']) / lookups, 4) if lookups else None)
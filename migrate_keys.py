@@ -0,0 +1,255 @@
+import argparse
+import logging
+import sys
+import time
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, and_, func, \
+    inspect, or_, select, text
+
+from app import create_app
+from bulk import insert_ignore
+from config import engine_options
+from log_config import log_event
+from utils import CUSTOMER_KEY, CustomerAdoptions, Customers, db
+
+"""Moving a database made with the old VARCHAR customer ids (time + email) to numbered ones, in batches,
+while the site keeps running.
+
+copy       makes customers_new and customer_adoptions_new with the new keys and copies the rows over a batch
+           at a time, oldest customer first, so the new ids follow the order customers joined in. The old
+           id is kept in customers.legacy_id. It can be stopped and run again, and is run while the old
+           version of the site is still up: customers it adds are copied by later batches.
+cutover    with the site stopped: copies whatever was added since, checks the row counts and swaps the
+           tables over (in one RENAME TABLE on MySQL). The old tables stay as customers_old and
+           customer_adoptions_old. Then start the new version.
+drop-old   drops the old tables and customers.legacy_id once the new version has been running for a while.
+
+Run from the project folder:
+    python migrate_keys.py copy [--batch-size 5000]
+    python migrate_keys.py cutover
+    python migrate_keys.py drop-old
+"""
+
+MIGRATION_BATCH_SIZE = 5000
+NEW_CUSTOMERS = 'customers_new'
+NEW_ADOPTIONS = 'customer_adoptions_new'
+# the customer columns other than the key, copied as they are
+COPIED = ('firstname', 'lastname', 'phone', 'email', 'address', 'city_name', 'state', 'zipcode', 'createdat')
+
+logger = logging.getLogger(__name__)
+
+
+def column(table, name):
+    # by name whatever its case - MySQL keeps the case it was created with (zipCode in adoption_db.sql)
+    return next(column for column in table.c if column.name.lower() == name)
+
+
+def columns(table, names):
+    return [column(table, name) for name in names]
+
+
+class Tables:
+    # the old tables (as they are in the database) and the new ones
+    def __init__(self, connection):
+        self.dialect = connection.dialect.name
+        metadata = MetaData()
+        self.customers = Table('customers', metadata, autoload_with=connection)
+        self.adoptions = Table('customer_adoptions', metadata, autoload_with=connection)
+        self.new_customers = Customers.__table__.to_metadata(metadata, name=NEW_CUSTOMERS)
+        self.new_customers.append_column(Column('legacy_id', String(255)))
+        if self.dialect == 'sqlite':
+            # index names are per database on SQLite: the old table has these, they are made at cutover
+            self.new_customers.indexes.clear()
+        Index(f'{NEW_CUSTOMERS}_legacy_id', self.new_customers.c.legacy_id, unique=True)
+        # CreatedAt is only there to copy in databases made from adoption_db.sql, the new table always has it
+        created_at = [name for name in (column.name for column in self.adoptions.c) if name.lower() == 'createdat']
+        self.adoption_columns = ['pet_id', 'customer_id'] + [name.lower() for name in created_at]
+        self.new_adoptions = Table(
+            NEW_ADOPTIONS, metadata,
+            Column('pet_id', Integer, primary_key=True, autoincrement=False),
+            Column('customer_id', CUSTOMER_KEY, ForeignKey(f'{NEW_CUSTOMERS}.id')),
+            Column('CreatedAt', DateTime, server_default=func.now()))
+        if self.dialect != 'sqlite':
+            Index('customer_adoptions_created_at', self.new_adoptions.c.CreatedAt)
+
+    # the columns of an adoption to copy, with the customer's new id
+    def adoption_source(self, new_customers):
+        return [new_customers.c.id if name == 'customer_id' else column(self.adoptions, name)
+                for name in self.adoption_columns]
+
+    def migrated(self):
+        # the old id column is a string, the new one a number
+        return not isinstance(self.customers.c.id.type, String)
+
+
+def tables(connection):
+    result = Tables(connection)
+    if result.migrated():
+        raise RuntimeError('customers already has numbered ids')
+    return result
+
+
+"""Copying customers oldest first from where the last batch (or the last run) stopped - returns the number
+of rows copied"""
+
+
+def copy_customers(connection, tables, batch_size=MIGRATION_BATCH_SIZE, progress=None):
+    old, new = tables.customers, tables.new_customers
+    old_created, new_created = column(old, 'createdat'), column(new, 'createdat')
+    # the last customer copied - the newest row of the new table
+    last_copied = (select(new_created, new.c.legacy_id).where(new.c.legacy_id.is_not(None))
+                   .order_by(new.c.id.desc()).limit(1))
+    last = connection.execute(last_copied).first()
+    copied = 0
+    while True:
+        # rows without a CreatedAt are left for the cutover
+        query = select(old.c.id, *columns(old, COPIED)).where(old_created.is_not(None)).order_by(old_created, old.c.id)
+        if last is not None:
+            query = query.where(or_(old_created > last[0], and_(old_created == last[0], old.c.id > last[1])))
+        batch = query.limit(batch_size).subquery()
+        # read back in order, so the ids the database hands out follow CreatedAt
+        inserted = connection.execute(insert_ignore(new).from_select(
+            [new.c.legacy_id, *columns(new, COPIED)],
+            select(batch).order_by(column(batch, 'createdat'), batch.c.id))).rowcount
+        connection.commit()
+        copied += max(inserted, 0)
+        if progress is not None:
+            progress('customers', copied)
+        previous, last = last, connection.execute(last_copied).first()
+        if last == previous:
+            return copied
+
+
+"""Copying adoptions in pet_id order, with the customers' new ids. An adoption of a customer that is not
+copied yet is left for the cutover"""
+
+
+def copy_adoptions(connection, tables, batch_size=MIGRATION_BATCH_SIZE, progress=None):
+    old, new, customers = tables.adoptions, tables.new_adoptions, tables.new_customers
+    last = connection.execute(select(func.max(new.c.pet_id))).scalar()
+    copied = 0
+    while True:
+        query = select(old.c.pet_id).order_by(old.c.pet_id).limit(batch_size)
+        if last is not None:
+            query = query.where(old.c.pet_id > last)
+        pet_ids = connection.execute(query).scalars().all()
+        if not pet_ids:
+            return copied
+        rows = (select(*tables.adoption_source(customers))
+                .select_from(old)
+                .join(customers, customers.c.legacy_id == old.c.customer_id)
+                .where(old.c.pet_id.between(pet_ids[0], pet_ids[-1])))
+        inserted = connection.execute(insert_ignore(new).from_select(
+            columns(new, tables.adoption_columns), rows)).rowcount
+        connection.commit()
+        last = pet_ids[-1]
+        copied += max(inserted, 0)
+        if progress is not None:
+            progress('adoptions', copied)
+
+
+def copy(connection, batch_size=MIGRATION_BATCH_SIZE, progress=None):
+    migration = tables(connection)
+    migration.new_customers.metadata.create_all(connection, tables=[migration.new_customers,
+                                                                    migration.new_adoptions])
+    connection.commit()
+    return (copy_customers(connection, migration, batch_size, progress),
+            copy_adoptions(connection, migration, batch_size, progress))
+
+
+"""Copying what the batches missed - rows added after they went past, or with no CreatedAt - and swapping
+the tables. The site must be stopped, nothing may be written to the old tables from here on"""
+
+
+def cutover(connection, batch_size=MIGRATION_BATCH_SIZE):
+    migration = tables(connection)
+    old, new = migration.customers, migration.new_customers
+    copy_customers(connection, migration, batch_size)
+    missed = (select(old.c.id, *columns(old, COPIED)).outerjoin(new, new.c.legacy_id == old.c.id)
+              .where(new.c.id.is_(None)).order_by(column(old, 'createdat'), old.c.id))
+    connection.execute(insert_ignore(new).from_select([new.c.legacy_id, *columns(new, COPIED)], missed))
+
+    old_adoptions, new_adoptions = migration.adoptions, migration.new_adoptions
+    missed = (select(*migration.adoption_source(new))
+              .select_from(old_adoptions)
+              .outerjoin(new, new.c.legacy_id == old_adoptions.c.customer_id)
+              .outerjoin(new_adoptions, new_adoptions.c.pet_id == old_adoptions.c.pet_id)
+              .where(new_adoptions.c.pet_id.is_(None)))
+    connection.execute(insert_ignore(new_adoptions).from_select(columns(new_adoptions, migration.adoption_columns),
+                                                                missed))
+    connection.commit()
+
+    for old_table, new_table in ((old, new), (old_adoptions, new_adoptions)):
+        before, after = (connection.execute(select(func.count()).select_from(table)).scalar()
+                         for table in (old_table, new_table))
+        if before != after:
+            raise RuntimeError(f'{new_table.name} has {after} rows, {old_table.name} {before} - '
+                               f'was the site still writing?')
+
+    if migration.dialect == 'mysql':
+        # one statement, so nothing sees the tables half swapped
+        connection.execute(text('RENAME TABLE customers TO customers_old, customers_new TO customers, '
+                                'customer_adoptions TO customer_adoptions_old, '
+                                'customer_adoptions_new TO customer_adoptions'))
+    else:
+        for name in ('customers', 'customer_adoptions'):
+            connection.execute(text(f'ALTER TABLE {name} RENAME TO {name}_old'))
+            connection.execute(text(f'ALTER TABLE {name}_new RENAME TO {name}'))
+        # the indexes move over to the new tables under their own names
+        for model in Customers, CustomerAdoptions:
+            for index in inspect(connection).get_indexes(f'{model.__tablename__}_old'):
+                connection.execute(text(f'DROP INDEX {index["name"]}'))
+            for index in model.__table__.indexes:
+                index.create(connection)
+    connection.commit()
+
+
+"""Dropping the old tables, and the old ids the copy needed - the legacy_id column and its index"""
+
+
+def drop_old(connection):
+    migration = Tables(connection)
+    if not migration.migrated():
+        raise RuntimeError('run the cutover first')
+    for name in ('customer_adoptions_old', 'customers_old'):
+        connection.execute(text(f'DROP TABLE IF EXISTS {name}'))
+    if any(index['name'] == f'{NEW_CUSTOMERS}_legacy_id' for index in inspect(connection).get_indexes('customers')):
+        on_table = ' ON customers' if migration.dialect == 'mysql' else ''
+        connection.execute(text(f'DROP INDEX {NEW_CUSTOMERS}_legacy_id{on_table}'))
+    # only once its index is gone - SQLite (3.35 and later) will not drop an indexed column
+    if 'legacy_id' in migration.customers.c:
+        connection.execute(text('ALTER TABLE customers DROP COLUMN legacy_id'))
+    connection.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move customers from VARCHAR ids to numbered ids')
+    parser.add_argument('command', choices=('copy', 'cutover', 'drop-old'))
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument('--database-url', help='database to use instead of the one configured for the app')
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.database_url:
+        config = {'SQLALCHEMY_DATABASE_URI': args.database_url,
+                  'SQLALCHEMY_ENGINE_OPTIONS': engine_options(args.database_url)}
+    app = create_app(config)
+    start = time.perf_counter()
+
+    def progress(table, rows):
+        log_event(logger, logging.INFO, 'migrate_keys_progress', table=table, rows=rows,
+                  seconds=round(time.perf_counter() - start, 1))
+
+    with app.app_context(), db.engine.connect() as connection:
+        if args.command == 'copy':
+            customers, adoptions = copy(connection, args.batch_size, progress)
+            log_event(logger, logging.INFO, 'migrate_keys_copied', customers=customers, adoptions=adoptions)
+        elif args.command == 'cutover':
+            cutover(connection, args.batch_size)
+            log_event(logger, logging.INFO, 'migrate_keys_cutover', seconds=round(time.perf_counter() - start, 1))
+        else:
+            drop_old(connection)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import os
+from math import ceil
+
+"""Splitting a list of results into pages, so one response never carries the whole search."""
+
+RESULTS_PAGE_SIZE = int(os.getenv('RESULTS_PAGE_SIZE', '24'))
+
+
+class Page:
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(ceil(total / per_page), 1)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+
+"""Returning one page of results - page numbers outside the range are moved to the first or last page"""
+
+
+def paginate(items, page, per_page=RESULTS_PAGE_SIZE):
+    total = len(items)
+    page = min(max(page, 1), max(ceil(total / per_page), 1))
+    start = (page - 1) * per_page
+    return Page(items[start:start + per_page], page, per_page, total)
@@ -0,0 +1,62 @@
+from urllib.parse import urlencode
+
+"""Building Petfinder /animals search urls from the search form choices.
+
+Only filters that are set go into the query: an unticked box means "don't care", so it is left out rather
+than sent as false, which would ask Petfinder for animals that are *not* good with children. Age, sort order
+and a published `after` date can be pushed to Petfinder too (the catalogue crawler asks for the newest
+animals first). Values are url-encoded, lists are sent comma separated as Petfinder expects.
+"""
+
+# sort orders Petfinder accepts
+SORTS = ('recent', '-recent', 'distance', '-distance', 'random')
+
+
+class AnimalQuery:
+    # query parameter order, which keeps urls (and their cache keys) the same for the same choices
+    PARAMS = ('type', 'size', 'age', 'good_with_children', 'good_with_dogs', 'good_with_cats', 'house_trained',
+              'special_needs', 'status', 'sort', 'after', 'limit')
+
+    def __init__(self, **filters):
+        unknown = set(filters) - set(self.PARAMS)
+        if unknown:
+            raise ValueError(f'Unknown Petfinder search parameters: {", ".join(sorted(unknown))}')
+        if filters.get('sort') is not None and filters['sort'] not in SORTS:
+            raise ValueError(f'Unknown Petfinder sort order: {filters["sort"]}')
+        self.filters = filters
+
+    """The query for the search form choices - only ticked boxes become filters"""
+
+    @classmethod
+    def from_animal(cls, animal_data, status='adoptable', limit=100):
+        return cls(type=animal_data.cat_or_dog, size=animal_data.select_size,
+                   good_with_children=animal_data.select_good_with_children or None,
+                   good_with_dogs=animal_data.select_good_with_dogs or None,
+                   good_with_cats=animal_data.select_good_with_cats or None,
+                   house_trained=animal_data.select_house_trained or None,
+                   special_needs=animal_data.select_special_needs or None,
+                   status=status, limit=limit)
+
+    """A copy with some filters changed - a filter set to None is taken out"""
+
+    def replace(self, **filters):
+        return AnimalQuery(**dict(self.filters, **filters))
+
+    def params(self):
+        params = []
+        for name in self.PARAMS:
+            value = self.filters.get(name)
+            if value is None or value == '':
+                continue
+            if isinstance(value, bool):
+                value = str(value).lower()
+            elif isinstance(value, (list, tuple)):
+                value = ','.join(str(item) for item in value)
+            params.append((name, str(value)))
+        return params
+
+    def query_string(self):
+        return urlencode(self.params(), safe=',')
+
+    def url(self, api_url):
+        return f'{api_url}/animals?{self.query_string()}'
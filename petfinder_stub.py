@@ -0,0 +1,246 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil
+from urllib.parse import urlparse, parse_qs
+
+"""A local stand-in for the Petfinder API, used by the tests and the benchmarks.
+
+It serves the three endpoints the app uses (token, animal search, single animal), counts every call,
+and can add latency so round trips cost something like they do against api.petfinder.com.
+"""
+
+AGES = ['Baby', 'Young', 'Adult', 'Senior']
+SIZES = ['Small', 'Medium', 'Large']
+TYPES = ['Cat', 'Dog']
+# search parameters for the yes/no fields, and where they are in an animal
+BOOLEAN_FILTERS = {'good_with_children': ('environment', 'children'), 'good_with_dogs': ('environment', 'dogs'),
+                   'good_with_cats': ('environment', 'cats'), 'house_trained': ('attributes', 'house_trained'),
+                   'special_needs': ('attributes', 'special_needs')}
+
+
+"""Building one fake animal shaped like a Petfinder record (including the fields the app never uses)"""
+
+
+def make_animal(animal_id, rng=None):
+    rng = rng or random.Random(animal_id)
+    animal_type = TYPES[animal_id % 2]
+    return {
+        'id': animal_id,
+        'organization_id': f'NJ{animal_id % 500}',
+        'url': f'https://www.petfinder.com/{animal_type.lower()}/pet-{animal_id}',
+        'type': animal_type,
+        'species': animal_type,
+        'breeds': {'primary': rng.choice(['Tabby', 'Labrador', 'Beagle', 'Siamese']), 'secondary': None,
+                   'mixed': rng.random() < 0.5, 'unknown': False, 'species': animal_type},
+        'colors': {'primary': 'Black', 'secondary': None, 'tertiary': None},
+        'age': rng.choice(AGES),
+        'gender': rng.choice(['Male', 'Female']),
+        'size': SIZES[(animal_id // 2) % 3],
+        'coat': 'Short',
+        'attributes': {'spayed_neutered': True, 'house_trained': rng.random() < 0.5, 'declawed': False,
+                       'special_needs': rng.random() < 0.1, 'shots_current': True},
+        'environment': {'children': rng.random() < 0.5, 'dogs': rng.random() < 0.5, 'cats': rng.random() < 0.5},
+        'tags': ['Friendly', 'Affectionate', 'Playful'],
+        'name': f'Pet {animal_id}',
+        'description': 'A lovely animal looking for a home. ' * 3,
+        'organization_animal_id': None,
+        'photos': [{size: f'https://photos.example/{animal_id}/{n}/{size}.jpg'
+                    for size in ('small', 'medium', 'large', 'full')} for n in range(rng.randint(0, 4))],
+        'primary_photo_cropped': None,
+        'videos': [],
+        'status': 'adoptable',
+        'status_changed_at': f'2022-11-01T10:{animal_id // 60 % 60:02d}:{animal_id % 60:02d}+0000',
+        'published_at': f'2022-11-01T10:{animal_id // 60 % 60:02d}:{animal_id % 60:02d}+0000',
+        'distance': None,
+        'contact': {'email': 'shelter@example.org', 'phone': '555-0100',
+                    'address': {'address1': None, 'address2': None, 'city': 'Somewhere', 'state': 'NJ',
+                                'postcode': '07001', 'country': 'US'}},
+        '_links': {'self': {'href': f'/v2/animals/{animal_id}'}, 'type': {'href': f'/v2/types/{animal_type}'},
+                   'organization': {'href': f'/v2/organizations/nj{animal_id % 500}'}},
+    }
+
+
+class _QuietServer(ThreadingHTTPServer):
+    # clients that time out and hang up are expected in the tests, no need for a traceback
+    def handle_error(self, request, client_address):
+        pass
+
+
+class PetfinderStub:
+    def __init__(self, animal_count=250, latency=0.0, token_ttl=3600, error_rate=0.0, seed=0, rate_limit=None,
+                 daily_limit=None):
+        self.animals = [make_animal(animal_id) for animal_id in range(1, animal_count + 1)]
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.error_rate = error_rate
+        # search pages that always answer 503, to test a single failed page
+        self.fail_pages = set()
+        # quotas like Petfinder's - calls per second and per day, over them the answer is 429
+        self.rate_limit = rate_limit
+        self.daily_limit = daily_limit
+        self._windows = Counter()
+        self.random = random.Random(seed)
+        # number of calls per endpoint: 'token', 'animals' (search pages) and 'animal' (single record), and
+        # 'rejected' for calls answered 429 and 'failed' for the random 503s of error_rate
+        self.counts = Counter()
+        self.connections = 0
+        self.valid_tokens = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v2'
+
+    def start(self):
+        self._server = _QuietServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    """Forgetting every issued token, so the next authorised call gets a 401"""
+
+    def revoke_tokens(self):
+        with self._lock:
+            self.valid_tokens.clear()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    """Counting a call against the quotas - returns the rate-limit headers, and whether it is over a quota"""
+
+    def _quota(self):
+        with self._lock:
+            window = int(time.time())
+            self._windows[window] += 1
+            used_today = sum(self.counts[name] for name in ('token', 'animals', 'animal')) + 1
+            over_rate = self.rate_limit is not None and self._windows[window] > self.rate_limit
+            over_daily = self.daily_limit is not None and used_today > self.daily_limit
+            if over_rate or over_daily:
+                self.counts['rejected'] += 1
+        headers = {}
+        if self.daily_limit is not None:
+            headers = {'X-RateLimit-Limit': str(self.daily_limit),
+                       'X-RateLimit-Remaining': str(max(self.daily_limit - used_today, 0)),
+                       'X-RateLimit-Reset': '3600'}
+        if over_rate or over_daily:
+            headers['Retry-After'] = '1' if not over_daily else '3600'
+        return headers, over_rate or over_daily
+
+    def _issue_token(self):
+        with self._lock:
+            token = f'stub-token-{len(self.valid_tokens)}-{self.counts["token"]}'
+            self.valid_tokens.add(token)
+        return {'token_type': 'Bearer', 'expires_in': self.token_ttl, 'access_token': token}
+
+    def _search(self, query):
+        matches = self.animals
+        for param, field in (('type', 'type'), ('size', 'size'), ('age', 'age')):
+            if param in query:
+                wanted = {value.lower() for value in query[param][0].split(',')}
+                matches = [animal for animal in matches if animal[field].lower() in wanted]
+        for param, (group, field) in BOOLEAN_FILTERS.items():
+            if param in query:
+                wanted = query[param][0] == 'true'
+                matches = [animal for animal in matches if animal[group][field] == wanted]
+        if 'after' in query:
+            matches = [animal for animal in matches if animal['published_at'] > query['after'][0]]
+        if query.get('sort') == ['recent']:
+            matches = sorted(matches, key=lambda animal: animal['published_at'], reverse=True)
+        limit = int(query.get('limit', ['20'])[0])
+        page = int(query.get('page', ['1'])[0])
+        start = (page - 1) * limit
+        return {'animals': matches[start:start + limit],
+                'pagination': {'count_per_page': limit, 'total_count': len(matches), 'current_page': page,
+                               'total_pages': ceil(len(matches) / limit)}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body go out in separate writes, without this keep-alive calls wait on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _authorised(self):
+                token = self.headers.get('Authorization', '').replace('Bearer ', '')
+                with stub._lock:
+                    return token in stub.valid_tokens
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if urlparse(self.path).path != '/v2/oauth2/token':
+                    return self._reply(404, {'title': 'Not Found'})
+                headers, over_quota = stub._quota()
+                if over_quota:
+                    return self._reply(429, {'title': 'Too Many Requests'}, headers)
+                stub._count('token')
+                self._reply(200, stub._issue_token(), headers)
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                parsed = urlparse(self.path)
+                if stub.error_rate and stub.random.random() < stub.error_rate:
+                    stub._count('failed')
+                    return self._reply(503, {'title': 'Service Unavailable'})
+                if not self._authorised():
+                    return self._reply(401, {'title': 'Unauthorized'})
+                headers, over_quota = stub._quota()
+                if over_quota:
+                    return self._reply(429, {'title': 'Too Many Requests'}, headers)
+                if parsed.path == '/v2/animals':
+                    stub._count('animals')
+                    if int(parse_qs(parsed.query).get('page', ['1'])[0]) in stub.fail_pages:
+                        return self._reply(503, {'title': 'Service Unavailable'})
+                    return self._reply(200, stub._search(parse_qs(parsed.query)), headers)
+                if parsed.path.startswith('/v2/animals/'):
+                    stub._count('animal')
+                    animal_id = parsed.path.rsplit('/', 1)[1]
+                    for animal in stub.animals:
+                        if str(animal['id']) == animal_id:
+                            return self._reply(200, {'animal': animal}, headers)
+                    return self._reply(404, {'title': 'Not Found'})
+                self._reply(404, {'title': 'Not Found'})
+
+        return Handler
@@ -0,0 +1,26 @@
+import os
+from itertools import chain
+
+"""Ordering search results so senior animals are seen first.
+
+One pass over the results drops each animal into the bucket for its Petfinder age, the buckets are then
+chained in priority order. Nobody is left out: animals with an age missing from the priority list go last.
+"""
+
+# Petfinder age buckets, most wanted first - e.g. AGE_PRIORITY=Senior,Baby,Young,Adult
+AGE_PRIORITY = tuple(os.getenv('AGE_PRIORITY', 'Senior,Adult,Young,Baby').split(','))
+
+
+"""Animals in age priority order, keeping Petfinder's order within each age - an iterator when lazy is True"""
+
+
+def rank_by_age(animals, priority=AGE_PRIORITY, lazy=False):
+    buckets = {age: [] for age in priority}
+    others = []
+    # looking up the bound append once per bucket keeps the loop to one dict lookup and one call
+    appends = {age: bucket.append for age, bucket in buckets.items()}
+    append_other = others.append
+    for animal in animals:
+        appends.get(animal['age'], append_other)(animal)
+    ranked = chain(*buckets.values(), others)
+    return ranked if lazy else list(ranked)
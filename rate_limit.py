@@ -0,0 +1,140 @@
+import asyncio
+import os
+import threading
+import time
+
+from shared_store import LocalStore, store_call
+
+"""Keeping Petfinder calls inside the API key's limits (50 a second and 1000 a day by default).
+
+Every call takes a slot from the current one-second window and one from today's budget. The counters live
+in a store, so with a RedisStore all the workers share one budget. A call that finds this second full
+waits for the next one (up to max_wait), and a 429 from Petfinder stops every worker until its Retry-After
+has passed. Search pages past the first few, and the catalogue crawl, are low priority: they may only
+use part of each second, and none of the last low_budget calls of the day, so a search running short of
+budget still gets its first pages. Rate-limit headers, when Petfinder sends them, correct the daily count.
+"""
+
+RATE_LIMIT = int(os.getenv('PETFINDER_RATE_LIMIT', '50'))
+# 0 means no daily limit
+DAILY_LIMIT = int(os.getenv('PETFINDER_DAILY_LIMIT', '1000'))
+# calls left today below which searches only read their first pages
+LOW_BUDGET = int(os.getenv('PETFINDER_LOW_BUDGET', '100'))
+LOW_BUDGET_MAX_PAGES = int(os.getenv('PETFINDER_LOW_BUDGET_MAX_PAGES', '2'))
+# the longest a call waits for a free slot before giving up
+RATE_LIMIT_WAIT = float(os.getenv('PETFINDER_RATE_LIMIT_WAIT', '2'))
+
+NORMAL = 'normal'
+LOW = 'low'
+# share of each second low priority calls may use, the rest is kept for first pages and single animals
+LOW_PRIORITY_SHARE = 0.8
+DAY = 24 * 3600
+
+
+class RateLimitedError(ValueError):
+    # raised instead of making a call that would go over the limits, or after Petfinder answered 429
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    def __init__(self, store=None, rate=RATE_LIMIT, daily_limit=DAILY_LIMIT, low_budget=LOW_BUDGET,
+                 max_wait=RATE_LIMIT_WAIT, key='petfinder:rate'):
+        self.store = store if store is not None else LocalStore()
+        self.rate = rate
+        self.daily_limit = daily_limit
+        self.low_budget = low_budget
+        self.max_wait = max_wait
+        self.key = key
+        # calls that had to wait for a slot, and calls given up on
+        self.throttled = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    """Taking a slot for one call, waiting for one when this second is full. Raises RateLimitedError when
+    the wait would be too long or the day's budget is used up"""
+
+    def acquire(self, priority=NORMAL):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._try_acquire(priority)
+            if wait is None:
+                return
+            self._wait_or_give_up(wait, deadline)
+            time.sleep(wait)
+
+    async def acquire_async(self, priority=NORMAL):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = await store_call(self.store, self._try_acquire, priority)
+            if wait is None:
+                return
+            self._wait_or_give_up(wait, deadline)
+            await asyncio.sleep(wait)
+
+    """Reading a Petfinder response - a 429 blocks every caller for Retry-After seconds, rate-limit headers
+    (when there are any) replace our own count of what is left today"""
+
+    def update(self, status_code, headers):
+        if status_code == 429:
+            retry_after = self._seconds(headers.get('Retry-After'), 1)
+            self.store.set(self.key + ':blocked', time.time() + retry_after, ttl=retry_after)
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None and remaining.isdigit():
+            reset = self._seconds(headers.get('X-RateLimit-Reset'), 60)
+            self.store.set(self.key + ':remaining', int(remaining), ttl=reset)
+
+    """Calls left today - the lower of our own count and what Petfinder last told us"""
+
+    def remaining(self):
+        if not self.daily_limit:
+            return None
+        left = self.daily_limit - self.store.incr(self._day_key(), 0, ttl=DAY)
+        reported = self.store.get(self.key + ':remaining')
+        return min(left, reported) if reported is not None else left
+
+    def budget_low(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= self.low_budget
+
+    def stats(self):
+        return {'throttled': self.throttled, 'rejected': self.rejected, 'remaining_today': self.remaining()}
+
+    def _try_acquire(self, priority):
+        # None when a slot was taken, otherwise how long until one might be free
+        now = time.time()
+        blocked_until = self.store.get(self.key + ':blocked')
+        if blocked_until is not None and blocked_until > now:
+            return blocked_until - now
+        remaining = self.remaining()
+        if remaining is not None and (remaining <= 0 or (priority == LOW and remaining <= self.low_budget)):
+            return DAY - now % DAY
+        window = int(now)
+        limit = self.rate if priority == NORMAL else max(int(self.rate * LOW_PRIORITY_SHARE), 1)
+        if self.store.incr(f'{self.key}:s:{window}', 1, ttl=2) > limit:
+            return window + 1 - now
+        if self.daily_limit:
+            self.store.incr(self._day_key(), 1, ttl=DAY)
+        return None
+
+    def _wait_or_give_up(self, wait, deadline):
+        if time.monotonic() + wait > deadline:
+            self._count('rejected')
+            raise RateLimitedError(f'Petfinder rate limit reached, next call possible in {wait:.1f}s',
+                                   retry_after=wait)
+        self._count('throttled')
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _day_key(self):
+        return f'{self.key}:d:{int(time.time() // DAY)}'
+
+    @staticmethod
+    def _seconds(value, default):
+        try:
+            return max(float(value), 0.1)
+        except (TypeError, ValueError):
+            return default
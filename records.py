@@ -0,0 +1,66 @@
+"""Compact animal records, holding only what the app shows or filters on.
+
+A Petfinder animal is a large dict (links, contact details, tags, every photo in four sizes...). Search
+results are kept in caches and the catalogue index, so each animal is cut down to a PetRecord as soon as
+its page is parsed. Records can be read like the dicts they replace (pet['name'], pet.get('age')), so the
+templates and ranking work on either.
+"""
+
+
+class PetRecord:
+    __slots__ = ('id', 'name', 'type', 'size', 'age', 'gender', 'description', 'breed', 'species',
+                 'photo_medium', 'photo_large', 'status', 'status_changed_at', 'published_at',
+                 'good_with_children', 'good_with_dogs', 'good_with_cats', 'house_trained', 'special_needs')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    """Projecting a Petfinder animal dict down to a record"""
+
+    @classmethod
+    def from_api(cls, animal):
+        breeds = animal.get('breeds') or {}
+        photos = animal.get('photos') or []
+        first_photo = photos[0] if photos else {}
+        environment = animal.get('environment') or {}
+        attributes = animal.get('attributes') or {}
+        return cls(id=animal['id'], name=animal.get('name'), type=animal.get('type'), size=animal.get('size'),
+                   age=animal.get('age'), gender=animal.get('gender'), description=animal.get('description'),
+                   breed=breeds.get('primary'), species=breeds.get('species', animal.get('species')),
+                   photo_medium=first_photo.get('medium'), photo_large=first_photo.get('large'),
+                   status=animal.get('status'), status_changed_at=animal.get('status_changed_at'),
+                   published_at=animal.get('published_at'),
+                   good_with_children=environment.get('children'), good_with_dogs=environment.get('dogs'),
+                   good_with_cats=environment.get('cats'), house_trained=attributes.get('house_trained'),
+                   special_needs=attributes.get('special_needs'))
+
+    """Photo url in one of the two kept sizes, medium for the cards and large for the thank you page"""
+
+    def photo_url(self, size='medium'):
+        return self.photo_large if size == 'large' else self.photo_medium
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        if not isinstance(other, PetRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f'PetRecord(id={self.id!r}, name={self.name!r}, age={self.age!r})'
+
+    # slots have no __dict__, so pickling (for the redis cache) goes through a plain tuple
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
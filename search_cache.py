@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+
+from shared_store import LocalStore
+from single_flight import SingleFlight
+
+"""Caching search results, keyed by the normalised search form choices (Animal.cache_key()).
+
+There are only 192 possible searches, so most of them are repeated again and again. Each entry is fresh
+for ttl seconds and then kept for another stale_ttl seconds: a request for a stale entry gets the old
+result straight away while one background refresh fetches the new one. Identical searches that miss at
+the same time share a single fetch (see single_flight.py). A result the loader marks as partial (some of its
+pages were refused or failed) is only fresh for partial_ttl seconds, so it is fetched again soon.
+"""
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))
+SEARCH_CACHE_STALE_TTL = int(os.getenv('SEARCH_CACHE_STALE_TTL', '600'))
+SEARCH_CACHE_PARTIAL_TTL = int(os.getenv('SEARCH_CACHE_PARTIAL_TTL', '30'))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '192'))
+# 0 coalesces identical searches within a worker only, 1 also across workers through lock_store
+SEARCH_SINGLE_FLIGHT_SHARED = os.getenv('SEARCH_SINGLE_FLIGHT_SHARED', '1') == '1'
+
+
+class SearchCache:
+    def __init__(self, store, lock_store=None, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL,
+                 refresh_timeout=60, single_flight=None, partial_ttl=SEARCH_CACHE_PARTIAL_TTL):
+        # store holds the results (an LRUStore in this process, or a RedisStore shared by the workers)
+        # lock_store makes sure only one refresh per key runs - use the shared store when there is one
+        self.store = store
+        self.lock_store = lock_store if lock_store is not None else LocalStore()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.partial_ttl = partial_ttl
+        self.refresh_timeout = refresh_timeout
+        if single_flight is None:
+            single_flight = SingleFlight(self.lock_store if SEARCH_SINGLE_FLIGHT_SHARED else None,
+                                         lock_timeout=refresh_timeout)
+        self.single_flight = single_flight
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+
+    """Returning the cached result for key, calling loader() when there is nothing usable"""
+
+    def get(self, key, loader):
+        entry = self.store.get(key)
+        if entry is None:
+            self._count('misses')
+            # everyone missing this key right now waits for one fetch
+            return self.single_flight.do(key, lambda: self._load(key, loader), check=lambda: self._cached(key))
+
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            self._count('hits')
+        else:
+            self._count('stale_hits')
+            self._refresh_in_background(key, loader)
+        return value
+
+    def invalidate(self, key):
+        self.store.delete(key)
+
+    """Hit, miss and eviction counters - evictions are only known for the in-process store"""
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits,
+                'evictions': getattr(self.store, 'evictions', 0)}
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _cached(self, key):
+        entry = self.store.get(key)
+        return entry[0] if entry is not None else None
+
+    def _load(self, key, loader):
+        value = loader()
+        ttl = self.partial_ttl if getattr(value, 'partial', False) else self.ttl
+        self.store.set(key, (value, time.time() + ttl), ttl=ttl + self.stale_ttl)
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        lock_key = key + ':refresh'
+        if not self.lock_store.add(lock_key, 1, ttl=self.refresh_timeout):
+            # somebody else is already refreshing this entry
+            return
+
+        def refresh():
+            try:
+                self._load(key, loader)
+            except Exception:
+                # the stale result stays in place and the next request for it tries again
+                logger.exception('Refreshing cached search %s failed', key)
+            finally:
+                self.lock_store.delete(lock_key)
+
+        threading.Thread(target=refresh, daemon=True).start()
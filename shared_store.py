@@ -0,0 +1,169 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+"""Small key/value stores used to share state (tokens, cached searches, locks) between requests.
+
+LocalStore keeps everything in this process and is shared by the threads of one worker.
+RedisStore wraps a redis client so several gunicorn workers can see the same values.
+Both offer the same handful of methods, so the rest of the app does not care which one it has.
+"""
+
+
+class LocalStore:
+    # calls are answered in this process, quicker than handing them to a thread
+    remote = False
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    """Returning the value for a key, or None if it is missing or expired"""
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    """Storing a value, optionally for ttl seconds only"""
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    """Storing several values (a dict of key -> value) at once, with the same ttl"""
+
+    def set_many(self, items, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (value, expires_at)
+
+    """Storing a value only if the key is not already there - used as a simple lock"""
+
+    def add(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] > time.monotonic()):
+                return False
+            self._data[key] = (value, expires_at)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    """Adding amount to a counter and returning the new total"""
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[1] is not None and item[1] <= time.monotonic()):
+                item = (0, time.monotonic() + ttl if ttl else None)
+            value = item[0] + amount
+            self._data[key] = (value, item[1])
+            return value
+
+
+class LRUStore(LocalStore):
+    # LocalStore that holds at most max_entries keys, dropping the least recently used one
+    def __init__(self, max_entries):
+        super().__init__()
+        self._data = OrderedDict()
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    def get(self, key):
+        value = super().get(key)
+        if value is not None:
+            with self._lock:
+                if key in self._data:
+                    self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+
+class RedisStore:
+    # values are pickled so lists of animal dicts can be stored as they are
+    # every call is a blocking network round trip
+    remote = True
+
+    def __init__(self, client, prefix='pawsome:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    # one round trip for the lot rather than one per key
+    def set_many(self, items, ttl=None):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(self.prefix + key, pickle.dumps(value), px=int(ttl * 1000) if ttl else None)
+        pipeline.execute()
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, pickle.dumps(value), nx=True,
+                                    px=int(ttl * 1000) if ttl else None))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    # counters are plain redis integers kept apart from the pickled values - read them with incr(key, 0)
+    def incr(self, key, amount=1, ttl=None):
+        value = self.client.incrby(self.prefix + 'n:' + key, amount)
+        if ttl and value == amount:
+            self.client.pexpire(self.prefix + 'n:' + key, int(ttl * 1000))
+        return value
+
+
+"""Calling fn (which uses store) from a coroutine - with a redis store it runs in a thread, as a blocking round
+trip on the event loop would hold up every request the loop is serving"""
+
+
+async def store_call(store, fn, *args):
+    if store.remote:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+"""Picking the store from the environment - redis when REDIS_URL is set, otherwise in-process
+(size-limited when max_entries is given)"""
+
+
+def get_store(redis_url=None, max_entries=None):
+    redis_url = redis_url or os.getenv('REDIS_URL')
+    if not redis_url:
+        return LRUStore(max_entries) if max_entries else LocalStore()
+    # redis is optional, only needed when workers should share state
+    import redis
+    return RedisStore(redis.Redis.from_url(redis_url))
@@ -0,0 +1,94 @@
+import threading
+import time
+
+"""Single-flight: one upstream fetch per key at a time, however many requests ask for it.
+
+When a promotion link goes out, many people submit the same search within seconds. The first request for
+a key does the fetch, the others that arrive while it is running wait for its result instead of starting
+their own. With a lock_store shared between workers (a RedisStore) this also works across processes: a
+worker that finds another worker's lock waits until check() - usually a look in the shared cache - finds
+the result, or the lock goes away and it fetches itself.
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_store=None, lock_timeout=60, poll_interval=0.05):
+        self.lock_store = lock_store
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        # fetches actually made, requests that waited on one in this worker, and on one in another worker
+        self.flights = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    """Returning fn(), called only once for all the callers asking for key at the same time"""
+
+    def do(self, key, fn, check=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self._shared_do(key, fn, check)
+            return call.value
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {'flights': self.flights, 'coalesced': self.coalesced, 'coalesced_remote': self.coalesced_remote}
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _shared_do(self, key, fn, check):
+        if self.lock_store is None:
+            self._count('flights')
+            return fn()
+        lock_key = key + ':flight'
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.lock_store.add(lock_key, 1, ttl=self.lock_timeout):
+            value = self._checked(check)
+            if value is not None:
+                return value
+            if time.monotonic() > deadline:
+                break
+            time.sleep(self.poll_interval)
+        try:
+            # the other worker may have finished between our last look and getting the lock
+            value = self._checked(check)
+            if value is not None:
+                return value
+            self._count('flights')
+            return fn()
+        finally:
+            self.lock_store.delete(lock_key)
+
+    def _checked(self, check):
+        value = check() if check is not None else None
+        if value is not None:
+            self._count('coalesced_remote')
+        return value
@@ -0,0 +1,121 @@
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import update
+
+from adopted import AdoptedPets
+from petfinder_stub import make_animal
+from records import PetRecord
+from utils import CustomerAdoptions, db
+
+LONG_AGO = datetime(2022, 11, 1)
+
+
+class TestAdoptedPets(unittest.TestCase):
+
+    def test_ids_in_and_out(self):
+        adopted = AdoptedPets()
+        adopted.update([3, 8, '9', 'not-an-id', 3])
+
+        self.assertEqual(3, len(adopted))
+        self.assertIn(8, adopted)
+        self.assertIn(9, adopted)
+        self.assertNotIn(4, adopted)
+        # far past the end of the bitmap
+        self.assertNotIn(10 ** 8, adopted)
+
+    def test_grows_for_newer_pets(self):
+        adopted = AdoptedPets()
+        adopted.add(5)
+        adopted.add(70_000_000)
+
+        self.assertIn(5, adopted)
+        self.assertIn(70_000_000, adopted)
+        self.assertLess(len(adopted.bits), 11 * 2 ** 20)
+
+    def test_huge_ids_kept_out_of_the_bitmap(self):
+        adopted = AdoptedPets(max_bitmap_id=1000)
+        adopted.update([5, 2 ** 31 - 1, 2 ** 31 - 1])
+        adopted.add(999)
+
+        self.assertEqual(3, len(adopted))
+        self.assertIn(2 ** 31 - 1, adopted)
+        self.assertIn(999, adopted)
+        self.assertEqual({2 ** 31 - 1}, adopted.overflow)
+        self.assertLessEqual(len(adopted.bits), 1000 // 8 + 1)
+        adopted.loaded = True
+        animals = [make_animal(pet_id) for pet_id in (5, 6, 2 ** 31 - 1, 2 ** 31 - 2)]
+        self.assertEqual([6, 2 ** 31 - 2], [animal['id'] for animal in adopted.exclude(animals)])
+
+    def test_exclude(self):
+        adopted = AdoptedPets()
+        adopted.update([2, 4])
+        animals = [PetRecord.from_api(make_animal(pet_id)) for pet_id in range(1, 6)] + [make_animal(500)]
+
+        # nothing is left out until the ids have been loaded
+        self.assertEqual(animals, adopted.exclude(animals))
+        adopted.loaded = True
+        self.assertEqual([1, 3, 5, 500], [animal['id'] for animal in adopted.exclude(animals)])
+
+
+class TestAdoptedPetsRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        for pet_id in range(1, 101):
+            self.add([pet_id], LONG_AGO + timedelta(hours=pet_id))
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def add(self, pet_ids, created_at=None):
+        # without created_at the database stamps them
+        db.session.add_all(CustomerAdoptions(pet_id=pet_id, **({'created_at': created_at} if created_at else {}))
+                           for pet_id in pet_ids)
+        db.session.commit()
+
+    def test_load_then_only_recent_adoptions(self):
+        adopted = AdoptedPets()
+
+        self.assertEqual(100, adopted.refresh())
+        self.assertEqual(100, len(adopted))
+        self.assertEqual(LONG_AGO + timedelta(hours=100), adopted.since)
+
+        # saved by another worker - read with the last one of the load, which is within the overlap
+        self.add([500])
+        self.assertEqual(2, adopted.refresh())
+        self.assertIn(500, adopted)
+        self.assertEqual(101, len(adopted))
+
+    def test_full_load_when_due(self):
+        adopted = AdoptedPets(full_interval=0)
+        adopted.refresh()
+
+        # also picks up adoptions that have no CreatedAt
+        self.add([600, 601])
+        db.session.execute(update(CustomerAdoptions).where(CustomerAdoptions.pet_id >= 600).values(created_at=None))
+        db.session.commit()
+
+        self.assertEqual(102, adopted.refresh())
+        self.assertIn(601, adopted)
+
+    def test_background_thread(self):
+        adopted = AdoptedPets(interval=0.01).start(self.app)
+        try:
+            self.add([700])
+            for _ in range(200):
+                if 700 in adopted:
+                    break
+                adopted._stop.wait(0.01)
+        finally:
+            adopted.stop()
+
+        self.assertTrue(adopted.loaded)
+        self.assertIn(700, adopted)
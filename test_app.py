@@ -1,12 +1,23 @@
+import tempfile
+import threading
 import unittest
-from app import app
+from _pytest.monkeypatch import MonkeyPatch
+from sqlalchemy import text
+from app import create_app, after_fork
+from petfinder_stub import make_animal
+from rate_limit import RateLimitedError
+from records import PetRecord
+from utils import db
 
 
 class FlaskTest(unittest.TestCase):
 
+    def setUp(self):
+        self.app = create_app({'ADOPTED_FILTER': False})
+
     def test_base_route(self):
         """check if response is 200"""
-        tester = app.test_client(self)
+        tester = self.app.test_client(self)
         response = tester.get("/")
         statuscode = response.status_code
 
@@ -14,21 +25,262 @@ class FlaskTest(unittest.TestCase):
 
     def test_adoption_content(self):
         """check if return content is text/html rather than json"""
-        tester = app.test_client(self)
+        tester = self.app.test_client(self)
         response = tester.get("/adopt")
 
         self.assertEqual(response.content_type, "text/html; charset=utf-8")
 
     def test_customer_content(self):
         """check if return content is text/html"""
-        tester = app.test_client(self)
+        tester = self.app.test_client(self)
         response = tester.get("/customer")
 
         self.assertEqual(response.content_type, "text/html; charset=utf-8")
 
     def test_homepage_data(self):
         """check for data return"""
-        tester = app.test_client(self)
+        tester = self.app.test_client(self)
         response = tester.get("/")
 
         self.assertTrue(b"Adopt a Pet" in response.data)
+
+
+class PetListPagesTest(unittest.TestCase):
+
+    def setUp(self):
+        # 60 fake animals instead of a Petfinder search
+        self.monkeypatch = MonkeyPatch()
+        self.app = create_app({'WTF_CSRF_ENABLED': False, 'ADOPTED_FILTER': False})
+        animal_repository = self.app.extensions['animal_repository']
+        self.pets = [PetRecord.from_api(make_animal(animal_id)) for animal_id in range(1, 61)]
+
+        def search(animal_data):
+            return self.pets
+
+        self.monkeypatch.setattr(animal_repository, 'search', search)
+
+    def tearDown(self):
+        self.monkeypatch.undo()
+        self.app.extensions['event_loop'].stop()
+
+    def test_search_shows_first_page(self):
+        tester = self.app.test_client(self)
+        response = tester.post("/adopt", data={'cat_or_dog': 'Dog', 'select_size': 'Large'})
+
+        self.assertEqual(24, response.data.count(b'role="button">Adopt</a>'))
+        self.assertIn(b'Page 1 of 3 (60 pets)', response.data)
+        self.assertIn(b'/adopt?search=search%3Adog%3Alarge%3A00000&amp;page=2', response.data)
+
+    def test_later_page_from_search_key(self):
+        tester = self.app.test_client(self)
+        response = tester.get("/adopt?search=search:dog:large:00000&page=3")
+
+        self.assertEqual(12, response.data.count(b'role="button">Adopt</a>'))
+        self.assertIn(b'Page 3 of 3 (60 pets)', response.data)
+
+    def test_cards_rendered_once(self):
+        tester = self.app.test_client(self)
+        cards = self.app.extensions['pet_cards']
+        first = tester.get("/adopt?search=search:dog:large:00000&page=2")
+        second = tester.get("/adopt?search=search:dog:large:00000&page=2")
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual({'hits': 24, 'misses': 24}, {name: cards.stats()[name] for name in ('hits', 'misses')})
+
+    def test_changed_animal_rendered_again(self):
+        tester = self.app.test_client(self)
+        tester.get("/adopt?search=search:dog:large:00000&page=3")
+        # the last card of page 3
+        changed = self.pets[56]
+        changed.name = 'Renamed'
+        changed.status_changed_at = '2022-12-01T10:00:00+0000'
+
+        response = tester.get("/adopt?search=search:dog:large:00000&page=3")
+
+        self.assertIn(b'Renamed', response.data)
+        self.assertEqual(13, self.app.extensions['pet_cards'].stats()['misses'])
+
+    def test_only_petfinder_calls_on_the_loop(self):
+        threads = {}
+        self.monkeypatch.undo()
+
+        async def get_all_pages_async(url, max_pages=None, project=None, skipped=None):
+            threads['pages'] = threading.current_thread().name
+            return self.pets
+
+        self.monkeypatch.setattr(self.app.extensions['animal_repository'], 'get_all_pages_async', get_all_pages_async)
+        self.app.jinja_env.globals['asset_url'] = lambda *args, **kwargs: threads.setdefault(
+            'render', threading.current_thread().name) and '/x'
+
+        response = self.app.test_client(self).get("/adopt?search=search:dog:large:00000")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('event-loop', threads['pages'])
+        self.assertEqual(threading.current_thread().name, threads['render'])
+
+    def test_bad_search_key(self):
+        tester = self.app.test_client(self)
+
+        for key in ('not-a-key', 'search:dog:huge:00000', 'search:rabbit:large:00000', 'search:dog:large:00002'):
+            with self.subTest(key=key):
+                self.assertEqual(400, tester.get(f'/adopt?search={key}').status_code)
+
+    def test_search_needs_type_and_size(self):
+        searched = []
+
+        def search(animal_data):
+            searched.append(animal_data)
+            return self.pets
+
+        self.monkeypatch.setattr(self.app.extensions['animal_repository'], 'search', search)
+        tester = self.app.test_client(self)
+
+        for form in ({}, {'cat_or_dog': 'Dog'}, {'cat_or_dog': 'Rabbit', 'select_size': 'Large'}):
+            with self.subTest(form=form):
+                self.assertEqual(400, tester.post('/adopt', data=form).status_code)
+        self.assertEqual([], searched)
+
+    def test_rate_limited_search(self):
+        def search(animal_data):
+            raise RateLimitedError('Petfinder answered 429 Too Many Requests', retry_after=60)
+
+        self.monkeypatch.setattr(self.app.extensions['animal_repository'], 'search', search)
+        tester = self.app.test_client(self)
+        response = tester.get("/adopt?search=search:dog:large:00000")
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('60', response.headers['Retry-After'])
+        self.assertIn(b'please try again in a minute', response.data)
+
+
+class CustomerFormTest(unittest.TestCase):
+
+    def setUp(self):
+        self.monkeypatch = MonkeyPatch()
+        self.folder = tempfile.TemporaryDirectory()
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{self.folder.name}/adoption.db',
+                               'SQLALCHEMY_ENGINE_OPTIONS': {}, 'WTF_CSRF_ENABLED': False,
+                               'ADOPTED_FILTER': False})
+        with self.app.app_context():
+            db.create_all()
+
+        def get_animal(pet_id):
+            return PetRecord.from_api(make_animal(int(pet_id)))
+
+        self.monkeypatch.setattr(self.app.extensions['animal_repository'], 'get_animal', get_animal)
+
+    def tearDown(self):
+        self.monkeypatch.undo()
+        self.app.extensions['event_loop'].stop()
+        with self.app.app_context():
+            db.engine.dispose()
+        self.folder.cleanup()
+
+    def test_adopting_a_pet_twice(self):
+        tester = self.app.test_client(self)
+        form = {'firstname': 'bob', 'lastname': 'builder', 'email': 'bob@example.com'}
+
+        first = tester.post('/customer?pet_id=7', data=form)
+        second = tester.post('/customer?pet_id=7', data=dict(form, email='amy@example.com'))
+
+        self.assertEqual(200, first.status_code)
+        self.assertIn(make_animal(7)['name'].encode(), first.data)
+        self.assertEqual(409, second.status_code)
+        self.assertIn(b'already been adopted', second.data)
+
+    def test_pet_id_that_is_not_a_pet(self):
+        tester = self.app.test_client(self)
+        form = {'firstname': 'bob', 'lastname': 'builder', 'email': 'bob@example.com'}
+
+        for pet_id in ('', 'seven', '-7', '0', '\u0667', str(2 ** 31)):
+            with self.subTest(pet_id=pet_id):
+                self.assertEqual(400, tester.post(f'/customer?pet_id={pet_id}', data=form).status_code)
+        self.assertEqual(0, len(self.app.extensions['adopted_pets']))
+
+    def test_adopted_pets_left_out_of_searches(self):
+        pets = [PetRecord.from_api(make_animal(animal_id)) for animal_id in range(1, 31)]
+
+        def search(animal_data):
+            return pets
+
+        self.monkeypatch.setattr(self.app.extensions['animal_repository'], 'search', search)
+        adopted = self.app.extensions['adopted_pets']
+        with self.app.app_context():
+            adopted.refresh()
+        tester = self.app.test_client(self)
+
+        tester.post('/customer?pet_id=7', data={'firstname': 'bob', 'lastname': 'builder', 'email': 'bob@example.com'})
+        pages = [tester.get(f'/adopt?search=search:dog:large:00000&page={page}').data for page in (1, 2)]
+
+        # left out straight away, without waiting for the next refresh
+        self.assertIn(b'Page 2 of 2 (29 pets)', pages[1])
+        self.assertFalse(any(b'/customer?pet_id=7"' in page for page in pages))
+        self.assertIn(b'/customer?pet_id=8"', pages[0] + pages[1])
+
+
+class CreateAppTest(unittest.TestCase):
+
+    def test_each_app_has_its_own_repositories(self):
+        first = create_app()
+        second = create_app()
+
+        self.assertIsNot(first.extensions['animal_repository'], second.extensions['animal_repository'])
+
+    def test_pool_settings_for_mysql(self):
+        app = create_app()
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertIn('pool_size', options)
+        self.assertLess(options['pool_recycle'], 8 * 3600)
+
+    def test_catalogue_crawled_once_serving(self):
+        app = create_app({'CATALOGUE_WARM': True, 'ADOPTED_FILTER': False})
+        warmer = app.extensions['catalogue_warmer']
+        # no Petfinder calls from the test
+        warmer.crawl = lambda: 0
+        try:
+            # not in a gunicorn --preload master, which builds the app but serves nothing
+            self.assertIsNone(warmer._thread)
+            tester = app.test_client()
+            tester.get('/')
+            thread = warmer._thread
+            tester.get('/')
+
+            self.assertIs(thread, warmer._thread)
+            self.assertTrue(thread.is_alive())
+            self.assertIs(warmer.index, app.extensions['animal_repository'].catalogue)
+        finally:
+            warmer.stop()
+            app.extensions['event_loop'].stop()
+
+    def test_adopted_pets_loaded_once_serving(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_ENGINE_OPTIONS': {}})
+        adopted = app.extensions['adopted_pets']
+        adopted.interval = 60
+        with app.app_context():
+            db.create_all()
+        try:
+            # nor by bulk.py or migrate_keys.py, which build the app and serve nothing
+            self.assertIsNone(adopted._thread)
+            tester = app.test_client()
+            tester.get('/')
+            thread = adopted._thread
+            tester.get('/')
+
+            self.assertIs(thread, adopted._thread)
+            self.assertTrue(thread.is_alive())
+        finally:
+            adopted.stop()
+            app.extensions['event_loop'].stop()
+
+    def test_after_fork_forgets_connections(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_ENGINE_OPTIONS': {}})
+        session = app.extensions['animal_repository'].session
+        with app.app_context():
+            db.session.execute(text('SELECT 1'))
+            db.session.remove()
+
+        after_fork(app)
+
+        self.assertIsNot(session, app.extensions['animal_repository'].session)
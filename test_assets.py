@@ -0,0 +1,160 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app
+from assets import Assets, build
+
+STYLES = b'body {\n  text-align: center;\n}\n' * 40
+
+
+class TestBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.output = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.static, 'images'))
+        with open(os.path.join(self.static, 'styles.css'), 'wb') as file:
+            file.write(STYLES)
+        shutil.copy('static/images/dog.jpeg', os.path.join(self.static, 'images'))
+        with open(os.path.join(self.static, 'images', '.DS_Store'), 'wb') as file:
+            file.write(b'finder')
+
+    def tearDown(self):
+        shutil.rmtree(self.static)
+        shutil.rmtree(self.output)
+
+    def test_fingerprinted_and_compressed(self):
+        manifest = build(self.static, self.output)
+
+        self.assertEqual(['images/dog.jpeg', 'styles.css'], sorted(manifest['files']))
+        styles = manifest['files']['styles.css']
+        self.assertRegex(styles['file'], r'^styles\.[0-9a-f]{12}\.css$')
+        with gzip.open(os.path.join(self.output, styles['encodings']['gzip'])) as file:
+            self.assertEqual(STYLES, file.read())
+        # a jpeg does not compress any further
+        self.assertEqual({}, manifest['files']['images/dog.jpeg']['encodings'])
+        with open(os.path.join(self.output, 'manifest.json')) as file:
+            self.assertEqual(manifest, json.load(file))
+
+    def test_new_content_new_name(self):
+        first = build(self.static, self.output)['files']['styles.css']['file']
+        with open(os.path.join(self.static, 'styles.css'), 'ab') as file:
+            file.write(b'h3 { color: black; }\n')
+
+        second = build(self.static, self.output)['files']['styles.css']['file']
+
+        self.assertNotEqual(first, second)
+        # the old file stays for pages that still link to it
+        self.assertTrue(os.path.exists(os.path.join(self.output, first)))
+
+    def test_srcset(self):
+        assets = Assets(self.output, {'files': {'images/cover.png': {
+            'file': 'images/cover.aaa.png', 'encodings': {}, 'width': 1200,
+            'variants': {'webp': 'images/cover.bbb.webp', '480w': 'images/cover-480w.ccc.png',
+                         '480w.webp': 'images/cover-480w.ddd.webp', '960w': 'images/cover-960w.eee.png',
+                         '960w.webp': 'images/cover-960w.fff.webp'}}}})
+
+        self.assertEqual([(480, 'images/cover-480w.ccc.png'), (960, 'images/cover-960w.eee.png'),
+                          (1200, 'images/cover.aaa.png')], assets.srcset('images/cover.png'))
+        self.assertEqual([(480, 'images/cover-480w.ddd.webp'), (960, 'images/cover-960w.fff.webp'),
+                          (1200, 'images/cover.bbb.webp')], assets.srcset('images/cover.png', webp=True))
+        self.assertEqual([], assets.srcset('images/unknown.png'))
+
+
+class TestServingAssets(unittest.TestCase):
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.manifest = build('static', self.output)
+        self.app = create_app({'ASSETS_DIR': self.output, 'LOG_FILE': '', 'ADOPTED_FILTER': False})
+        self.tester = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+        self.app.extensions['event_loop'].stop()
+
+    def test_pages_link_fingerprinted_files(self):
+        response = self.tester.get('/')
+
+        styles = self.manifest['files']['styles2.css']['file']
+        self.assertIn(f'href="/assets/{styles}"'.encode(), response.data)
+        self.assertNotIn(b'"static/', response.data)
+
+    def test_gzip_copy_with_far_future_caching(self):
+        url = '/assets/' + self.manifest['files']['styles2.css']['file']
+
+        compressed = self.tester.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        plain = self.tester.get(url)
+
+        self.assertEqual('gzip', compressed.content_encoding)
+        self.assertEqual('text/css; charset=utf-8', compressed.content_type)
+        self.assertEqual(plain.data, gzip.decompress(compressed.data))
+        self.assertIsNone(plain.content_encoding)
+        for response in compressed, plain:
+            self.assertEqual(365 * 24 * 3600, response.cache_control.max_age)
+            self.assertTrue(response.cache_control.immutable)
+            self.assertIn('Accept-Encoding', response.vary)
+
+    def test_unknown_asset(self):
+        self.assertEqual(404, self.tester.get('/assets/styles2.000000000000.css').status_code)
+
+    def test_no_build_falls_back_to_static(self):
+        app = create_app({'ASSETS_DIR': tempfile.mkdtemp(), 'LOG_FILE': '', 'ADOPTED_FILTER': False})
+        tester = app.test_client()
+
+        response = tester.get('/about_us')
+
+        self.assertIn(b'href="/static/styles2.css"', response.data)
+        self.assertEqual(404, tester.get('/assets/styles2.css').status_code)
+        app.extensions['event_loop'].stop()
+
+
+class TestStaticPages(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app({'LOG_FILE': '', 'ADOPTED_FILTER': False})
+        self.tester = self.app.test_client()
+
+    def tearDown(self):
+        self.app.extensions['event_loop'].stop()
+
+    def test_rendered_once(self):
+        rendered = []
+        self.app.jinja_env.globals['asset_url'] = lambda *args, **kwargs: rendered.append(args) or '/x'
+
+        first = self.tester.get('/about_us')
+        calls = len(rendered)
+        second = self.tester.get('/about_us')
+
+        self.assertEqual(first.data, second.data)
+        # the template only ran for the first request
+        self.assertGreater(calls, 0)
+        self.assertEqual(calls, len(rendered))
+
+    def test_flashed_messages_not_kept(self):
+        with self.tester.session_transaction() as session:
+            session['_flashes'] = [('success', 'Customer bob successfully adopted a new pet!')]
+
+        flashed = self.tester.get('/')
+        later = self.app.test_client().get('/')
+
+        self.assertIn(b'successfully adopted', flashed.data)
+        self.assertNotIn(b'successfully adopted', later.data)
+        self.assertNotIn(b'successfully adopted', self.tester.get('/').data)
+
+    def test_not_modified(self):
+        first = self.tester.get('/')
+
+        again = self.tester.get('/', headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(304, again.status_code)
+        self.assertEqual(b'', again.data)
+        self.assertTrue(first.cache_control.no_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from benchmarks.bench_suite import regressions, run_suite
+
+
+class TestBenchSuite(unittest.TestCase):
+
+    def test_regressions(self):
+        baseline = {'adopt_search': {'p50_ms': 100, 'p95_ms': 200, 'throughput': 50, 'upstream_per_request': 0,
+                                     'peak_memory_kib': 1000}}
+        results = {'adopt_search': {'p50_ms': 110, 'p95_ms': 300, 'throughput': 30, 'upstream_per_request': 1,
+                                    'peak_memory_kib': 1100},
+                   # not in the baseline, nothing to compare with
+                   'admin': {'p50_ms': 1000}}
+
+        found = regressions(results, baseline, 0.25)
+
+        # p50 and memory are within 25%
+        self.assertEqual(['adopt_search p95_ms: 200 -> 300 (+50%)', 'adopt_search throughput: 50 -> 30 (-40%)',
+                          'adopt_search upstream_per_request: 0 -> 1 (+inf%)'], found)
+
+    def test_small_run(self):
+        # every scenario end to end, a handful of requests each against a stub without latency
+        settings = {'requests': 6, 'clients': 2, 'latency': 0.0, 'animals': 120, 'max_pages': 50,
+                    'error_rate': 0.0, 'customers': 10}
+
+        results = run_suite(settings)
+
+        self.assertEqual(['adopt_search', 'adopt_page', 'customer', 'admin'], list(results))
+        for result in results.values():
+            self.assertEqual(0, result['errors'])
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # the cached pages need no Petfinder calls, each adoption fetches its animal for the thank you page
+        self.assertEqual(0, results['adopt_page']['upstream_calls'])
+        self.assertEqual(6, results['customer']['upstream_calls'])
+        self.assertGreater(results['adopt_search']['upstream_calls'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+from flask import Flask
+
+import bulk
+from utils import Customers, CustomerAdoptions, CustomerRepository, Customer, db
+
+
+class TestBulkImportExport(unittest.TestCase):
+
+    def setUp(self):
+        self.monkeypatch = MonkeyPatch()
+        self.folder = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        self.monkeypatch.undo()
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.folder.cleanup()
+
+    def write_csv(self, rows):
+        path = os.path.join(self.folder.name, 'adoptions.csv')
+        with open(path, 'w', newline='') as file:
+            bulk.write_rows(rows, file, 'csv')
+        return path
+
+    def test_customers_deduped_by_email(self):
+        # bob is already a customer from the website, and adopts two more pets in the file
+        bob = CustomerRepository.customer_adopt(Customer(None, 'bob', 'builder', '', 'bob@example.com',
+                                                   '', '', '', ''), 10)
+        rows = [{'email': 'bob@example.com', 'firstname': 'bob', 'pet_id': '11'},
+                {'email': 'amy@example.com', 'firstname': 'amy', 'pet_id': '12'},
+                {'email': 'bob@example.com', 'firstname': 'bob', 'pet_id': '13'}]
+
+        result = bulk.import_rows(rows, batch_size=2)
+
+        self.assertEqual(1, result.customers)
+        self.assertEqual(3, result.adoptions)
+        self.assertEqual(2, Customers.query.count())
+        self.assertEqual([bob, bob], [adoption.customer_id for adoption in
+                                      CustomerAdoptions.query.filter(CustomerAdoptions.pet_id.in_([11, 13]))])
+
+    def test_emails_matched_in_any_case(self):
+        # the unique email index ignores case, so these are all bob
+        bob = CustomerRepository.customer_adopt(Customer(None, 'bob', 'builder', '', 'Bob@Example.com',
+                                                   '', '', '', ''), 10)
+        rows = [{'email': 'bob@example.com', 'pet_id': '11'},
+                {'email': ' BOB@example.com ', 'pet_id': '12'},
+                {'email': 'Amy@example.com', 'pet_id': '13'},
+                {'email': 'amy@example.com', 'pet_id': '14'}]
+
+        result = bulk.import_rows(rows)
+
+        self.assertEqual(1, result.customers)
+        self.assertEqual(4, result.adoptions)
+        self.assertEqual(['Amy@example.com', 'Bob@Example.com'],
+                         sorted(customer.email for customer in Customers.query))
+        self.assertEqual([bob, bob], [adoption.customer_id for adoption in
+                                      CustomerAdoptions.query.filter(CustomerAdoptions.pet_id.in_([11, 12]))])
+
+    def test_already_adopted_and_invalid_rows_skipped(self):
+        rows = [{'email': 'bob@example.com', 'pet_id': '11'},
+                {'email': 'amy@example.com', 'pet_id': '11'},
+                {'email': '', 'pet_id': '12'},
+                {'email': 'sue@example.com', 'pet_id': 'twelve'},
+                {'email': 'sue@example.com'}]
+
+        result = bulk.import_rows(rows)
+
+        self.assertEqual(1, result.adoptions)
+        self.assertEqual(1, result.already_adopted)
+        self.assertEqual(2, result.invalid)
+        self.assertEqual(3, Customers.query.count())
+
+    def test_resume_after_failed_batch(self):
+        path = self.write_csv([{'email': f'customer{number}@example.com', 'pet_id': number}
+                               for number in range(10)])
+        import_batch = bulk.import_batch
+        calls = []
+
+        def fail_third_batch(rows, result):
+            calls.append(rows)
+            if len(calls) == 3:
+                raise RuntimeError('database went away')
+            import_batch(rows, result)
+
+        self.monkeypatch.setattr(bulk, 'import_batch', fail_third_batch)
+        with self.assertRaises(RuntimeError):
+            bulk.run_import(path, batch_size=3, resume=False)
+        self.assertEqual(6, bulk.read_checkpoint(path + '.progress'))
+
+        self.monkeypatch.undo()
+        result = bulk.run_import(path, batch_size=3, resume=True)
+
+        # only the rows after the last committed batch were read again
+        self.assertEqual(4, result.adoptions)
+        self.assertEqual(10, CustomerAdoptions.query.count())
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+    def test_export_round_trip(self):
+        bulk.import_rows([{'id': 'a', 'email': 'amy@example.com', 'firstname': 'amy', 'pet_id': '2'},
+                          {'id': 'a', 'email': 'amy@example.com', 'firstname': 'amy', 'pet_id': '1'},
+                          {'id': 'b', 'email': 'bob@example.com', 'firstname': 'bob'}])
+
+        jsonl = io.StringIO()
+        bulk.write_rows(bulk.export_rows(batch_size=2), jsonl, 'jsonl')
+        rows = [json.loads(line) for line in jsonl.getvalue().splitlines()]
+        exported = io.StringIO()
+        bulk.write_rows(bulk.export_rows(), exported, 'csv')
+
+        # ids are numbered by the database, not taken from the file
+        self.assertEqual([(1, 1), (1, 2), (2, None)], [(row['id'], row['pet_id']) for row in rows])
+        self.assertEqual(rows[0]['firstname'], 'amy')
+        self.assertEqual(3, len(list(csv.DictReader(io.StringIO(exported.getvalue())))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from catalogue import CatalogueIndex, CatalogueWarmer
+from petfinder_stub import PetfinderStub, make_animal
+from records import PetRecord
+from shared_store import LocalStore
+from utils import AnimalRepository, Animal
+
+
+class TestCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=300).start()
+        self.animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+        self.warmer = CatalogueWarmer(self.animal)
+        self.animal.catalogue = self.warmer.index
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_search_answered_from_index(self):
+        self.warmer.crawl()
+        self.stub.counts.clear()
+
+        result = self.animal.search(Animal('Dog', 'Medium', True, False, False, True, False))
+
+        # same animals as filtering the stub's catalogue by hand, and no call to the stub
+        expected = sorted((pet['id'] for pet in self.stub.animals
+                           if pet['type'] == 'Dog' and pet['size'] == 'Medium' and pet['environment']['children']
+                           and pet['attributes']['house_trained']), reverse=True)
+        self.assertEqual(expected, [pet['id'] for pet in result])
+        self.assertEqual(0, sum(self.stub.counts.values()))
+
+    def test_incremental_crawl_only_fetches_new_animals(self):
+        self.warmer.crawl()
+        new_animal = make_animal(301)
+        new_animal['published_at'] = '2022-12-01T10:00:00+0000'
+        self.stub.animals.append(new_animal)
+        self.stub.counts.clear()
+
+        changed = self.warmer.crawl()
+
+        # one page per type, with just the one new animal in it
+        self.assertEqual(1, changed)
+        self.assertEqual(2, self.stub.counts['animals'])
+        self.assertIn(301, self.warmer.index.animals)
+
+    def test_update_drops_animals_no_longer_adoptable(self):
+        index = CatalogueIndex()
+        index.replace([PetRecord.from_api(make_animal(1)), PetRecord.from_api(make_animal(2))])
+        adopted = make_animal(1)
+        adopted['status'] = 'adopted'
+        adopted['status_changed_at'] = '2022-12-01T10:00:00+0000'
+
+        self.assertEqual(1, index.update([PetRecord.from_api(adopted), PetRecord.from_api(make_animal(2))]))
+        self.assertEqual([2], list(index.animals))
+
+    def test_capped_crawl_not_used_for_searches(self):
+        # about 150 of each type, 100 a page
+        warmer = CatalogueWarmer(self.animal, max_pages=1)
+        self.animal.catalogue = warmer.index
+        warmer.crawl()
+        self.stub.counts.clear()
+
+        self.animal.search(Animal('Cat', 'Small', False, False, False, False, False))
+
+        self.assertEqual(200, len(warmer.index.animals))
+        self.assertFalse(warmer.index.complete)
+        self.assertGreater(self.stub.counts['animals'], 0)
+
+    def test_only_full_crawls_keep_the_index_fresh(self):
+        self.warmer.crawl()
+        adopted = self.stub.animals.pop()
+        self.warmer.index.updated_at -= self.warmer.index.max_age
+
+        # an update cannot see the adopted animal, so the index stays out of date
+        self.warmer.crawl()
+        self.assertFalse(self.warmer.index.is_fresh())
+        self.assertIn(adopted['id'], self.warmer.index.animals)
+
+        self.warmer.last_full_crawl = None
+        self.warmer.crawl()
+        self.assertTrue(self.warmer.index.is_fresh())
+        self.assertNotIn(adopted['id'], self.warmer.index.animals)
+
+    def test_stale_index_falls_back_to_live_search(self):
+        self.warmer.crawl()
+        self.warmer.index.max_age = 0
+        self.stub.counts.clear()
+
+        self.animal.search(Animal('Cat', 'Small', False, False, False, False, False))
+
+        self.assertGreater(self.stub.counts['animals'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import contextvars
+import threading
+import unittest
+
+from event_loop import EventLoopThread
+
+request_name = contextvars.ContextVar('request_name')
+
+
+class TestEventLoopThread(unittest.TestCase):
+
+    def setUp(self):
+        self.event_loop = EventLoopThread()
+
+    def tearDown(self):
+        self.event_loop.stop()
+
+    def test_coroutines_from_many_threads_run_on_one_loop(self):
+        loops = []
+        results = []
+
+        async def job(number):
+            loops.append(asyncio.get_running_loop())
+            await asyncio.sleep(0.05)
+            return number
+
+        threads = [threading.Thread(target=lambda n=n: results.append(self.event_loop.run(job(n)))) for n in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(range(20)), sorted(results))
+        self.assertEqual(1, len(set(loops)))
+
+    def test_context_of_caller_is_seen(self):
+        # Flask's request and app context are context variables like this one
+        async def job():
+            return request_name.get()
+
+        request_name.set('adopt')
+
+        self.assertEqual('adopt', self.event_loop.run(job()))
+
+    def test_exception_raised_in_caller(self):
+        async def job():
+            raise ValueError('no such pet')
+
+        with self.assertRaises(ValueError):
+            self.event_loop.run(job())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from fragment_cache import FragmentCache
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def test_rendered_once(self):
+        cache = FragmentCache(max_bytes=100)
+        renders = []
+
+        def render():
+            renders.append(1)
+            return '<p>card</p>'
+
+        self.assertEqual('<p>card</p>', cache.get(('pet', 1), render))
+        self.assertEqual('<p>card</p>', cache.get(('pet', 1), render))
+        self.assertEqual(1, len(renders))
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 0, 'bytes': 11}, cache.stats())
+
+    def test_least_recently_used_dropped_by_size(self):
+        cache = FragmentCache(max_bytes=30)
+        for key in 'abc':
+            cache.set(key, key * 10)
+        # a is used again, so b is the one to go
+        cache.get('a', lambda: self.fail('a is cached'))
+        cache.set('d', 'd' * 10)
+
+        self.assertEqual(3, len(cache))
+        self.assertEqual(30, cache.bytes)
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual('bb', cache.get('b', lambda: 'bb'))
+
+    def test_too_large_not_kept(self):
+        cache = FragmentCache(max_bytes=5)
+        cache.set('big', 'x' * 6)
+
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.bytes)
+
+    def test_replacing_a_fragment(self):
+        cache = FragmentCache(max_bytes=100)
+        cache.set('a', 'x' * 10)
+        cache.set('a', 'x' * 4)
+
+        self.assertEqual(4, cache.bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import requests
+
+from http_client import make_session
+from petfinder_stub import PetfinderStub
+from shared_store import LocalStore
+from utils import AnimalRepository
+
+
+class TestHttpSession(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=20).start()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_connections_are_reused(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+
+        for pet_id in range(1, 11):
+            animal.animal_info(pet_id)
+
+        # 1 token call and 10 animal calls, all over the same keep-alive connection
+        self.assertEqual(10, self.stub.counts['animal'])
+        self.assertEqual(1, self.stub.connections)
+
+    def test_retry_on_server_error(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore(),
+                                  session=make_session(retries=2, backoff_factor=0))
+        self.stub.fail_pages = {3}
+
+        # the page keeps answering 503, so it is asked for 3 times (1 call and 2 retries) and then skipped
+        self.assertEqual([], animal.get_page(f'{self.stub.url}/animals?limit=10', 3))
+        self.assertEqual(3, self.stub.counts['animals'])
+
+    def test_read_timeout(self):
+        self.stub.latency = 0.5
+        session = make_session(read_timeout=0.1, retries=0)
+
+        with self.assertRaises(requests.RequestException):
+            session.post(f'{self.stub.url}/oauth2/token')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import unittest
+
+from json_stream import iter_array_items, aiter_array_items
+from petfinder_stub import PetfinderStub, make_animal
+from records import PetRecord
+from shared_store import LocalStore
+from utils import AnimalRepository, Animal
+
+
+class TestIterArrayItems(unittest.TestCase):
+
+    def test_items_from_small_chunks(self):
+        # a page cut into 7 byte chunks, so items and multi-byte characters are split between chunks
+        page = {'animals': [make_animal(animal_id) for animal_id in range(1, 20)] + [{'name': 'Zoë'}],
+                'pagination': {'total_count': 20, 'count_per_page': 100}}
+        body = json.dumps(page, ensure_ascii=False).encode()
+        rest = {}
+
+        items = list(iter_array_items((body[i:i + 7] for i in range(0, len(body), 7)), 'animals', rest))
+
+        self.assertEqual(page['animals'], items)
+        self.assertEqual({'pagination': page['pagination']}, rest)
+
+    def test_async_items_from_small_chunks(self):
+        page = {'animals': [make_animal(animal_id) for animal_id in range(1, 20)] + [{'name': 'Zoë', 'age': 12}],
+                'pagination': {'total_count': 20, 'count_per_page': 100}}
+        body = json.dumps(page, ensure_ascii=False).encode()
+        rest = {}
+
+        async def chunks():
+            for i in range(0, len(body), 7):
+                yield body[i:i + 7]
+
+        async def items():
+            return [item async for item in aiter_array_items(chunks(), 'animals', rest)]
+
+        self.assertEqual(page['animals'], asyncio.run(items()))
+        self.assertEqual({'pagination': page['pagination']}, rest)
+
+    def test_cut_short(self):
+        with self.assertRaises(ValueError):
+            list(iter_array_items([b'{"animals": [{"id": 1}, {"id": 2'], 'animals'))
+
+    def test_empty_array(self):
+        self.assertEqual([], list(iter_array_items([b'{"animals": [], "pagination": {}}'], 'animals')))
+
+    def test_broken_json(self):
+        with self.assertRaises(ValueError):
+            list(iter_array_items([b'{"animals": [{"id": 1} {"id": 2}]}'], 'animals'))
+
+
+class TestAnimalRepositoryIterAnimalData(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=1500).start()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_same_animals_as_get_animal_data(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore(), page_concurrency=2)
+        animal_data = Animal('Dog', 'Small', False, False, False, False, False)
+
+        streamed = animal.iter_animal_data(animal_data, project=PetRecord.from_api)
+        expected = [PetRecord.from_api(pet) for pet in animal.get_animal_data(animal_data)]
+
+        # a generator, yielding records in page order
+        self.assertEqual(expected[0], next(streamed))
+        self.assertEqual(expected[1:], list(streamed))
+
+
+if __name__ == '__main__':
+    unittest.main()
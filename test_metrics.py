@@ -0,0 +1,132 @@
+import asyncio
+import tempfile
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from app import create_app
+from config import engine_options
+from metrics import Histogram, Metrics, stats_collector
+from petfinder_stub import PetfinderStub
+from utils import db
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_cumulative_buckets(self):
+        histogram = Histogram('search_seconds', 'Search time', ('view',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, 'adopt')
+
+        self.assertEqual('# HELP search_seconds Search time\n'
+                         '# TYPE search_seconds histogram\n'
+                         'search_seconds_bucket{view="adopt",le="0.1"} 2\n'
+                         'search_seconds_bucket{view="adopt",le="1"} 3\n'
+                         'search_seconds_bucket{view="adopt",le="+Inf"} 4\n'
+                         'search_seconds_sum{view="adopt"} 3.65\n'
+                         'search_seconds_count{view="adopt"} 4', histogram.render())
+
+    def test_stats_collector(self):
+        collect = stats_collector('cache', 'Lookups', lambda: {'hits': 3, 'misses': 1, 'size': 7},
+                                  gauges={'size': 'Entries'})
+
+        self.assertEqual('# HELP cache_total Lookups\n# TYPE cache_total counter\n'
+                         'cache_total{result="hits"} 3\ncache_total{result="misses"} 1\n'
+                         '# HELP cache_size Entries\n# TYPE cache_size gauge\ncache_size 7', collect())
+
+
+class TestInstrument(unittest.TestCase):
+
+    class Repository:
+        def search(self, animal_data):
+            return ['Fred']
+
+        async def search_async(self, animal_data):
+            raise ValueError('Bad connection')
+
+    def test_methods_timed(self):
+        metrics = Metrics()
+        repository = self.Repository()
+        metrics.instrument(repository, ('search', 'search_async'))
+
+        self.assertEqual(['Fred'], repository.search('dog'))
+        with self.assertRaises(ValueError):
+            asyncio.run(repository.search_async('dog'))
+
+        text = metrics.render()
+        self.assertIn('pawsome_repository_seconds_count{repository="Repository",method="search"} 1', text)
+        self.assertIn('pawsome_repository_seconds_count{repository="Repository",method="search_async"} 1', text)
+        self.assertIn('pawsome_repository_errors_total{repository="Repository",method="search_async"} 1', text)
+        # other instances are left alone
+        self.assertNotIn('search', vars(self.Repository()))
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.monkeypatch = MonkeyPatch()
+        self.folder = tempfile.TemporaryDirectory()
+        self.stub = PetfinderStub(animal_count=600).start()
+
+    def tearDown(self):
+        self.monkeypatch.undo()
+        self.app.extensions['event_loop'].stop()
+        self.stub.stop()
+        self.folder.cleanup()
+
+    def make_app(self, enabled=True):
+        url = f'sqlite:///{self.folder.name}/adoption.db'
+        # no adopted pets refresh, its queries would be counted along with the requests'
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': url, 'SQLALCHEMY_ENGINE_OPTIONS': engine_options(url),
+                               'METRICS_ENABLED': enabled, 'ADOPTED_FILTER': False})
+        self.app.extensions['animal_repository'].api_url = self.stub.url
+        return self.app.test_client(self)
+
+    def test_search_request_measured(self):
+        tester = self.make_app()
+        tester.get("/adopt?search=search:dog:large:00000")
+        tester.get("/adopt?search=search:dog:large:00000&page=2")
+
+        text = tester.get("/metrics").data.decode()
+        self.assertIn('pawsome_request_seconds_count{endpoint="views.pet_search_form",method="GET",status="200"} 2',
+                      text)
+        self.assertIn('pawsome_render_seconds_count{template="pet_list.html"} 2', text)
+        # token and one page for the first request, nothing for the second one answered from the cache
+        self.assertIn('pawsome_petfinder_calls_per_request_sum{endpoint="views.pet_search_form"} 2', text)
+        self.assertIn('pawsome_repository_seconds_count{repository="AnimalRepository",method="get_token"} 1', text)
+        self.assertIn('pawsome_search_cache_total{result="hits"} 1', text)
+        self.assertIn('pawsome_search_cache_hit_ratio 0.5', text)
+
+    def test_database_queries_counted(self):
+        tester = self.make_app()
+        with self.app.app_context():
+            db.create_all()
+        tester.get("/admin")
+
+        text = tester.get("/metrics").data.decode()
+        self.assertIn('pawsome_db_queries_per_request_count{endpoint="views.show_customers"} 1', text)
+        self.assertNotIn('pawsome_db_queries_per_request_sum{endpoint="views.show_customers"} 0', text)
+
+    def test_failed_request_measured(self):
+        # no tables, so the customer list fails
+        tester = self.make_app()
+        tester.get("/admin")
+
+        text = tester.get("/metrics").data.decode()
+        self.assertIn('pawsome_request_seconds_count{endpoint="views.show_customers",method="GET",status="500"} 1',
+                      text)
+        self.assertIn('pawsome_repository_errors_total{repository="CustomerRepository",method="get_customers_page"} 1',
+                      text)
+        self.assertIn('pawsome_db_query_seconds_count 1', text)
+
+    def test_switched_off(self):
+        tester = self.make_app(enabled=False)
+
+        self.assertEqual(404, tester.get("/metrics").status_code)
+        # nothing wrapped, the repositories are called directly
+        self.assertNotIn('search', vars(self.app.extensions['animal_repository']))
+        self.assertNotIn('metrics', self.app.extensions)
+
+
+if __name__ == '__main__':
+    unittest.main()
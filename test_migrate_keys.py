@@ -0,0 +1,127 @@
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+import migrate_keys
+from utils import Customer, CustomerAdoptions, CustomerRepository, Customers, db
+
+START = datetime(2022, 11, 1)
+# the tables as adoption_db.sql made them before the ids were numbered
+OLD_SCHEMA = ['''CREATE TABLE customers (
+    id VARCHAR(255) NOT NULL PRIMARY KEY, firstname VARCHAR(255), lastname VARCHAR(255), phone VARCHAR(25),
+    email VARCHAR(255), address VARCHAR(255), city_name VARCHAR(255), state VARCHAR(255), zipCode VARCHAR(255),
+    CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP)''',
+              '''CREATE TABLE customer_adoptions (
+    pet_id INT NOT NULL PRIMARY KEY, customer_id VARCHAR(255), CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP)''',
+              'CREATE INDEX customers_created_at ON customers (CreatedAt, id)',
+              'CREATE UNIQUE INDEX customers_email ON customers (email)',
+              'CREATE INDEX customers_lastname ON customers (lastname)',
+              'CREATE INDEX customers_firstname ON customers (firstname)']
+
+
+class TestMigrateKeys(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        self.connection = db.engine.connect()
+        for statement in OLD_SCHEMA:
+            self.connection.execute(text(statement))
+        # ids as the /customer form made them, which do not sort in the order customers joined
+        for number in range(30):
+            self.add_customer(number, START + timedelta(minutes=number))
+        for pet_id in range(100, 130, 2):
+            self.add_adoption(pet_id, (pet_id - 100) // 2)
+        self.connection.commit()
+
+    def tearDown(self):
+        self.connection.close()
+        db.session.remove()
+        self.context.pop()
+
+    def add_customer(self, number, created_at):
+        self.connection.execute(text('INSERT INTO customers (id, firstname, email, zipCode, CreatedAt) '
+                                     'VALUES (:id, :firstname, :email, :zipcode, :created_at)'),
+                                {'id': f'{1667300000 + (number * 7919) % 97}.5customer{number}@example.com',
+                                 'firstname': f'Name{number}', 'email': f'customer{number}@example.com',
+                                 'zipcode': '07001', 'created_at': created_at})
+
+    def add_adoption(self, pet_id, number):
+        self.connection.execute(text('INSERT INTO customer_adoptions (pet_id, customer_id) '
+                                     'SELECT :pet_id, id FROM customers WHERE email = :email'),
+                                {'pet_id': pet_id, 'email': f'customer{number}@example.com'})
+
+    def adoptions_by_email(self):
+        return dict(db.session.query(CustomerAdoptions.pet_id, Customers.email)
+                    .join(Customers, Customers.id == CustomerAdoptions.customer_id).all())
+
+    def test_copy_then_cutover(self):
+        migrate_keys.copy(self.connection, batch_size=7)
+        # the old site goes on adding customers and adoptions while the copy runs
+        self.add_customer(30, START + timedelta(days=1))
+        self.add_customer(31, None)
+        self.add_adoption(101, 30)
+        self.add_adoption(131, 5)
+        self.add_adoption(133, 31)
+        self.connection.commit()
+        migrate_keys.copy(self.connection, batch_size=7)
+
+        migrate_keys.cutover(self.connection, batch_size=7)
+
+        customers = Customers.query.order_by(Customers.id).all()
+        self.assertEqual(32, len(customers))
+        # numbered in the order the customers joined, the one without a date at the end
+        self.assertEqual([f'customer{number}@example.com' for number in range(32)],
+                         [customer.email for customer in customers])
+        self.assertEqual(list(range(1, 33)), [customer.id for customer in customers])
+        self.assertEqual('07001', customers[0].zipcode)
+        expected = {pet_id: f'customer{(pet_id - 100) // 2}@example.com' for pet_id in range(100, 130, 2)}
+        expected.update({101: 'customer30@example.com', 131: 'customer5@example.com',
+                         133: 'customer31@example.com'})
+        self.assertEqual(expected, self.adoptions_by_email())
+        # the old id is kept
+        legacy_id = self.connection.execute(text('SELECT legacy_id FROM customers WHERE id = 1')).scalar()
+        self.assertTrue(legacy_id.endswith('customer0@example.com'))
+        self.assertEqual({'customers_created_at', 'customers_email', 'customers_lastname', 'customers_firstname'},
+                         {index['name'] for index in inspect(self.connection).get_indexes('customers')}
+                         - {'customers_new_legacy_id'})
+
+    def test_new_customers_numbered_after_migration(self):
+        migrate_keys.copy(self.connection)
+        migrate_keys.cutover(self.connection)
+
+        customer_id = CustomerRepository.customer_adopt(Customer(None, 'bob', 'builder', '', 'bob@example.com',
+                                                                 '', '', '', ''), 500)
+        page = CustomerRepository.get_customers_page(per_page=5)
+
+        self.assertEqual(31, customer_id)
+        self.assertEqual('bob@example.com', page.customers[0].email)
+        self.assertIsNotNone(CustomerRepository.get_customers_page(page.next_cursor).customers)
+
+    def test_drop_old(self):
+        migrate_keys.copy(self.connection)
+        with self.assertRaises(RuntimeError):
+            migrate_keys.drop_old(self.connection)
+        migrate_keys.cutover(self.connection)
+
+        migrate_keys.drop_old(self.connection)
+
+        tables = inspect(self.connection).get_table_names()
+        self.assertEqual(['customer_adoptions', 'customers'], sorted(tables))
+        self.assertNotIn('customers_new_legacy_id',
+                         [index['name'] for index in inspect(self.connection).get_indexes('customers')])
+        self.assertNotIn('legacy_id', [column['name'] for column in inspect(self.connection).get_columns('customers')])
+        # run again, it finds nothing left to drop
+        migrate_keys.drop_old(self.connection)
+        # and there is nothing left to migrate
+        with self.assertRaises(RuntimeError):
+            migrate_keys.copy(self.connection)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from petfinder_query import AnimalQuery
+from utils import Animal, AnimalRepository
+
+
+class TestAnimalQuery(unittest.TestCase):
+
+    def test_unticked_boxes_left_out(self):
+        query = AnimalQuery.from_animal(Animal('Dog', 'Large', False, False, False, False, False))
+
+        self.assertEqual('type=Dog&size=Large&status=adoptable&limit=100', query.query_string())
+
+    def test_ticked_boxes_sent_as_true(self):
+        query = AnimalQuery.from_animal(Animal('Cat', 'Small', True, True, False, True, False))
+
+        self.assertEqual('type=Cat&size=Small&good_with_children=true&good_with_dogs=true&house_trained=true'
+                         '&status=adoptable&limit=100', query.query_string())
+
+    def test_age_and_sort_pushed_upstream(self):
+        query = AnimalQuery.from_animal(Animal('Dog', 'Medium', False, False, True, False, False))
+
+        self.assertEqual('type=Dog&size=Medium&age=senior&good_with_cats=true&status=adoptable&sort=recent'
+                         '&limit=100', query.replace(age='senior', sort='recent').query_string())
+
+    def test_values_encoded(self):
+        query = AnimalQuery(type='Small & Furry', age=['senior', 'adult'], after='2022-12-01T10:00:00+0000')
+
+        self.assertEqual('type=Small+%26+Furry&age=senior,adult&after=2022-12-01T10%3A00%3A00%2B0000',
+                         query.query_string())
+
+    def test_replace_with_none_removes_filter(self):
+        query = AnimalQuery(type='Dog', age='senior').replace(age=None)
+
+        self.assertEqual('type=Dog', query.query_string())
+
+    def test_unknown_parameter_and_sort(self):
+        with self.assertRaises(ValueError):
+            AnimalQuery(colour='Black')
+        with self.assertRaises(ValueError):
+            AnimalQuery(sort='oldest')
+
+    def test_search_url(self):
+        # the search used to send 'good_with_dogsfalse', with no '='
+        animal = AnimalRepository(api_url='https://api.petfinder.com/v2')
+        url = animal.search_url(Animal('Dog', 'Large', False, True, False, False, False))
+
+        self.assertEqual('https://api.petfinder.com/v2/animals?type=Dog&size=Large&good_with_dogs=true'
+                         '&status=adoptable&limit=100', url)
+
+
+if __name__ == '__main__':
+    unittest.main()
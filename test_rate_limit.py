@@ -0,0 +1,226 @@
+import asyncio
+import time
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from catalogue import CatalogueWarmer
+from event_loop import EventLoopThread
+from http_client import httpx
+from petfinder_stub import PetfinderStub
+from rate_limit import RateLimiter, RateLimitedError, LOW
+from shared_store import LocalStore
+from utils import AnimalRepository, Animal
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_waits_for_the_next_second(self):
+        limiter = RateLimiter(rate=5, daily_limit=0)
+
+        start = time.perf_counter()
+        for _ in range(12):
+            limiter.acquire()
+
+        # 12 calls at 5 a second need at least two more windows
+        self.assertGreater(time.perf_counter() - start, 1)
+        self.assertGreater(limiter.throttled, 0)
+        self.assertEqual(0, limiter.rejected)
+
+    def test_gives_up_after_max_wait(self):
+        limiter = RateLimiter(rate=1, daily_limit=0, max_wait=0)
+        limiter.acquire()
+
+        with self.assertRaises(RateLimitedError) as raised:
+            limiter.acquire()
+        self.assertLessEqual(raised.exception.retry_after, 1)
+        self.assertEqual(1, limiter.rejected)
+
+    def test_daily_budget(self):
+        limiter = RateLimiter(rate=100, daily_limit=3, low_budget=0, max_wait=0)
+        for _ in range(3):
+            limiter.acquire()
+
+        with self.assertRaises(RateLimitedError):
+            limiter.acquire()
+        self.assertEqual(0, limiter.remaining())
+
+    def test_low_priority_refused_when_budget_low(self):
+        limiter = RateLimiter(rate=100, daily_limit=10, low_budget=5, max_wait=0)
+        for _ in range(5):
+            limiter.acquire(LOW)
+
+        # the last five calls of the day are kept for first pages
+        with self.assertRaises(RateLimitedError):
+            limiter.acquire(LOW)
+        limiter.acquire()
+        self.assertTrue(limiter.budget_low())
+
+    def test_429_blocks_every_caller(self):
+        store = LocalStore()
+        first, second = RateLimiter(store, daily_limit=0, max_wait=0), RateLimiter(store, daily_limit=0, max_wait=0)
+
+        first.update(429, {'Retry-After': '30'})
+
+        with self.assertRaises(RateLimitedError) as raised:
+            second.acquire()
+        self.assertGreater(raised.exception.retry_after, 29)
+
+    def test_remaining_header(self):
+        limiter = RateLimiter(daily_limit=1000, low_budget=100)
+
+        limiter.update(200, {'X-RateLimit-Remaining': '40', 'X-RateLimit-Reset': '600'})
+
+        # Petfinder knows about calls made before this process started
+        self.assertEqual(40, limiter.remaining())
+        self.assertTrue(limiter.budget_low())
+
+    def test_workers_share_a_store(self):
+        # two workers with one budget, as with a RedisStore
+        store = LocalStore()
+        first = RateLimiter(store, rate=100, daily_limit=4, low_budget=0, max_wait=0)
+        second = RateLimiter(store, rate=100, daily_limit=4, low_budget=0, max_wait=0)
+        first.acquire()
+        first.acquire()
+        second.acquire()
+        second.acquire()
+
+        with self.assertRaises(RateLimitedError):
+            first.acquire()
+        self.assertEqual(0, second.remaining())
+
+    def test_acquire_async(self):
+        limiter = RateLimiter(rate=5, daily_limit=0)
+
+        async def calls():
+            await asyncio.gather(*(limiter.acquire_async() for _ in range(12)))
+
+        start = time.perf_counter()
+        asyncio.run(calls())
+
+        # as in the blocking test - the first window may be nearly over, the second is a whole one
+        self.assertGreater(time.perf_counter() - start, 1)
+        self.assertGreater(limiter.throttled, 0)
+
+
+class TestAnimalRepositoryRateLimited(unittest.TestCase):
+
+    # the fake Petfinder with a daily quota, and searches of 10 animals per page
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=300, daily_limit=100).start()
+        self.store = LocalStore()
+        self.animal = AnimalRepository(api_url=self.stub.url, store=self.store)
+        self.animal_data = Animal('Dog', 'Large', False, False, False, False, False)
+        self.monkeypatch = MonkeyPatch()
+        self.monkeypatch.setattr(AnimalRepository, 'search_url',
+                                 lambda repo, data: f'{repo.api_url}/animals?type={data.cat_or_dog}'
+                                                    f'&size={data.select_size}&status=adoptable&limit=10')
+
+    def tearDown(self):
+        self.monkeypatch.undo()
+        self.stub.stop()
+
+    def test_pages_trimmed_when_budget_low(self):
+        self.animal.get_token()
+        # Petfinder's headers say most of today's calls are gone
+        self.animal.rate_limiter.update(200, {'X-RateLimit-Remaining': '50'})
+
+        result = self.animal.search(self.animal_data)
+
+        self.assertEqual(20, len(result))
+        self.assertEqual(2, self.stub.counts['animals'])
+
+    def test_429_from_petfinder(self):
+        # Petfinder allows one call a second, the search's first page comes straight after the token
+        self.stub.rate_limit = 1
+
+        with self.assertRaises(RateLimitedError):
+            self.animal.search(self.animal_data)
+        # the other workers do not try again before Retry-After
+        self.assertIsNotNone(self.store.get('petfinder:rate:blocked'))
+        self.assertEqual(1, self.stub.counts['rejected'])
+
+    def test_daily_budget_used_up(self):
+        # the token's rate-limit headers say it was the last call of the day
+        self.stub.daily_limit = 1
+
+        with self.assertRaises(RateLimitedError):
+            self.animal.search(self.animal_data)
+        # refused here, without asking Petfinder
+        self.assertEqual(0, self.stub.counts['rejected'])
+        self.assertEqual(0, self.animal.rate_limiter.remaining())
+
+    def test_search_falls_back_to_stale_catalogue(self):
+        warmer = CatalogueWarmer(self.animal)
+        self.animal.catalogue = warmer.index
+        self.stub.daily_limit = None
+        warmer.crawl()
+        # the index is out of date and Petfinder refuses every call
+        warmer.index.updated_at -= 24 * 3600
+        self.animal.rate_limiter.update(429, {'Retry-After': '60'})
+
+        result = self.animal.search(self.animal_data)
+
+        expected = [pet['id'] for pet in self.stub.animals if pet['type'] == 'Dog' and pet['size'] == 'Large']
+        self.assertEqual(sorted(expected), sorted(pet['id'] for pet in result))
+
+    def test_refused_pages_only_cached_briefly(self):
+        # two calls a second: the token and the first page, the later pages are refused
+        self.animal.rate_limiter = RateLimiter(self.store, rate=2, max_wait=0)
+
+        result = self.animal.search(self.animal_data)
+
+        expected = [pet['id'] for pet in self.stub.animals if pet['type'] == 'Dog' and pet['size'] == 'Large']
+        self.assertTrue(result.partial)
+        self.assertLess(len(result), len(expected))
+        _, fresh_until = self.animal.search_cache.store.get(self.animal_data.cache_key())
+        self.assertLessEqual(fresh_until - time.time(), self.animal.search_cache.partial_ttl)
+
+    def test_crawl_with_refused_pages_leaves_the_index(self):
+        # one type, so the first page is read and the second (of 100 animals a page) is refused
+        warmer = CatalogueWarmer(self.animal, types=('Dog',))
+        self.stub.daily_limit = None
+        self.animal.rate_limiter = RateLimiter(self.store, rate=2, max_wait=0)
+
+        self.assertEqual(0, warmer.crawl())
+        self.assertIsNone(warmer.index.updated_at)
+        self.assertEqual({}, warmer.index.animals)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_refused_pages_on_the_event_loop(self):
+        self.animal.event_loop = EventLoopThread()
+        self.animal.rate_limiter = RateLimiter(self.store, rate=2, max_wait=0)
+        try:
+            result = self.animal.search(self.animal_data)
+        finally:
+            self.animal.event_loop.stop()
+        self.assertTrue(result.partial)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_rate_limited_on_the_event_loop(self):
+        self.animal.event_loop = EventLoopThread()
+        self.animal.rate_limiter.update(429, {'Retry-After': '60'})
+        try:
+            with self.assertRaises(RateLimitedError):
+                self.animal.search(self.animal_data)
+        finally:
+            self.animal.event_loop.stop()
+        self.assertEqual(0, self.stub.counts['animals'])
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_429_from_petfinder_on_the_event_loop(self):
+        self.animal.event_loop = EventLoopThread()
+        # the token is fetched first, so the search's first page is the call over the limit
+        self.animal.get_token()
+        self.stub.rate_limit = 1
+        try:
+            with self.assertRaises(RateLimitedError):
+                self.animal.search(self.animal_data)
+        finally:
+            self.animal.event_loop.stop()
+        self.assertIsNotNone(self.store.get('petfinder:rate:blocked'))
+        self.assertEqual(1, self.stub.counts['rejected'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import pickle
+import unittest
+
+from petfinder_stub import make_animal
+from records import PetRecord
+from utils import AnimalRepository
+
+
+class TestPetRecord(unittest.TestCase):
+
+    def test_projection_keeps_fields_the_app_uses(self):
+        animal = make_animal(8)
+        record = PetRecord.from_api(animal)
+
+        self.assertEqual(animal['name'], record['name'])
+        self.assertEqual(animal['age'], record.get('age'))
+        self.assertEqual(animal['breeds']['primary'], record['breed'])
+        self.assertEqual(animal['photos'][0]['medium'], AnimalRepository.photo_url(record))
+        self.assertEqual(animal['photos'][0]['large'], record.photo_url('large'))
+        self.assertEqual(animal['environment']['children'], record['good_with_children'])
+
+    def test_fields_that_are_not_kept(self):
+        record = PetRecord.from_api(make_animal(8))
+
+        with self.assertRaises(KeyError):
+            record['contact']
+        self.assertIsNone(record.get('_links'))
+
+    def test_pickle_round_trip(self):
+        # records are pickled when the search cache is kept in redis
+        record = PetRecord.from_api(make_animal(8))
+
+        self.assertEqual(record, pickle.loads(pickle.dumps(record)))
+
+
+if __name__ == '__main__':
+    unittest.main()
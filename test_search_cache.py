@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from search_cache import SearchCache
+from shared_store import LRUStore, RedisStore, store_call
+from utils import Animal
+
+
+class FakeRedis:
+    # local stand-in for a redis client, just the calls RedisStore makes
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is None or (item[1] is not None and item[1] <= time.monotonic()):
+            return None
+        return item[0]
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and self.get(key) is not None:
+            return None
+        self.data[key] = (value, time.monotonic() + px / 1000 if px else None)
+        return True
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incrby(self, key, amount):
+        value = int(self.get(key) or 0) + amount
+        self.data[key] = (value, self.data.get(key, (0, None))[1])
+        return value
+
+    def pexpire(self, key, ms):
+        self.data[key] = (self.data[key][0], time.monotonic() + ms / 1000)
+
+
+class FakePipeline:
+    # queues the calls and runs them on execute(), the one round trip
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def set(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [self.client.set(*args, **kwargs) for args, kwargs in self.calls]
+
+
+class TestSearchCache(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = SearchCache(LRUStore(10))
+        calls = []
+
+        for _ in range(3):
+            result = cache.get('search:dog:large:00000', lambda: calls.append(1) or ['Fred'])
+
+        self.assertEqual(['Fred'], result)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({'hits': 2, 'misses': 1, 'stale_hits': 0, 'evictions': 0}, cache.stats())
+
+    def test_least_recently_used_entry_evicted(self):
+        cache = SearchCache(LRUStore(2))
+        cache.get('a', lambda: 'a')
+        cache.get('b', lambda: 'b')
+        # reading 'a' again makes 'b' the least recently used entry
+        cache.get('a', lambda: 'a')
+        cache.get('c', lambda: 'c')
+
+        self.assertIsNone(cache.store.get('b'))
+        self.assertIsNotNone(cache.store.get('a'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_stale_entry_served_while_one_refresh_runs(self):
+        cache = SearchCache(LRUStore(10), ttl=0, stale_ttl=60)
+        cache.get('key', lambda: 'old')
+        refreshes = []
+        release = threading.Event()
+
+        def slow_loader():
+            refreshes.append(1)
+            release.wait(5)
+            return 'new'
+
+        # the entry is already stale, every request still gets the old result straight away
+        results = [cache.get('key', slow_loader) for _ in range(10)]
+        release.set()
+
+        self.assertEqual(['old'] * 10, results)
+        self.assertEqual(1, len(refreshes))
+        self.assertEqual(10, cache.stats()['stale_hits'])
+
+    def test_shared_backend_between_workers(self):
+        # two caches on one redis stand in for two gunicorn workers
+        redis_store = RedisStore(FakeRedis())
+        first = SearchCache(redis_store, lock_store=redis_store)
+        second = SearchCache(redis_store, lock_store=redis_store)
+        calls = []
+
+        first.get('key', lambda: calls.append(1) or [{'id': 1}])
+        result = second.get('key', lambda: calls.append(1) or [{'id': 2}])
+
+        self.assertEqual([{'id': 1}], result)
+        self.assertEqual(1, len(calls))
+
+    def test_set_many(self):
+        client = FakeRedis()
+        for store in (LRUStore(3), RedisStore(client)):
+            with self.subTest(store=type(store).__name__):
+                store.set('a', 'old')
+                store.set_many({'a': [1], 'b': [2], 'c': [3]}, ttl=60)
+
+                self.assertEqual([[1], [2], [3]], [store.get(key) for key in 'abc'])
+        self.assertEqual(1, client.round_trips)
+
+    def test_set_many_evicts_least_recently_used(self):
+        store = LRUStore(2)
+        store.set('a', 1)
+        store.set_many({'b': 2, 'c': 3})
+
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(1, store.evictions)
+
+    def test_redis_calls_off_the_event_loop(self):
+        async def thread_of_call(store):
+            loop_thread = threading.current_thread()
+            return await store_call(store, lambda: threading.current_thread() is loop_thread)
+
+        self.assertTrue(asyncio.run(thread_of_call(LRUStore(1))))
+        self.assertFalse(asyncio.run(thread_of_call(RedisStore(FakeRedis()))))
+
+    def test_cache_key_normalised(self):
+        first = Animal('Dog', 'Large', True, None, False, '', True)
+        second = Animal('dog', 'large', 'y', False, False, False, 1)
+
+        self.assertEqual(first.cache_key(), second.cache_key())
+        self.assertEqual('search:dog:large:10001', first.cache_key())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+
+from shared_store import LocalStore
+from single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_threads(self, count, target):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_one_call_for_many_threads(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['Fred']
+
+        self.run_threads(20, lambda: results.append(flight.do('search:dog:large:00000', fetch)))
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([['Fred']] * 20, results)
+        self.assertEqual({'flights': 1, 'coalesced': 19, 'coalesced_remote': 0}, flight.stats())
+
+    def test_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        errors = []
+
+        def fetch():
+            time.sleep(0.1)
+            raise ValueError('Bad connection')
+
+        def search():
+            try:
+                flight.do('search:dog:large:00000', fetch)
+            except ValueError as error:
+                errors.append(error)
+
+        self.run_threads(5, search)
+
+        self.assertEqual(5, len(errors))
+
+    def test_waits_on_another_worker(self):
+        # two workers sharing a lock store, and the cache the first one fills
+        shared_locks, shared_cache = LocalStore(), {}
+        first, second = SingleFlight(shared_locks, poll_interval=0.01), SingleFlight(shared_locks, poll_interval=0.01)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            shared_cache['search:dog:large:00000'] = ['Fred']
+            return ['Fred']
+
+        worker = threading.Thread(target=lambda: first.do('search:dog:large:00000', fetch))
+        worker.start()
+        time.sleep(0.05)
+        result = second.do('search:dog:large:00000', fetch, check=lambda: shared_cache.get('search:dog:large:00000'))
+        worker.join()
+
+        self.assertEqual(['Fred'], result)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, second.stats()['coalesced_remote'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+from petfinder_stub import PetfinderStub
+from shared_store import LocalStore
+from token_manager import TokenManager
+from utils import AnimalRepository
+
+
+class TestTokenManager(unittest.TestCase):
+
+    def setUp(self):
+        # local fake Petfinder, counting every call made to the token endpoint
+        self.stub = PetfinderStub(animal_count=5, latency=0.05).start()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_token_fetched_once_under_concurrent_load(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+        tokens = []
+
+        # 20 threads all asking for a token at the same time, like 20 simultaneous searches
+        def worker():
+            tokens.append(animal.get_token())
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, self.stub.counts['token'])
+        self.assertEqual(1, len(set(tokens)))
+
+    def test_token_shared_between_workers(self):
+        # two repositories on one store stand in for two gunicorn workers sharing redis
+        store = LocalStore()
+        first = AnimalRepository(api_url=self.stub.url, store=store)
+        second = AnimalRepository(api_url=self.stub.url, store=store)
+
+        self.assertEqual(first.get_token(), second.get_token())
+        self.assertEqual(1, self.stub.counts['token'])
+
+    def test_token_refreshed_when_about_to_expire(self):
+        # token lasts 1.5 seconds and is dropped 0.5 seconds early, so it is kept for 1 second
+        self.stub.token_ttl = 1.5
+        manager = TokenManager(AnimalRepository(api_url=self.stub.url).request_token, store=LocalStore(),
+                               refresh_margin=0.5)
+        manager.get_token()
+        manager.get_token()
+        self.assertEqual(1, self.stub.counts['token'])
+
+        time.sleep(1.1)
+        manager.get_token()
+        self.assertEqual(2, self.stub.counts['token'])
+
+    def test_retry_once_on_401(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+        animal.get_token()
+        # the stub forgets the token, so the cached one is rejected with a 401
+        self.stub.revoke_tokens()
+
+        result = animal.animal_info(1)
+
+        self.assertEqual(1, result['id'])
+        self.assertEqual(2, self.stub.counts['token'])
+
+
+if __name__ == '__main__':
+    unittest.main()
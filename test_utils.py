@@ -1,7 +1,18 @@
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from flask import Flask
-from utils import CustomerRepository, AnimalRepository, Customer, Customers, Animal, db
+from utils import CustomerRepository, AnimalRepository, Customer, Customers, CustomerAdoptions, Animal, db, \
+    AlreadyAdoptedError
 from _pytest.monkeypatch import MonkeyPatch
+from event_loop import EventLoopThread
+from http_client import httpx
+from petfinder_stub import PetfinderStub
+from ranking import rank_by_age
+from shared_store import LocalStore
 
 
 class TestCustomerRepositoryGetCustomer(unittest.TestCase):
@@ -9,24 +20,91 @@ class TestCustomerRepositoryGetCustomer(unittest.TestCase):
     def setUp(self):
         self.monkeypatch = MonkeyPatch()
 
+    def tearDown(self):
+        self.monkeypatch.undo()
+
     # no test to write
     def test_get_customers(self):
         pass
 
 
+class TestCustomerRepositoryGetCustomersPage(unittest.TestCase):
+
+    # a real (in-memory SQLite) database this time, as the paging is done by the query itself
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        start = datetime(2022, 11, 1)
+        # 25 customers, two of them created in the same second to check the id tie-break
+        for number in range(25):
+            db.session.add(Customers(id=number + 1, firstname=f'Name{number}', lastname='Builder',
+                                     email=f'customer{number:03d}@example.com',
+                                     created_at=start + timedelta(seconds=min(number, 23))))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def test_pages_follow_cursor_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            page = CustomerRepository.get_customers_page(cursor, per_page=10)
+            seen.extend(customer.id for customer in page.customers)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        self.assertEqual(list(reversed(range(1, 26))), seen)
+        self.assertEqual(25, page.total_estimate)
+
+    def test_prefix_search(self):
+        page = CustomerRepository.get_customers_page(search='customer01')
+
+        self.assertEqual([20, 19, 18, 17, 16, 15, 14, 13, 12, 11],
+                         [customer.id for customer in page.customers])
+        self.assertEqual(10, page.total_estimate)
+        self.assertIsNone(page.next_cursor)
+
+    def test_prefix_search_ignores_case_and_wildcards(self):
+        db.session.add(Customers(id=26, firstname='Liz', lastname='Zhang', email='liz_100%@example.com',
+                                 created_at=datetime(2022, 11, 2)))
+        db.session.commit()
+
+        for search in ('Liz', 'liz', 'LIZ_1', 'liz_100%'):
+            with self.subTest(search=search):
+                self.assertEqual([26], [customer.id for customer in
+                                        CustomerRepository.get_customers_page(search=search).customers])
+        self.assertEqual([], CustomerRepository.get_customers_page(search='liz%1').customers)
+        self.assertEqual([], CustomerRepository.get_customers_page(search='li_').customers)
+
+    def test_bad_cursor(self):
+        with self.assertRaises(ValueError):
+            CustomerRepository.get_customers_page('not-a-cursor')
+
+
 class TestCustomerRepositoryAddCustomer(unittest.TestCase):
 
     # initial setup of monkeypatch
     def setUp(self):
         self.monkeypatch = MonkeyPatch()
 
+    def tearDown(self):
+        self.monkeypatch.undo()
+
     def test_add_customer_when_cust_does_not_already_exist(self):
         # configuring the Flask connection to run the test, as the db in this function is a Flask feature
         app = Flask(__name__)
         app.config['SECRET_KEY'] = 'secret key'
 
-        # creating an object of the Customer class for input to the function
-        customer = Customer('12345678+bob.builder@gmail.com', 'bob', 'builder', '0123456789', 'bob.builder@gmail.com',
+        # creating an object of the Customer class for input to the function - a new customer has no id yet
+        customer = Customer(None, 'bob', 'builder', '0123456789', 'bob.builder@gmail.com',
                             'bob street', 'bob city',
                             'bob state', 'bob zip')
 
@@ -47,11 +125,18 @@ class TestCustomerRepositoryAddCustomer(unittest.TestCase):
                 return None
 
         # second class has methods mocking adding the customer info to the database and committing to the database
+        # flush numbers the new customer as the database would
         class FakeDB:
             def session(self):
                 return self
 
-            def add(self, new_customer):
+            def add(self, new_row):
+                if isinstance(new_row, Customers):
+                    self.new_customer = new_row
+                return self
+
+            def flush(self):
+                self.new_customer.id = 1
                 return self
 
             def commit(self):
@@ -64,8 +149,8 @@ class TestCustomerRepositoryAddCustomer(unittest.TestCase):
             self.monkeypatch.setattr(Customers, 'query', FakeQuery())
             self.monkeypatch.setattr(db, 'session', FakeDB())
 
-            # expected result from the test should be customer.id
-            expected = customer.id
+            # expected result from the test should be the id the database gave the new customer
+            expected = 1
 
             # running the method of add_customer the CustomerRepository class
             result = CustomerRepository().customer_adopt(customer, 1234567)
@@ -80,7 +165,7 @@ class TestCustomerRepositoryAddCustomer(unittest.TestCase):
 
         # creating an object of the Customer class for input to the Monkeypatch function
         # pretending that this customer already exists in the database
-        customer = Customer('12345678+bob.builder@gmail.com', 'bob', 'builder', '0123456789', 'bob.builder@gmail.com',
+        customer = Customer(12345678, 'bob', 'builder', '0123456789', 'bob.builder@gmail.com',
                             'bob street', 'bob city',
                             'bob state', 'bob zip')
 
@@ -109,13 +194,12 @@ class TestCustomerRepositoryAddCustomer(unittest.TestCase):
             self.monkeypatch.setattr(Customers, 'query', FakeQuery())
             self.monkeypatch.setattr(db, 'session', FakeDB())
 
-            # creating second customer as input to the test function
-            # expecting this ID to be changed to the ID of the customer that was originally already in database
-            customer2 = Customer('987654321+bob.builder@gmail.com', 'bob', 'builder', '0123456789',
+            # creating second customer as input to the test function, not numbered yet
+            # expecting the ID of the customer that was originally already in database
+            customer2 = Customer(None, 'bob', 'builder', '0123456789',
                                  'bob.builder@gmail.com', 'bob street', 'bob city', 'bob state', 'bob zip')
 
             # expected result from the test should be this pre-existing customer.id as they are already in database
-            # customer2.id should be overwritten
             expected = customer.id
 
             # running the method of add_customer the CustomerRepository class
@@ -124,20 +208,77 @@ class TestCustomerRepositoryAddCustomer(unittest.TestCase):
             self.assertEqual(expected, result)
 
 
+class TestCustomerRepositoryCustomerAdoptConcurrent(unittest.TestCase):
+
+    # concurrent adoptions against a real SQLite database file, each thread with its own app context
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{self.folder.name}/adoption.db'
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.folder.cleanup()
+
+    def adopt_all(self, adoptions):
+        results = []
+
+        def adopt(customer, pet_id):
+            with self.app.app_context():
+                try:
+                    results.append(CustomerRepository.customer_adopt(customer, pet_id))
+                except AlreadyAdoptedError:
+                    results.append('already adopted')
+
+        threads = [threading.Thread(target=adopt, args=adoption) for adoption in adoptions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_same_new_customer_adopting_at_once(self):
+        # 20 adoptions by the same new customer arriving at the same time
+        results = self.adopt_all([(Customer(None, 'bob', 'builder', '', 'bob@example.com',
+                                            '', '', '', ''), 1000 + number) for number in range(20)])
+
+        with self.app.app_context():
+            self.assertEqual(1, Customers.query.count())
+            self.assertEqual(20, CustomerAdoptions.query.count())
+        # every adoption went to the one customer that was saved
+        self.assertEqual(1, len(set(results)))
+
+    def test_same_pet_adopted_at_once(self):
+        results = self.adopt_all([(Customer(None, 'bob', 'builder', '', f'bob{number}@example.com',
+                                            '', '', '', ''), 1234) for number in range(10)])
+
+        self.assertEqual(9, results.count('already adopted'))
+        with self.app.app_context():
+            self.assertEqual(1, CustomerAdoptions.query.count())
+
+
 class TestAnimalRepositoryGetToken(unittest.TestCase):
 
     # setup monkeypatch
     def setUp(self):
         self.monkeypatch = MonkeyPatch()
 
+    def tearDown(self):
+        self.monkeypatch.undo()
+
     def test_get_token_bad_response(self):
         # creating a class with an attribute set to have any status code that isn't 200
         # so the ValueError will be raised
         class BadResponse:
             status_code = 400
 
-        # Monkeypatching to pretend the outcome of requests.post has a status code of 400
-        self.monkeypatch.setattr('requests.post', lambda a, headers, data: BadResponse())
+        # Monkeypatching to pretend the outcome of the session's post has a status code of 400
+        self.monkeypatch.setattr('requests.Session.post', lambda session, a, headers, data: BadResponse())
 
         # creating an instance of the AnimalRepository class so the get_token() method can be called
         animal = AnimalRepository()
@@ -155,9 +296,9 @@ class TestAnimalRepositoryGetToken(unittest.TestCase):
                 dict = {'access_token': 'token'}
                 return dict
 
-        # Monkeypatching to set the return value of the requests.post method to be GoodResponse()
+        # Monkeypatching to set the return value of the session's post method to be GoodResponse()
         # so status code will be 200 and the json method can be applied
-        self.monkeypatch.setattr('requests.post', lambda a, headers, data: GoodResponse())
+        self.monkeypatch.setattr('requests.Session.post', lambda session, a, headers, data: GoodResponse())
 
         # creating an instance of the AnimalRepository() class so the get_token method can be called
         animal = AnimalRepository()
@@ -173,6 +314,9 @@ class TestAnimalRepositoryGetAnimalData(unittest.TestCase):
     def setUp(self):
         self.monkeypatch = MonkeyPatch()
 
+    def tearDown(self):
+        self.monkeypatch.undo()
+
     def test_get_animal_data_bad_response(self):
         # creating an instance of the Animal() class to use as an input to the method
         animal_data = Animal('cat', 'small', True, True, True, True, True)
@@ -189,8 +333,8 @@ class TestAnimalRepositoryGetAnimalData(unittest.TestCase):
         # here I am just monkeypatching a response from this function to test the get_animal_data function
         self.monkeypatch.setattr(AnimalRepository, 'get_token', lambda _: 'test')
 
-        # Monkeypatching to pretend the outcome of requests.post has a status code of 400
-        self.monkeypatch.setattr('requests.get', lambda a, headers: BadResponse())
+        # Monkeypatching to pretend the outcome of the session's get has a status code of 400
+        self.monkeypatch.setattr('requests.Session.get', lambda session, a, headers: BadResponse())
 
         with self.assertRaises(ValueError):
             animal.get_animal_data(animal_data)
@@ -217,14 +361,64 @@ class TestAnimalRepositoryGetAnimalData(unittest.TestCase):
         # here I am just monkeypatching a response from this function to test the get_animal_data function
         self.monkeypatch.setattr(AnimalRepository, 'get_token', lambda _: 'test')
 
-        # Monkeypatching to pretend the outcome of requests.post has a status code of 200
-        self.monkeypatch.setattr('requests.get', lambda a, headers: GoodResponse())
+        # Monkeypatching to pretend the outcome of the session's get has a status code of 200
+        self.monkeypatch.setattr('requests.Session.get', lambda session, a, headers: GoodResponse())
 
         expected = ['animal1', 'animal2', 'animal3']
 
         self.assertEqual(expected, animal.get_animal_data(animal_data))
 
 
+class TestAnimalRepositoryGetAnimalDataPages(unittest.TestCase):
+
+    # local fake Petfinder with 450 cats and dogs, so a search for dogs of one size gives 75 animals
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=450).start()
+        self.animal_data = Animal('Dog', 'Large', False, False, False, False, False)
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_pages_fetched_in_parallel_keep_page_order(self):
+        # asking for 10 animals per page is not possible through the app, so the stub is searched with limit=10
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore(), page_concurrency=4)
+        self.monkeypatch_limit(10)
+
+        result = animal.get_animal_data(self.animal_data)
+
+        expected = [pet['id'] for pet in self.stub.animals if pet['type'] == 'Dog' and pet['size'] == 'Large']
+        self.assertEqual(expected, [pet['id'] for pet in result])
+        self.assertEqual(8, self.stub.counts['animals'])
+
+    def test_failed_page_is_skipped(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+        self.monkeypatch_limit(10)
+        self.stub.fail_pages = {3}
+
+        result = animal.get_animal_data(self.animal_data)
+
+        # one page of 10 animals is missing, the rest of the search is still returned
+        self.assertEqual(65, len(result))
+
+    def test_page_cap(self):
+        animal = AnimalRepository(api_url=self.stub.url, store=LocalStore(), max_pages=2)
+        self.monkeypatch_limit(10)
+
+        result = animal.get_animal_data(self.animal_data)
+
+        self.assertEqual(20, len(result))
+        self.assertEqual(2, self.stub.counts['animals'])
+
+    def monkeypatch_limit(self, limit):
+        # the stub reads the page size from the query string, so swap limit=100 for a smaller page
+        original = AnimalRepository.authorised_get
+        monkeypatch = MonkeyPatch()
+        monkeypatch.setattr(AnimalRepository, 'authorised_get',
+                            lambda repo, url, **options: original(repo, url.replace('limit=100', f'limit={limit}'),
+                                                                  **options))
+        self.addCleanup(monkeypatch.undo)
+
+
 class TestAnimalRepositoryAgeCheck(unittest.TestCase):
 
     def test_age_check_senior_animal_in_list(self):
@@ -244,6 +438,24 @@ class TestAnimalRepositoryAgeCheck(unittest.TestCase):
         self.assertEqual(expected, animal.age_check(animals))
 
 
+class TestAnimalRepositoryRankAnimals(unittest.TestCase):
+
+    def test_rank_animals_senior_first(self):
+        animals = [{"Name": "Teddy", "age": "Baby"}, {"Name": "Fred", "age": "Senior"},
+                   {"Name": "Rex", "age": "Adult"}, {"Name": "Tom", "age": "Senior"}]
+        # seniors first in their original order, nobody is dropped
+        expected = ["Fred", "Tom", "Rex", "Teddy"]
+        animal = AnimalRepository()
+        self.assertEqual(expected, [pet["Name"] for pet in animal.rank_animals(animals)])
+
+    def test_rank_by_age_custom_priority_and_unknown_age(self):
+        animals = [{"Name": "Teddy", "age": "Baby"}, {"Name": "Fred", "age": "Senior"}, {"Name": "Bob", "age": None}]
+        expected = ["Teddy", "Fred", "Bob"]
+        result = rank_by_age(animals, priority=("Baby", "Senior"), lazy=True)
+        # lazy gives an iterator rather than a list
+        self.assertEqual(expected, [pet["Name"] for pet in result])
+
+
 class TestAnimalRepositoryAnimalReturn(unittest.TestCase):
 
     def test_animal_return(self):
@@ -261,16 +473,21 @@ class TestAnimalRepositoryAnimalInfo(unittest.TestCase):
     def setUp(self):
         self.monkeypatch = MonkeyPatch()
 
+    def tearDown(self):
+        self.monkeypatch.undo()
+
     def test_animal_info_key_in_dict(self):
         # creating a class with a method to pretend to be running as the .json function
         class GoodResponse:
+            status_code = 200
+
             def json(self):
                 my_dict = {'animal': 'cat'}
                 return my_dict
 
         self.monkeypatch.setattr(AnimalRepository, 'get_token', lambda _: 'test')
 
-        self.monkeypatch.setattr('requests.get', lambda a, headers: GoodResponse())
+        self.monkeypatch.setattr('requests.Session.get', lambda session, a, headers: GoodResponse())
 
         expected = 'cat'
 
@@ -280,13 +497,15 @@ class TestAnimalRepositoryAnimalInfo(unittest.TestCase):
     def test_animal_info_key_not_in_dict(self):
         # creating a class with a method to pretend to be running as the .json function
         class GoodResponse:
+            status_code = 200
+
             def json(self):
                 my_dict = {}
                 return my_dict
 
         self.monkeypatch.setattr(AnimalRepository, 'get_token', lambda _: 'test')
 
-        self.monkeypatch.setattr('requests.get', lambda a, headers: GoodResponse())
+        self.monkeypatch.setattr('requests.Session.get', lambda session, a, headers: GoodResponse())
 
         animal = AnimalRepository()
 
@@ -294,5 +513,154 @@ class TestAnimalRepositoryAnimalInfo(unittest.TestCase):
             animal.animal_info('1234')
 
 
+class TestAnimalRepositoryAnimalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=60).start()
+        self.animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_animal_from_search_needs_no_lookup(self):
+        pets = self.animal.search(Animal('Dog', 'Small', False, False, False, False, False))
+
+        # the animal the user picks from the list is already cached
+        result = self.animal.get_animal(str(pets[0]['id']))
+
+        self.assertEqual(pets[0], result)
+        self.assertEqual(0, self.stub.counts['animal'])
+
+    def test_direct_lookup_cached(self):
+        self.animal.get_animal('7')
+        self.animal.get_animal('7')
+
+        self.assertEqual(1, self.stub.counts['animal'])
+
+    def test_animal_info_many_fetches_only_missing(self):
+        self.animal.get_animal('1')
+
+        # 999 does not exist in the stub, so it is left out
+        result = self.animal.animal_info_many(['1', '2', '3', '999'])
+
+        self.assertEqual(['1', '2', '3'], sorted(result))
+        self.assertEqual(4, self.stub.counts['animal'])
+
+
+class TestAnimalRepositorySearchCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=60, latency=0.1).start()
+        self.animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_same_search_at_once_fetched_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.animal.search(Animal('Dog', 'Small', False, False, False, False, False)))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, self.stub.counts['animals'])
+        self.assertEqual(1, len({tuple(pet['id'] for pet in result) for result in results}))
+        self.assertEqual(9, self.animal.search_cache.single_flight.stats()['coalesced'])
+
+
+class TestAnimalRepositoryQuery(unittest.TestCase):
+
+    # 500 large dogs, 5 pages of 100
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=3000).start()
+        self.animal = AnimalRepository(api_url=self.stub.url, store=LocalStore())
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_ticked_box_filters_upstream(self):
+        result = self.animal.search(Animal('Dog', 'Large', True, False, False, False, False))
+
+        expected = [pet['id'] for pet in self.stub.animals if pet['type'] == 'Dog' and pet['size'] == 'Large'
+                    and pet['environment']['children']]
+        self.assertEqual(expected, [pet['id'] for pet in result])
+
+
+class TestAnimalRepositoryOnEventLoop(unittest.TestCase):
+
+    # the search with its pages fetched on an event loop, against the local fake Petfinder with 10 animals per page
+    def setUp(self):
+        self.stub = PetfinderStub(animal_count=450).start()
+        self.event_loop = EventLoopThread()
+        self.animal = AnimalRepository(api_url=self.stub.url, store=LocalStore(), page_concurrency=4,
+                                       event_loop=self.event_loop)
+        self.animal_data = Animal('Dog', 'Large', False, False, False, False, False)
+        self.monkeypatch = MonkeyPatch()
+        self.monkeypatch.setattr(AnimalRepository, 'search_url',
+                                 lambda repo, data: f'{repo.api_url}/animals?type={data.cat_or_dog}'
+                                                    f'&size={data.select_size}&status=adoptable&limit=10')
+
+    def tearDown(self):
+        self.monkeypatch.undo()
+        self.event_loop.stop()
+        self.stub.stop()
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_same_as_search_on_threads(self):
+        result = self.animal.search(self.animal_data)
+
+        expected = [pet['id'] for pet in self.stub.animals if pet['type'] == 'Dog' and pet['size'] == 'Large']
+        self.assertEqual(expected, [pet['id'] for pet in result])
+        self.assertEqual(8, self.stub.counts['animals'])
+        self.assertIsNotNone(self.event_loop.loop)
+        # cached for the thank you page
+        self.assertEqual(expected[0], self.animal.get_animal(expected[0])['id'])
+        self.assertEqual(0, self.stub.counts.get('animal', 0))
+
+    def test_without_httpx_pages_fetched_on_threads(self):
+        self.monkeypatch.setattr('utils.httpx', None)
+
+        result = self.animal.search(self.animal_data)
+
+        self.assertEqual(75, len(result))
+        self.assertIsNone(self.event_loop.loop)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_failed_page_is_skipped(self):
+        self.stub.fail_pages = {3}
+
+        result = self.animal.search(self.animal_data)
+
+        self.assertEqual(65, len(result))
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_rejected_token_replaced(self):
+        self.animal.get_token()
+        self.stub.revoke_tokens()
+
+        result = self.animal.search(self.animal_data)
+
+        self.assertEqual(75, len(result))
+        self.assertEqual(2, self.stub.counts['token'])
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_searches_at_once_share_the_loop(self):
+        searches = [Animal(animal_type, size, False, False, False, False, False)
+                    for animal_type in ('Dog', 'Cat') for size in ('Small', 'Medium', 'Large')]
+        self.animal.get_token()
+        # 49 calls, all within the same second or two
+        self.animal.rate_limiter.rate = 1000
+        self.stub.latency = 0.2
+        start = time.perf_counter()
+        with ThreadPoolExecutor(len(searches)) as executor:
+            results = list(executor.map(self.animal.search, searches))
+
+        # 6 searches of 3 rounds of 0.2 second calls each, waited for together rather than one after another
+        self.assertEqual(450, sum(len(result) for result in results))
+        self.assertLess(time.perf_counter() - start, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
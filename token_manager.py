@@ -0,0 +1,68 @@
+import threading
+import time
+
+from shared_store import LocalStore
+
+"""Keeping the Petfinder access token until shortly before it expires.
+
+The token endpoint says expires_in: 3600, so there is no need to ask for a new token on every search.
+The token lives in a store (shared between workers when it is a RedisStore), a thread lock makes sure
+only one thread in this worker refreshes it, and a lock key in the store does the same across workers.
+"""
+
+
+class TokenManager:
+    def __init__(self, fetch_token, store=None, refresh_margin=60, key='petfinder:token', lock_timeout=10):
+        # fetch_token() must return (access_token, expires_in)
+        self.fetch_token = fetch_token
+        self.store = store if store is not None else LocalStore()
+        self.refresh_margin = refresh_margin
+        self.key = key
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+
+    """Returning a valid token, fetching a new one only when the stored one is missing or about to expire"""
+
+    def get_token(self):
+        token = self.store.get(self.key)
+        if token is not None:
+            return token
+
+        with self._lock:
+            # another thread may have refreshed the token while we were waiting for the lock
+            token = self.store.get(self.key)
+            if token is not None:
+                return token
+            return self._refresh()
+
+    """The stored token, or None - never fetches, for callers that must not block"""
+
+    def cached_token(self):
+        return self.store.get(self.key)
+
+    """Dropping the stored token after a 401 - only if nobody has replaced it in the meantime"""
+
+    def invalidate(self, token=None):
+        with self._lock:
+            if token is None or self.store.get(self.key) == token:
+                self.store.delete(self.key)
+
+    def _refresh(self):
+        lock_key = self.key + ':lock'
+        deadline = time.monotonic() + self.lock_timeout
+        # another worker is already fetching - wait for its token rather than asking for a second one
+        while not self.store.add(lock_key, 1, ttl=self.lock_timeout):
+            token = self.store.get(self.key)
+            if token is not None:
+                return token
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+
+        try:
+            token, expires_in = self.fetch_token()
+            ttl = max(float(expires_in) - self.refresh_margin, 1)
+            self.store.set(self.key, token, ttl=ttl)
+            return token
+        finally:
+            self.store.delete(lock_key)
@@ -1,49 +1,117 @@
+import asyncio
+import base64
+import contextvars
 import logging
 import os
-from itertools import compress
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from itertools import compress, islice
 from math import ceil
 
 import requests
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, or_, func, text
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 from requests.structures import CaseInsensitiveDict
 
+from http_client import httpx, make_session, make_async_client, request_with_retries
+from json_stream import iter_array_items, aiter_array_items
+from log_config import log_event
+from petfinder_query import AnimalQuery
+from ranking import rank_by_age
+from rate_limit import RateLimiter, RateLimitedError, LOW, NORMAL, LOW_BUDGET_MAX_PAGES
+from records import PetRecord
+from search_cache import SearchCache, SEARCH_CACHE_SIZE
+from shared_store import get_store, store_call
+from token_manager import TokenManager
+
 load_dotenv()
 
 API_KEY = os.getenv('API_KEY')
 API_SECRET = os.getenv('API_SECRET')
+API_URL = os.getenv('PETFINDER_API_URL', 'https://api.petfinder.com/v2')
+# seconds before expiry at which a cached access token is treated as expired
+TOKEN_REFRESH_MARGIN = int(os.getenv('PETFINDER_TOKEN_REFRESH_MARGIN', '60'))
+# how many result pages are fetched at the same time, and the most pages one search may read
+PAGE_CONCURRENCY = int(os.getenv('PETFINDER_PAGE_CONCURRENCY', '8'))
+MAX_PAGES = int(os.getenv('PETFINDER_MAX_PAGES', '50'))
+# animal records kept for the thank you page (filled from search results and single lookups)
+ANIMAL_CACHE_TTL = int(os.getenv('ANIMAL_CACHE_TTL', '900'))
+ANIMAL_CACHE_SIZE = int(os.getenv('ANIMAL_CACHE_SIZE', '20000'))
+# customers shown per page on /admin
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', '50'))
+# bytes read from a streamed page at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+# the choices of the search form, and so the only ones a search key can have
+ANIMAL_TYPES = ('Cat', 'Dog')
+ANIMAL_SIZES = ('Small', 'Medium', 'Large')
+
+logger = logging.getLogger(__name__)
+
+
+"""Running fn on a pool thread with a copy of the caller's context variables, so per-request figures
+(see metrics.py) include the pages fetched on other threads"""
+
+
+def submit_in_context(executor, fn, *args):
+    return executor.submit(contextvars.copy_context().run, fn, *args)
 
-logging.basicConfig(level=logging.INFO, handlers=[logging.FileHandler("app.log"), logging.StreamHandler()],
-                    format='%(name)s - %(levelname)s - %(message)s')
 
 """initialising database"""
 
 db = SQLAlchemy()
 
+# customer ids are numbered by the database in the order customers are added: BIGINT AUTO_INCREMENT on MySQL,
+# INTEGER PRIMARY KEY (the rowid) on SQLite. Small and increasing, so new rows go at the end of the primary
+# key, and every secondary index (which holds the key too) stays small. Databases made with the old
+# VARCHAR ids are moved over by migrate_keys.py
+CUSTOMER_KEY = db.BigInteger().with_variant(db.Integer(), 'sqlite')
+# emails compare without regard to case, as they do under MySQL's default collation - on SQLite too, so the
+# unique email index and lookups by email behave the same on both
+EMAIL = db.String(255).with_variant(db.String(255, collation='NOCASE'), 'sqlite')
+
 
 class Customers(db.Model):
     # nothing to set therefore no __init__
-    # id of the animal associated with the customer
-    id = db.Column(db.String(255), primary_key=True)
+    id = db.Column(CUSTOMER_KEY, primary_key=True, autoincrement=True)
     firstname = db.Column(db.String(255))
     lastname = db.Column(db.String(255))
     phone = db.Column(db.String(25))
-    email = db.Column(db.String(255))
+    email = db.Column(EMAIL)
     address = db.Column(db.String(255))
     city_name = db.Column(db.String(255))
     state = db.Column(db.String(255))
     zipcode = db.Column(db.String(255))
+    created_at = db.Column('CreatedAt', db.DateTime, server_default=func.now())
+
+    # same indexes as adoption_db.sql - newest first listing on /admin, name/email prefix search, and one
+    # customer per email
+    __table_args__ = (
+        db.Index('customers_created_at', 'CreatedAt', 'id'),
+        db.Index('customers_email', 'email', unique=True),
+        db.Index('customers_lastname', 'lastname'),
+        db.Index('customers_firstname', 'firstname'),
+    )
 
 
 class CustomerAdoptions(db.Model):
     pet_id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.String(255), db.ForeignKey("customers.id"))
+    customer_id = db.Column(CUSTOMER_KEY, db.ForeignKey("customers.id"))
+    created_at = db.Column('CreatedAt', db.DateTime, server_default=func.now())
+
+    # same index as adoption_db.sql - the recent adoptions read by adopted.py
+    __table_args__ = (
+        db.Index('customer_adoptions_created_at', 'CreatedAt'),
+    )
 
 
 """class to hold customer information"""
 
 
 class Customer:
+    # customer_id is None for a customer the database has not numbered yet
     def __init__(self, customer_id, firstname, lastname, phone, email, address, city_name, state, zipcode):
         self.id = customer_id
         self.firstname = firstname
@@ -56,6 +124,19 @@ class Customer:
         self.zipcode = zipcode
 
 
+class AlreadyAdoptedError(ValueError):
+    # raised by customer_adopt when the pet is already in customer_adoptions
+    pass
+
+
+class CustomerPage:
+    # one page of the /admin customer list, next_cursor is None on the last page
+    def __init__(self, customers, next_cursor, total_estimate):
+        self.customers = customers
+        self.next_cursor = next_cursor
+        self.total_estimate = total_estimate
+
+
 class CustomerAdoption:
     def __init__(self, pet_id, customer_id):
         self.pet_id = pet_id
@@ -73,6 +154,25 @@ class Animal:
         self.select_house_trained = select_house_trained
         self.select_special_needs = select_special_needs
 
+    """Key for caching the search - the same choices always give the same key (192 possible)"""
+
+    def cache_key(self):
+        flags = ''.join('1' if flag else '0' for flag in (
+            self.select_good_with_children, self.select_good_with_dogs, self.select_good_with_cats,
+            self.select_house_trained, self.select_special_needs))
+        return f'search:{str(self.cat_or_dog).lower()}:{str(self.select_size).lower()}:{flags}'
+
+    """Rebuilding the search choices from a cache key, used by the result page links. Only the keys the search
+    form can make are accepted, so a made up key cannot start a new Petfinder search"""
+
+    @classmethod
+    def from_cache_key(cls, key):
+        prefix, cat_or_dog, select_size, flags = key.split(':')
+        if (prefix != 'search' or cat_or_dog.capitalize() not in ANIMAL_TYPES
+                or select_size.capitalize() not in ANIMAL_SIZES or len(flags) != 5 or set(flags) - {'0', '1'}):
+            raise ValueError(f'Not a search key: {key}')
+        return cls(cat_or_dog.capitalize(), select_size.capitalize(), *(flag == '1' for flag in flags))
+
 
 """class for working with customer information"""
 
@@ -88,108 +188,366 @@ class CustomerRepository:
         customer = Customers.query.filter_by().all()
         return [customer, error]
 
-    """Adding customer to database"""
+    """One page of customers, newest first. The cursor is where the previous page stopped, so each page is a
+    short index range scan however deep it is. search matches the start of the name or email"""
 
     @staticmethod
-    def customer_adopt(customer_data, pet_id):
-        new_adoption = CustomerAdoptions(pet_id=pet_id, customer_id=customer_data.id)
-
-        customer = Customers.query.filter_by(email=customer_data.email).first()
-        if customer is None:
-            firstname = customer_data.firstname
-            lastname = customer_data.lastname
-            phone = customer_data.phone
-            email = customer_data.email
-            address = customer_data.address
-            city_name = customer_data.city_name
-            state = customer_data.state
-            zipcode = customer_data.zipcode
-
-            new_customer = Customers(id=customer_data.id, firstname=firstname, lastname=lastname, phone=phone,
-                                     email=email, address=address, city_name=city_name, state=state, zipcode=zipcode)
-            db.session.add(new_customer)
+    def get_customers_page(cursor=None, search=None, per_page=ADMIN_PAGE_SIZE):
+        # only the columns customer_list.html shows
+        query = db.session.query(Customers.id, Customers.firstname, Customers.lastname, Customers.email,
+                                 Customers.phone, Customers.created_at)
+        if search:
+            query = query.filter(or_(prefix_match(Customers.email, search), prefix_match(Customers.lastname, search),
+                                     prefix_match(Customers.firstname, search)))
+            total_estimate = query.with_entities(func.count()).scalar()
         else:
-            new_adoption.customer_id = customer.id
+            total_estimate = CustomerRepository.estimate_customers()
+        if cursor:
+            created_at, customer_id = decode_cursor(cursor)
+            query = query.filter(or_(Customers.created_at < created_at,
+                                     and_(Customers.created_at == created_at, Customers.id < customer_id)))
+        rows = query.order_by(Customers.created_at.desc(), Customers.id.desc()).limit(per_page + 1).all()
 
-        db.session.add(new_adoption)
-        db.session.commit()
-        return new_adoption.customer_id
+        # one extra row tells whether there is another page
+        next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+        return CustomerPage(rows[:per_page], next_cursor, total_estimate)
 
+    """Number of customers - from the database's own bookkeeping when it has some, rather than counting rows"""
 
-"""class for working with animal information"""
+    @staticmethod
+    def estimate_customers():
+        dialect = db.session.get_bind().dialect.name
+        rows = None
+        if dialect == 'mysql':
+            rows = db.session.execute(text("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                                           "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'customers'")).scalar()
+        elif dialect == 'sqlite':
+            # rows are never deleted, so the highest rowid is the number of customers
+            rows = db.session.execute(text("SELECT MAX(rowid) FROM customers")).scalar() or 0
+        if rows is None:
+            rows = db.session.query(func.count(Customers.id)).scalar()
+        return rows
+
+    """Adding customer to database - the customer (if new) and the adoption are written in one transaction.
+    The unique email index settles two requests adding the same new customer at once, and a pet that is
+    already adopted gives AlreadyAdoptedError rather than a database error"""
 
+    @staticmethod
+    def customer_adopt(customer_data, pet_id):
+        # a second attempt is only needed when another request added the same customer in the meantime
+        for attempt in range(2):
+            try:
+                # a single row lookup on the unique email index
+                customer = Customers.query.filter_by(email=customer_data.email).first()
+                if customer is None:
+                    firstname = customer_data.firstname
+                    lastname = customer_data.lastname
+                    phone = customer_data.phone
+                    email = customer_data.email
+                    address = customer_data.address
+                    city_name = customer_data.city_name
+                    state = customer_data.state
+                    zipcode = customer_data.zipcode
 
-class AnimalRepository:
-    # nothing to set therefore no __init__
+                    customer = Customers(firstname=firstname, lastname=lastname, phone=phone, email=email,
+                                         address=address, city_name=city_name, state=state, zipcode=zipcode)
+                    db.session.add(customer)
+                    # the insert gives the customer their id, still inside the transaction
+                    db.session.flush()
 
-    """Requesting access token"""
+                new_adoption = CustomerAdoptions(pet_id=pet_id, customer_id=customer.id)
+                db.session.add(new_adoption)
+                db.session.commit()
+                return new_adoption.customer_id
+            except IntegrityError:
+                db.session.rollback()
+                if db.session.get(CustomerAdoptions, pet_id) is not None:
+                    raise AlreadyAdoptedError(f'Pet {pet_id} has already been adopted')
+                if attempt == 1:
+                    raise
 
-    @staticmethod
-    def get_token():
 
-        url = "https://api.petfinder.com/v2/oauth2/token"
+"""Helpers for the /admin listing"""
+
+
+def prefix_match(column, prefix):
+    # a constant pattern ending in % is an index range on MySQL, and compares like the column's collation
+    # does (case and accents ignored) - a range worked out here would not
+    escaped = prefix.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    return column.like(escaped + '%', escape='/')
+
+
+def encode_cursor(row):
+    raw = f'{row.created_at.isoformat()}|{row.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, customer_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    return datetime.fromisoformat(created_at), int(customer_id)
+
+
+class PartialSearch(list):
+    # search results with pages missing (refused by the rate limiter or failed) - shown, but only cached
+    # for a short while so the next search fetches them again
+    partial = True
+
+
+"""class for working with animal information"""
+
+
+class AnimalRepository:
+    def __init__(self, api_url=API_URL, store=None, token_manager=None, page_concurrency=PAGE_CONCURRENCY,
+                 max_pages=MAX_PAGES, session=None, search_cache=None, catalogue=None, animal_cache=None,
+                 rate_limiter=None, event_loop=None):
+        self.api_url = api_url
+        # store shared by the threads (and, with redis, the workers) for the token and locks
+        self.store = store or get_store()
+        # one keep-alive session for every call, big enough for all the pages fetched at once
+        self.session = session or make_session(pool_size=max(page_concurrency, 1) + 2)
+        self.page_concurrency = page_concurrency
+        self.max_pages = max_pages
+        # every Petfinder call goes through the limiter, which shares its counts through the store
+        self.rate_limiter = rate_limiter or RateLimiter(self.store)
+        # request_token is looked up on every call, so an instrumented one (see metrics.py) is the one used
+        self.token_manager = token_manager or TokenManager(lambda: self.request_token(), store=self.store,
+                                                           refresh_margin=TOKEN_REFRESH_MARGIN)
+        self.search_cache = search_cache or SearchCache(get_store(max_entries=SEARCH_CACHE_SIZE),
+                                                        lock_store=self.store)
+        # local index of the whole catalogue, kept up to date by a CatalogueWarmer when one is running
+        self.catalogue = catalogue
+        self.animal_cache = animal_cache or get_store(max_entries=ANIMAL_CACHE_SIZE)
+        # an EventLoopThread (see event_loop.py) - with httpx installed the pages of a search are fetched on it
+        self.event_loop = event_loop
+        # httpx client for the async methods, made on first use by the event loop it belongs to
+        self._async_client = None
+        self._async_loop = None
+
+    """Requesting access token - cached by the token manager until shortly before it expires"""
+
+    def get_token(self):
+        return self.token_manager.get_token()
+
+    """Asking Petfinder for a new access token, returns the token and how long it lasts"""
+
+    def request_token(self):
+
+        url = f"{self.api_url}/oauth2/token"
 
         headers = CaseInsensitiveDict()
         headers["Content-Type"] = "application/x-www-form-urlencoded"
         data = f"grant_type=client_credentials&client_id={API_KEY}&client_secret={API_SECRET}"
 
-        resp = requests.post(url, headers=headers, data=data)
+        self.rate_limiter.acquire()
+        resp = self.session.post(url, headers=headers, data=data)
+        self.check_rate_limit(resp)
 
         # tracking response code - if not 200 there is a problem
-        logging.info(f'Response code {resp}')
         if resp.status_code != 200:
+            log_event(logger, logging.WARNING, 'token_request_failed', status=resp.status_code)
             raise ValueError(f'Bad connection, response not 200, it is {resp.status_code}')
         response = resp.json()
-        logging.info(f'resp.json returns dictionary {response} inc. access token')
         token = response['access_token']
-        logging.info(f'access token successfully generated')
-        return token
+        # never the token itself
+        log_event(logger, logging.INFO, 'token_issued', expires_in=response.get('expires_in', 3600))
+        return token, response.get('expires_in', 3600)
+
+    """GET request with the access token - a 401 means the token went stale, so retry once with a fresh one.
+    With stream=True the body is left unread, for reading with response.iter_content()"""
+
+    def authorised_get(self, url, stream=False, priority=NORMAL):
+        options = {'stream': True} if stream else {}
+        auth_token = self.get_token()
+        self.rate_limiter.acquire(priority)
+        response = self.session.get(url, headers={"Authorization": f"Bearer {auth_token}"}, **options)
+        if response.status_code == 401:
+            log_event(logger, logging.INFO, 'token_rejected')
+            response.close()
+            self.token_manager.invalidate(auth_token)
+            auth_token = self.get_token()
+            self.rate_limiter.acquire(priority)
+            response = self.session.get(url, headers={"Authorization": f"Bearer {auth_token}"}, **options)
+        self.check_rate_limit(response)
+        return response
+
+    """Passing the response's rate-limit headers to the limiter - a 429 becomes RateLimitedError"""
+
+    def check_rate_limit(self, response):
+        headers = getattr(response, 'headers', None) or {}
+        self.rate_limiter.update(response.status_code, headers)
+        if response.status_code == 429:
+            # an httpx response is closed by its async caller, its stream refuses a blocking close
+            if isinstance(response, requests.Response):
+                response.close()
+            raise RateLimitedError('Petfinder answered 429 Too Many Requests', retry_after=headers.get('Retry-After'))
 
     """Connecting to API and retrieving data based on user choice from form"""
 
-    def get_animal_data(self, animal_data):
+    def get_animal_data(self, animal_data, project=None):
+        return self.get_all_pages(self.search_url(animal_data), project=project)
 
-        logging.info(f"User specified choices were {animal_data.cat_or_dog}, "
-                     f"size = {animal_data.select_size}, "
-                     f"good with children = {animal_data.select_good_with_children}, "
-                     f"good with dogs = {animal_data.select_good_with_dogs}, "
-                     f"good with cats = {animal_data.select_good_with_cats}, "
-                     f"house trained = {animal_data.select_house_trained}, "
-                     f"special needs = {animal_data.select_special_needs}")
+    """Same search as get_animal_data, but yielding animals one at a time while the pages are still arriving"""
 
-        all_pets = []
+    def iter_animal_data(self, animal_data, project=None, skipped=None):
+        return self.iter_all_pages(self.search_url(animal_data), project=project, skipped=skipped)
 
-        url = f"https://api.petfinder.com/v2/animals?type={animal_data.cat_or_dog}&size={animal_data.select_size}" \
-              f"&good_with_children={str(animal_data.select_good_with_children).lower()}" \
-              f"&good_with_dogs{str(animal_data.select_good_with_dogs).lower()}" \
-              f"&good_with_cats={str(animal_data.select_good_with_cats).lower()}" \
-              f"&house_trained={str(animal_data.select_house_trained).lower()}" \
-              f"&special_needs={str(animal_data.select_special_needs).lower()}&status=adoptable&limit=100"
+    """Building the search url from the user's choices"""
 
-        auth_token = self.get_token()
-        response = requests.get(url, headers={"Authorization": f"Bearer {auth_token}"})
+    def search_url(self, animal_data):
+        query = AnimalQuery.from_animal(animal_data)
+        log_event(logger, logging.INFO, 'search', query=query.query_string())
+        return query.url(self.api_url)
+
+    """Reading every page of a search url, the first page tells how many pages there are.
+    project, when given, is applied to each animal as soon as its page is parsed (e.g. PetRecord.from_api)"""
+
+    def get_all_pages(self, url, max_pages=None, project=None):
+        max_pages = max_pages or self.max_pages
+        all_pets = []
+
+        response = self.authorised_get(url)
 
-        logging.info(f'Response code {response}')
+        log_event(logger, logging.INFO, 'search_first_page', status=response.status_code)
         if response.status_code != 200:
             raise ValueError(f'Bad connection, response not 200, response code is {response.status_code}')
         json_response = response.json()
-        # total amount of pets divided by maximum amount of pets on each page to give the amount of pages to go through.
-        # to make sure gets all data from api
-        page_count = ceil(json_response['pagination']['total_count'] / json_response['pagination']['count_per_page'])
+        page_count = self.count_pages(json_response['pagination'], max_pages)
         # each page gives list of dictionaries
-        all_pets.extend(json_response['animals'])
-
-        # to go through each of the pages.
-        next_page = 1
-        while next_page < page_count:
-            # do the same thing
-            response = requests.get(f"{url}&page={next_page + 1}", headers={"Authorization": f"Bearer {auth_token}"})
-            json_page = response.json()
-            all_pets.extend(json_page['animals'])
-            # increment page each time we go through
-            next_page += 1
+        all_pets.extend(self.project_page(json_response['animals'], project))
+
+        # the remaining pages are fetched at the same time, map() hands them back in page order
+        if page_count > 1:
+            with ThreadPoolExecutor(max_workers=min(self.page_concurrency, page_count - 1)) as executor:
+                pages = [submit_in_context(executor, self.get_page, url, page, project)
+                         for page in range(2, page_count + 1)]
+                for animals in pages:
+                    all_pets.extend(animals.result())
         return all_pets
 
+    """Streaming version of get_all_pages - animals are parsed, projected and yielded one at a time, so only
+    about one page is held in memory. Later pages are fetched a few at a time and still come out in order.
+    The numbers of pages that could not be read are added to `skipped` (see get_page), and the first page's
+    other values (the pagination) go into `rest`"""
+
+    def iter_all_pages(self, url, max_pages=None, project=None, skipped=None, rest=None):
+        max_pages = max_pages or self.max_pages
+        rest = rest if rest is not None else {}
+        # the pagination comes after the animals in the page, so it is known once page 1 has been read
+        yield from self.stream_page(url, project, rest, first_page=True)
+
+        page_count = self.count_pages(rest['pagination'], max_pages)
+        if page_count < 2:
+            return
+
+        pages = iter(range(2, page_count + 1))
+        with ThreadPoolExecutor(max_workers=min(self.page_concurrency, page_count - 1)) as executor:
+            pending = deque(submit_in_context(executor, self.get_page, url, page, project, skipped)
+                            for page in islice(pages, self.page_concurrency))
+            while pending:
+                animals = pending.popleft().result()
+                next_page = next(pages, None)
+                if next_page is not None:
+                    pending.append(submit_in_context(executor, self.get_page, url, next_page, project, skipped))
+                yield from animals
+
+    """Number of pages to read, from the pagination of the first page - fewer when the day's budget runs low"""
+
+    def count_pages(self, pagination, max_pages):
+        # total amount of pets divided by maximum amount of pets on each page to give the amount of pages to go through.
+        # to make sure gets all data from api
+        page_count = ceil(pagination['total_count'] / pagination['count_per_page'])
+        # short of today's Petfinder budget, a search gets its first pages rather than using up the rest
+        if self.rate_limiter.budget_low():
+            max_pages = min(max_pages, LOW_BUDGET_MAX_PAGES)
+        if page_count > max_pages:
+            log_event(logger, logging.WARNING, 'search_pages_capped', pages=page_count, max_pages=max_pages)
+            page_count = max_pages
+        return page_count
+
+    """Reading the animals of one page straight from the response body as it downloads"""
+
+    def stream_page(self, url, project=None, rest=None, first_page=False, priority=NORMAL):
+        response = self.authorised_get(url, stream=True, priority=priority)
+        try:
+            if first_page:
+                log_event(logger, logging.INFO, 'search_first_page', status=response.status_code)
+            if response.status_code != 200:
+                raise ValueError(f'Bad connection, response not 200, response code is {response.status_code}')
+            for animal in iter_array_items(response.iter_content(STREAM_CHUNK_SIZE), 'animals', rest):
+                yield animal if project is None else project(animal)
+        finally:
+            response.close()
+
+    """Search results for the form choices, from the cache when the same search was made recently"""
+
+    def search(self, animal_data):
+        # answered from memory when the background crawler keeps a fresh copy of the catalogue
+        if self.catalogue is not None and self.catalogue.is_fresh():
+            return self.catalogue.query(animal_data)
+        try:
+            return self.search_cache.get(animal_data.cache_key(), lambda: self.load_search(animal_data))
+        except RateLimitedError as error:
+            return self.degraded_search(animal_data, error)
+
+    """Fetching a search from Petfinder - on the event loop, which fetches the pages of every search together
+    over one connection pool, when there is one and httpx is installed. Otherwise the pages are streamed
+    on page_concurrency threads. Either way this thread waits for them and the caching is done here.
+    A search missing some of its pages comes back as a PartialSearch"""
+
+    def load_search(self, animal_data):
+        skipped = []
+        if self.event_loop is not None and httpx is not None:
+            animals = self.event_loop.run(self.get_all_pages_async(self.search_url(animal_data),
+                                                                   project=PetRecord.from_api, skipped=skipped))
+        else:
+            animals = list(self.iter_animal_data(animal_data, project=PetRecord.from_api, skipped=skipped))
+        if skipped:
+            log_event(logger, logging.WARNING, 'search_partial', pages_skipped=len(skipped))
+            animals = PartialSearch(animals)
+        return self.remember_animals(animals)
+
+    """Out of Petfinder budget with nothing cached - an out of date catalogue index is better than nothing"""
+
+    def degraded_search(self, animal_data, error):
+        if self.catalogue is not None and self.catalogue.updated_at is not None:
+            log_event(logger, logging.WARNING, 'search_degraded', reason='rate_limited', source='stale_catalogue')
+            return self.catalogue.query(animal_data)
+        raise error
+
+    """Every adoptable animal of one type, newest first - only those published after `after` when given"""
+
+    def get_catalogue(self, animal_type, after=None, max_pages=None, skipped=None, rest=None):
+        url = AnimalQuery(type=animal_type, status='adoptable', sort='recent', after=after, limit=100).url(self.api_url)
+        return self.iter_all_pages(url, max_pages=max_pages, project=PetRecord.from_api, skipped=skipped, rest=rest)
+
+    """Fetching one later page of a search - a failed page is logged, added to `skipped` and left out rather
+    than failing the search. A page refused by the rate limiter fails it when there is no `skipped` to tell
+    the caller that the result is incomplete"""
+
+    def get_page(self, url, page, project=None, skipped=None):
+        try:
+            return list(self.stream_page(f"{url}&page={page}", project, priority=self.page_priority(page)))
+        except (requests.RequestException, ValueError, KeyError) as error:
+            return self.skip_page(page, error, skipped)
+
+    @staticmethod
+    def skip_page(page, error, skipped):
+        if isinstance(error, RateLimitedError) and skipped is None:
+            raise error
+        log_event(logger, logging.WARNING, 'search_page_skipped', page=page, error=error)
+        if skipped is not None:
+            skipped.append(page)
+        return []
+
+    # pages past the ones a search gets when the budget is low are the first calls to drop when the limits are tight
+    @staticmethod
+    def page_priority(page):
+        return NORMAL if page <= LOW_BUDGET_MAX_PAGES else LOW
+
+    @staticmethod
+    def project_page(animals, project):
+        return animals if project is None else [project(animal) for animal in animals]
+
     """Returning only those animals which are older"""
 
     def age_check(self, animals):
@@ -199,21 +557,160 @@ class AnimalRepository:
         senior_animals = compress(animals, selector)
         output = list(senior_animals)
         if not output:
-            logging.info("No senior pets in user selection")
+            logger.info('No senior pets in user selection')
         return output
 
+    """Ordering animals senior first (then by the rest of the age priority) in a single pass"""
+
+    def rank_animals(self, animals, lazy=False):
+        return rank_by_age(animals, lazy=lazy)
+
+    """Picking the one photo url a card shows (or None) - done here rather than looping over photos in Jinja"""
+
+    @staticmethod
+    def photo_url(animal, size='medium'):
+        if isinstance(animal, PetRecord):
+            return animal.photo_url(size)
+        photos = animal.get('photos') or []
+        if not photos:
+            return None
+        return photos[0].get(size) or next(iter(photos[0].values()), None)
+
     """Generator function to display one animal at a time - to be reviewed"""
 
     def animal_return(self, animal_list):
         for animal in animal_list:
             yield animal
 
+    """Keeping search results in the animal cache, so picking one of them needs no Petfinder call"""
+
+    def remember_animals(self, animals):
+        # in one go - with redis that is one round trip for the whole search
+        self.animal_cache.set_many({f'animal:{animal["id"]}': animal for animal in animals}, ttl=ANIMAL_CACHE_TTL)
+        return animals
+
+    """One animal as a PetRecord - from the catalogue index or the animal cache when possible"""
+
+    def get_animal(self, pet_id):
+        animal = self.cached_animal(pet_id)
+        if animal is None:
+            animal = PetRecord.from_api(self.animal_info(pet_id))
+            self.remember_animals([animal])
+        return animal
+
+    """Several animals at once, as a dict of id -> PetRecord. Only the ones not already cached are fetched,
+    at the same time. Animals that could not be fetched are left out"""
+
+    def animal_info_many(self, pet_ids):
+        found = {}
+        missing = []
+        for pet_id in pet_ids:
+            animal = self.cached_animal(pet_id)
+            if animal is None:
+                missing.append(pet_id)
+            else:
+                found[pet_id] = animal
+
+        def fetch(pet_id):
+            try:
+                return PetRecord.from_api(self.animal_info(pet_id))
+            except (requests.RequestException, ValueError, KeyError) as error:
+                log_event(logger, logging.WARNING, 'animal_fetch_failed', pet_id=pet_id, error=error)
+                return None
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.page_concurrency, len(missing))) as executor:
+                fetches = [submit_in_context(executor, fetch, pet_id) for pet_id in missing]
+                for pet_id, animal in zip(missing, (future.result() for future in fetches)):
+                    if animal is not None:
+                        found[pet_id] = animal
+                        self.remember_animals([animal])
+        return found
+
+    def cached_animal(self, pet_id):
+        if self.catalogue is not None and self.catalogue.is_fresh():
+            animal = self.catalogue.animals.get(int(pet_id)) if str(pet_id).isdigit() else None
+            if animal is not None:
+                return animal
+        return self.animal_cache.get(f'animal:{pet_id}')
+
     """Function to get individual animal info"""
     def animal_info(self, pet_id):
-        auth_token = self.get_token()
-        response = requests.get(f'https://api.petfinder.com/v2/animals/{pet_id}',
-                                headers={"Authorization": f"Bearer {auth_token}"})
+        response = self.authorised_get(f'{self.api_url}/animals/{pet_id}')
         animal_response = response.json()
         return animal_response['animal']
 
+    """The calls under load_search for the event loop. A page waiting on Petfinder here holds no thread of its
+    own, only its place on the loop. Calls to a redis store block, so they go to a thread (see store_call)"""
+
+    """The httpx client of the running event loop - one per loop, shared by all its requests"""
+
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = make_async_client()
+            self._async_loop = loop
+        return self._async_client
+
+    """Same as authorised_get - with stream=True the caller reads the body and closes the response"""
+
+    async def authorised_get_async(self, url, stream=False, priority=NORMAL):
+        client = self.async_client()
+        # the token is nearly always cached, a refresh is a blocking call so it goes to a thread
+        auth_token = (await store_call(self.token_manager.store, self.token_manager.cached_token)
+                      or await asyncio.to_thread(self.get_token))
+        await self.rate_limiter.acquire_async(priority)
+        response = await request_with_retries(client, 'GET', url, stream=stream,
+                                              headers={"Authorization": f"Bearer {auth_token}"})
+        if response.status_code == 401:
+            log_event(logger, logging.INFO, 'token_rejected')
+            await response.aclose()
+            await store_call(self.token_manager.store, self.token_manager.invalidate, auth_token)
+            auth_token = await asyncio.to_thread(self.get_token)
+            await self.rate_limiter.acquire_async(priority)
+            response = await request_with_retries(client, 'GET', url, stream=stream,
+                                                  headers={"Authorization": f"Bearer {auth_token}"})
+        try:
+            await store_call(self.rate_limiter.store, self.check_rate_limit, response)
+        except RateLimitedError:
+            await response.aclose()
+            raise
+        return response
+
+    async def get_all_pages_async(self, url, max_pages=None, project=None, skipped=None):
+        max_pages = max_pages or self.max_pages
+        rest = {}
+        # the pagination comes after the animals in the page, so it is known once page 1 has been read
+        all_pets = await self.stream_page_async(url, project, rest, first_page=True)
+        page_count = await store_call(self.rate_limiter.store, self.count_pages, rest['pagination'], max_pages)
+
+        # the remaining pages, page_concurrency at a time, gather() hands them back in page order
+        if page_count > 1:
+            limit = asyncio.Semaphore(self.page_concurrency)
+            pages = await asyncio.gather(*(self.get_page_async(url, page, project, limit, skipped)
+                                           for page in range(2, page_count + 1)))
+            for animals in pages:
+                all_pets.extend(animals)
+        return all_pets
 
+    """Same as stream_page, the animals of one page parsed as its body arrives - handed back as a list"""
+
+    async def stream_page_async(self, url, project=None, rest=None, first_page=False, priority=NORMAL):
+        response = await self.authorised_get_async(url, stream=True, priority=priority)
+        try:
+            if first_page:
+                log_event(logger, logging.INFO, 'search_first_page', status=response.status_code)
+            if response.status_code != 200:
+                raise ValueError(f'Bad connection, response not 200, response code is {response.status_code}')
+            return [animal if project is None else project(animal) async for animal in
+                    aiter_array_items(response.aiter_bytes(STREAM_CHUNK_SIZE), 'animals', rest)]
+        finally:
+            await response.aclose()
+
+    async def get_page_async(self, url, page, project=None, limit=None, skipped=None):
+        try:
+            # the whole page is read under the limit, it is the download that is being limited
+            async with limit or asyncio.Semaphore():
+                return await self.stream_page_async(f"{url}&page={page}", project, priority=self.page_priority(page))
+        except (httpx.HTTPError, ValueError, KeyError) as error:
+            return self.skip_page(page, error, skipped)
@@ -0,0 +1,9 @@
+from app import create_app
+
+"""Entry point for a production WSGI server, e.g.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    uwsgi --http :8000 --module wsgi:app --processes 4 --threads 4 --lazy-apps
+"""
+
+app = create_app()